@@ -5,9 +5,21 @@ This package provides a complete LISPY interpreter implementation including
 tokenization, parsing, evaluation, and REPL functionality.
 """
 
-from .evaluator import eval_lisp
-from .parser import parse
-from .tokenizer import Token, TokenKind, tokenize
+from time import perf_counter as _perf_counter
+
+# --startup-stats で表示する、パッケージの読み込み開始・終了時刻
+_IMPORT_STARTED = _perf_counter()
+
+from .evaluator import eval_lisp  # noqa: E402
+from .interpreter import Interpreter  # noqa: E402
+from .limits import Limits, ResourceExhausted  # noqa: E402
+from .metrics import Metrics  # noqa: E402
+from .packed import PackedAST, pack  # noqa: E402
+from .parser import iter_parse, parse, parse_packed  # noqa: E402
+from .symbols import StringLiteral, Symbol  # noqa: E402
+from .tokenizer import Token, TokenKind, iter_tokens, tokenize  # noqa: E402
+
+_IMPORT_FINISHED = _perf_counter()
 
 __version__ = "0.1.0"
 
@@ -15,12 +27,33 @@ __all__ = [
     'Token',
     'TokenKind',
     'tokenize',
+    'iter_tokens',
     'parse',
+    'iter_parse',
+    'parse_packed',
+    'PackedAST',
+    'pack',
+    'Symbol',
+    'StringLiteral',
     'eval_lisp',
+    'compile_lisp',
+    'Interpreter',
+    'Limits',
+    'ResourceExhausted',
+    'Metrics',
     'main',
 ]
 
 
+def __getattr__(name):
+    # The closure compiler is only imported when it is actually used, which
+    # keeps it out of the startup path of the tree engine.
+    if name == 'compile_lisp':
+        from .compiler import compile_lisp
+        return compile_lisp
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def main():
     """Main entry point for the CLI."""
     from .lispy import main as lispy_main
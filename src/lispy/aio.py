@@ -0,0 +1,363 @@
+"""
+LISPインタープリターの非同期評価モジュール
+
+asyncio のイベントループ上でS式を評価する。一定の評価ステップごとにループへ
+制御を返すため、長い評価でも同じループの他のタスクを止めない。組み込み関数は
+コルーチン関数でもよく（sleep など）、(parallel e1 e2 ...) で独立した式を
+並行に評価できる。特殊形式の検査は evaluator の関数を同期の評価器と共有する。
+"""
+
+import asyncio
+import inspect
+from typing import Any, Callable, Optional
+
+from . import builtins, evaluator
+from .builtins import (FAST_BINARY, GLOBALS, LazySeq, builtin_filter,
+                       builtin_map, is_array)
+from .evaluator import (Environment, Procedure, check_form,
+                        create_global_env, define_variable, expand_defmemo,
+                        let_bindings, make_procedure)
+from .packed import PackedNode
+from .parser import SourceMap, parse
+from .symbols import (DEFINE, DEFMEMO, FOR, IF, LAMBDA, LET, PARALLEL,
+                      StringLiteral, Symbol, is_string_literal)
+from .tokenizer import tokenize
+
+# 何ステップ（式の評価）ごとにイベントループへ制御を返すか
+DEFAULT_YIELD_STEPS = 1000
+
+
+class AsyncBuiltin:
+    """コルーチン関数の組み込み関数
+
+    非同期評価器は await して呼び出す。同期的な評価（memoize した関数の中など）
+    から呼ばれた場合は待てないのでエラーにする。
+    """
+
+    __slots__ = ('func', 'name')
+
+    def __init__(self, func: Callable, name: Optional[str] = None):
+        self.func = func
+        self.name = name or func.__name__
+
+    def __call__(self, *args):
+        raise TypeError(f"非同期の組み込み関数 {self.name} は同期的な評価の中では呼べません")
+
+    def __repr__(self):
+        return f"<async builtin {self.name}>"
+
+
+class _Clock:
+    """イベントループに制御を返すまでの残りステップ数"""
+
+    __slots__ = ('remaining', 'every')
+
+    def __init__(self, every: int):
+        self.remaining = every
+        self.every = every
+
+
+async def builtin_sleep(seconds):
+    """指定した秒数だけ（イベントループを止めずに）待つ"""
+    await asyncio.sleep(seconds)
+
+
+def _sync_only(func: Any, lst: Any) -> bool:
+    """map/filter を同期の組み込み関数と同じ処理で評価するか"""
+    # 配列の一括評価と並列 map はワーカーや NumPy で同期的に呼び出す
+    return (not _needs_await(func) or is_array(lst)
+            or builtins.PARALLEL_MAP is not None)
+
+
+async def _async_map(clock: _Clock, func, lst):
+    if _sync_only(func, lst):
+        return builtin_map(func, lst)
+    results = [await _apply(func, [item], clock) for item in lst]
+    return _like_sync(results, lst)
+
+
+async def _async_filter(clock: _Clock, func, lst):
+    if _sync_only(func, lst):
+        return builtin_filter(func, lst)
+    results = [item for item in lst if await _apply(func, [item], clock)]
+    return _like_sync(results, lst)
+
+
+def _like_sync(results: list, lst: Any) -> Any:
+    """同期の map/filter と同じ種類の値にする
+
+    リストからはリスト、それ以外（range など）からは遅延シーケンスを返す。
+    要素は await して計算済みなので、呼び出しの時点で関数が評価される。
+    """
+    if isinstance(lst, (list, tuple)):
+        return results
+    return LazySeq(results.__iter__, len(results))
+
+
+async def _async_reduce(clock: _Clock, func, initial, lst):
+    result = initial
+    for item in lst:
+        result = await _apply(func, [result, item], clock)
+    return result
+
+
+# 非同期評価のグローバル環境で置き換える組み込み関数
+ASYNC_BUILTINS = {
+    'sleep': AsyncBuiltin(builtin_sleep, 'sleep'),
+}
+
+# 関数を受け取る組み込み関数。ユーザー定義関数を渡されたときは評価中の
+# クロックを使って非同期に呼び出す
+_HIGHER_ORDER = {
+    'map': _async_map,
+    'filter': _async_filter,
+    'reduce': _async_reduce,
+}
+
+
+def _needs_await(func: Any) -> bool:
+    return type(func) is Procedure or type(func) is AsyncBuiltin
+
+
+class _HigherOrder:
+    """評価中のクロックを受け取る組み込み関数（map など）"""
+
+    __slots__ = ('func', 'name', 'sync')
+
+    def __init__(self, func: Callable, name: str):
+        self.func = func
+        self.name = name
+        # 同期的な評価から呼ばれたときに使う元の組み込み関数
+        self.sync = GLOBALS[name]
+
+    def __call__(self, *args):
+        return self.sync(*args)
+
+    def __repr__(self):
+        return f"<async builtin {self.name}>"
+
+
+def create_async_env() -> Environment:
+    """非同期評価用のグローバル環境を作成"""
+    env = create_global_env()
+    for name, value in ASYNC_BUILTINS.items():
+        env.define(Symbol(name), value)
+    for name, func in _HIGHER_ORDER.items():
+        env.define(Symbol(name), _HigherOrder(func, name))
+    return env
+
+
+async def eval_async(expr: Any, env: Optional[Environment] = None,
+                     yield_steps: int = DEFAULT_YIELD_STEPS) -> Any:
+    """S式を非同期に評価
+
+    yield_steps 回の評価ごとにイベントループへ制御を返す。
+    """
+    if env is None:
+        env = create_async_env()
+    return await _eval(expr, env, _Clock(yield_steps))
+
+
+async def _apply(func: Any, args: list, clock: _Clock) -> Any:
+    """関数を呼び出す（ユーザー定義関数とコルーチンは await する）"""
+    if type(func) is Procedure:
+        return await _eval(func.body, func.bind(args), clock)
+    if type(func) is AsyncBuiltin:
+        return await func.func(*args)
+    if type(func) is _HigherOrder:
+        return await func.func(clock, *args)
+    if not callable(func):
+        raise TypeError(f"{func} は呼び出し可能ではありません")
+    result = func(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def _eval(expr: Any, env: Environment, clock: _Clock) -> Any:
+    """S式を非同期に評価する
+
+    規則は evaluator.eval_lisp と同じで、特殊形式の検査は共通の関数を使う。
+    末尾位置の式はループで評価し、ループの1周ごとにクロックを進める。
+    """
+    metrics = evaluator.METRICS
+    if metrics is not None:
+        metrics.evaluated_nodes += 1
+    limits = evaluator.LIMITS
+    try:
+        if limits is not None:
+            limits.enter()
+        while True:
+            clock.remaining -= 1
+            if clock.remaining <= 0:
+                clock.remaining = clock.every
+                await asyncio.sleep(0)
+
+            cls = type(expr)
+
+            # シンボル（変数参照）
+            if cls is Symbol:
+                return env.lookup(expr)
+
+            if cls is not list:
+                # 数値リテラル
+                if cls is int or cls is float:
+                    return expr
+                # 文字列リテラル
+                if cls is StringLiteral:
+                    return expr[1]
+                # パック済みASTのノードは子のリストを評価する。エラーの位置は
+                # SourceMap.annotate がローカル変数 packed から求める
+                if cls is PackedNode:
+                    packed = expr
+                    expr = expr.children()
+                    if not expr:
+                        return []
+                    continue
+                # 以下は手で組み立てたS式（素の str やタプル）
+                if isinstance(expr, (int, float)):
+                    return expr
+                if is_string_literal(expr):
+                    return expr[1]
+                if isinstance(expr, str):
+                    return env.lookup(expr)
+                return None
+
+            # リスト（関数呼び出しまたは特殊形式）
+            if not expr:
+                return expr
+
+            # 特殊形式は同一性で判定する
+            head = expr[0]
+            if type(head) is str:
+                head = Symbol(head)
+
+            if head is IF:
+                check_form(expr, IF)
+                condition = await _eval(expr[1], env, clock)
+                expr = expr[2] if condition else expr[3]
+                continue
+
+            elif head is DEFINE:
+                check_form(expr, DEFINE)
+                value = await _eval(expr[2], env, clock)
+                define_variable(env, expr[1], value)
+                return value
+
+            elif head is DEFMEMO:
+                expr = expand_defmemo(expr)
+                continue
+
+            elif head is LET:
+                bindings = let_bindings(expr)
+                new_env = Environment(parent=env)
+                for var_name, var_value in bindings:
+                    new_env.define(var_name,
+                                   await _eval(var_value, env, clock))
+                for body_expr in expr[2:-1]:
+                    await _eval(body_expr, new_env, clock)
+                expr, env = expr[-1], new_env
+                continue
+
+            elif head is FOR:
+                check_form(expr, FOR)
+                var_name = expr[1]
+                start_val = await _eval(expr[2], env, clock)
+                end_val = await _eval(expr[3], env, clock)
+                new_env = Environment(parent=env)
+                result = None
+                for i in range(start_val, end_val + 1):
+                    new_env.define(var_name, i)
+                    result = await _eval(expr[4], new_env, clock)
+                return result
+
+            elif head is LAMBDA:
+                return make_procedure(expr, env)
+
+            elif head is PARALLEL:
+                # (parallel e1 e2 ...) は各式を別のタスクで並行に評価する
+                return await _parallel(expr[1:], env, clock.every)
+
+            # 通常の関数呼び出し
+            func = await _eval(head, env, clock)
+
+            # 再束縛されていない組み込み演算子の2引数呼び出しは直接計算する
+            if len(expr) == 3 and type(head) is Symbol and limits is None:
+                fast = FAST_BINARY.get(head)
+                if fast is not None and func is GLOBALS[head]:
+                    if metrics is not None:
+                        metrics.call(func)
+                    return fast(await _eval(expr[1], env, clock),
+                                await _eval(expr[2], env, clock))
+
+            args = [await _eval(arg, env, clock) for arg in expr[1:]]
+
+            # ユーザー定義関数は本体を同じループで評価する（末尾呼び出し）
+            if type(func) is Procedure:
+                expr, env = func.body, func.bind(args)
+                continue
+
+            if metrics is not None and callable(func):
+                metrics.call(func)
+            if limits is not None:
+                return limits.check_size(await _apply(func, args, clock))
+            return await _apply(func, args, clock)
+    finally:
+        if limits is not None:
+            limits.depth -= 1
+
+
+async def _parallel(exprs: list, env: Environment, every: int) -> list:
+    tasks = [asyncio.ensure_future(_eval(expr, env, _Clock(every)))
+             for expr in exprs]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        # 1つが失敗したら残りを打ち切る
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+class AsyncInterpreter:
+    """グローバル環境を共有する非同期の評価セッション
+
+    評価エンジンは tree と同じ規則の非同期評価器のみ。
+    """
+
+    def __init__(self, yield_steps: int = DEFAULT_YIELD_STEPS):
+        self.yield_steps = yield_steps
+        self.env = create_async_env()
+
+    def define(self, name: str, value: Any):
+        """グローバル変数を定義する（コルーチン関数は非同期の組み込み関数にする）"""
+        if inspect.iscoroutinefunction(value):
+            value = AsyncBuiltin(value, name)
+        self.env.define(Symbol(name), value)
+
+    async def eval(self, expr: Any,
+                   source_map: Optional[SourceMap] = None) -> Any:
+        """S式をセッションのグローバル環境で評価
+
+        source_map を渡すと、エラーに発生位置 (file:line:col) の注記を付ける。
+        """
+        if type(expr) is PackedNode and source_map is None:
+            # パック済みのノードは自分の位置を持っているので、注記に使う
+            source_map = SourceMap(expr.ast.filename)
+        try:
+            return await _eval(expr, self.env, _Clock(self.yield_steps))
+        except Exception as e:
+            if source_map is not None:
+                source_map.annotate(e, expr)
+            raise
+
+    async def run(self, code: str, filename: str = '<string>') -> list[Any]:
+        """ソースコード中の全ての式を順に評価し、結果のリストを返す"""
+        source_map = SourceMap(filename)
+        return [await self.eval(expr, source_map)
+                for expr in parse(tokenize(code), source_map)]
+
+
+def run_async(code: str, **kwargs: Any) -> list[Any]:
+    """新しいイベントループでソースコードを評価する（同期コードからの利用向け）"""
+    return asyncio.run(AsyncInterpreter(**kwargs).run(code))
@@ -0,0 +1,288 @@
+"""
+LISPインタープリターのベンチマークモジュール
+
+トークン化・パース・評価の速度を計測して JSON で出力し、保存したベースラインと
+比較して一定以上遅くなったベンチマークがあれば失敗として扱う。
+`lispy bench` サブコマンドから実行する。
+"""
+
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import unicodedata
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+from .interpreter import ENGINES, Interpreter
+from .parser import parse
+from .tokenizer import tokenize
+
+# 名前 -> (グループ, 計測する関数を作る関数)
+BENCHMARKS: dict[str, tuple[str, Callable]] = {}
+
+# ベースラインより何割遅くなったら失敗とするか
+DEFAULT_THRESHOLD = 0.2
+
+# ベースラインと一致していなければ比較できない計測条件
+CONDITIONS = ('engine', 'scale', 'python')
+
+
+def benchmark(name: str, group: str):
+    """ベンチマークを登録するデコレーター
+
+    登録する関数は (scale, engine) を受け取り、計測対象の引数なしの関数を返す。
+    入力の生成やパースなどの準備は計測対象の外で行う。
+    """
+    def register(factory: Callable) -> Callable:
+        BENCHMARKS[name] = (group, factory)
+        return factory
+    return register
+
+
+def _size(base: int, scale: float) -> int:
+    return max(1, int(base * scale))
+
+
+def _evaluator(source: str, engine: str) -> Callable:
+    program = parse(tokenize(source))
+
+    def run():
+        interpreter = Interpreter(engine)
+        for expr in program:
+            interpreter.eval(expr)
+    return run
+
+
+@benchmark('tokenize_large', 'tokenize')
+def _tokenize_large(scale: float, engine: str) -> Callable:
+    form = ('(define f (lambda (x y) '
+            '(if (< x 10) (concat "small" x) (* x y 2))))\n')
+    source = form * _size(5000, scale)
+    return lambda: tokenize(source)
+
+
+@benchmark('parse_deep', 'parse')
+def _parse_deep(scale: float, engine: str) -> Callable:
+    depth = _size(20000, scale)
+    tokens = tokenize('(list ' * depth + '1' + ')' * depth)
+    return lambda: parse(tokens)
+
+
+@benchmark('parse_wide', 'parse')
+def _parse_wide(scale: float, engine: str) -> Callable:
+    items = ' '.join(['1 "a" x'] * _size(50000, scale))
+    tokens = tokenize(f'(list {items})')
+    return lambda: parse(tokens)
+
+
+@benchmark('eval_recursion', 'eval')
+def _eval_recursion(scale: float, engine: str) -> Callable:
+    n = max(2, 20 + round(math.log2(scale)))
+    return _evaluator(f'''
+    (define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))
+    (fib {n})
+    ''', engine)
+
+
+@benchmark('eval_for_loop', 'eval')
+def _eval_for_loop(scale: float, engine: str) -> Callable:
+    return _evaluator(f'''
+    (for i 1 {_size(100000, scale)}
+      (if (= (% i 15) 0) "FizzBuzz"
+        (if (= (% i 3) 0) "Fizz" (if (= (% i 5) 0) "Buzz" i))))
+    ''', engine)
+
+
+@benchmark('eval_map_filter', 'eval')
+def _eval_map_filter(scale: float, engine: str) -> Callable:
+    n = _size(100000, scale)
+    return _evaluator(f'''
+    (sum (map (lambda (x) (* x x))
+              (filter (lambda (x) (= (% x 3) 0)) (range {n}))))
+    ''', engine)
+
+
+@benchmark('eval_let_heavy', 'eval')
+def _eval_let_heavy(scale: float, engine: str) -> Callable:
+    return _evaluator(f'''
+    (for i 1 {_size(30000, scale)}
+      (let ((a i) (b (* i 2)))
+        (let ((c (+ a b)) (d (- b a)))
+          (let ((e (* c d)))
+            (+ a b c d e)))))
+    ''', engine)
+
+
+def measure(func: Callable, repeat: int) -> dict[str, Any]:
+    """関数を repeat 回実行して実行時間（秒）の統計を返す"""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'repeat': repeat,
+    }
+
+
+def run_benchmarks(names: Optional[list[str]] = None, engine: str = 'tree',
+                   repeat: int = 5, scale: float = 1.0) -> dict[str, Any]:
+    """ベンチマークを実行して JSON に変換できる結果を返す"""
+    from . import __version__
+    if names is None:
+        names = list(BENCHMARKS)
+    results = {}
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError(f"未知のベンチマークです: {name}")
+        group, factory = BENCHMARKS[name]
+        stats = measure(factory(scale, engine), repeat)
+        results[name] = {'group': group, **stats}
+    return {
+        'lispy': __version__,
+        'python': platform.python_version(),
+        'engine': engine,
+        'scale': scale,
+        'results': results,
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any],
+            threshold: float = DEFAULT_THRESHOLD) -> list[dict[str, Any]]:
+    """ベースラインと比較し、ベンチマークごとの比率と判定を返す
+
+    最小実行時間の比がベースラインの (1 + threshold) 倍を超えたら退行とする。
+    エンジンなどの計測条件 (CONDITIONS) が違えば比較できないので ValueError。
+    """
+    mismatched = [
+        f"{key} (ベースライン {baseline[key]!r}, 今回 {current.get(key)!r})"
+        for key in CONDITIONS
+        if key in baseline
+        and _condition(baseline, key) != _condition(current, key)]
+    if mismatched:
+        raise ValueError("ベースラインと計測条件が違うため比較できません: "
+                         + ', '.join(mismatched))
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        if base['min'] > 0:
+            ratio = result['min'] / base['min']
+        else:
+            ratio = float('inf')
+        rows.append({
+            'name': name,
+            'baseline': base['min'],
+            'current': result['min'],
+            'ratio': ratio,
+            'regressed': ratio > 1 + threshold,
+        })
+    return rows
+
+
+def _condition(result: dict[str, Any], key: str) -> Any:
+    value = result.get(key)
+    if key == 'python' and isinstance(value, str):
+        # Python はメジャー・マイナーバージョンが同じなら比較できるとする
+        return '.'.join(value.split('.')[:2])
+    return value
+
+
+def _pad(text: str, width: int, right: bool = False) -> str:
+    """表示幅（全角文字は2）で width になるように空白を足す"""
+    used = sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1
+               for c in text)
+    padding = ' ' * max(0, width - used)
+    return padding + text if right else text + padding
+
+
+def format_comparison(rows: list[dict[str, Any]]) -> str:
+    """比較結果を表に整形"""
+    lines = [f"{_pad('ベンチマーク', 24)} {_pad('基準(秒)', 10, True)} "
+             f"{_pad('今回(秒)', 10, True)} {_pad('比率', 7, True)}"]
+    for row in rows:
+        mark = '  退行' if row['regressed'] else ''
+        lines.append(f"{row['name']:<24} {row['baseline']:10.4f} "
+                     f"{row['current']:10.4f} {row['ratio']:7.2f}{mark}")
+    return '\n'.join(lines)
+
+
+def load_baseline(path: str) -> dict[str, Any]:
+    """ベースラインの JSON を読み込む。読めなければ ValueError"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)
+    except OSError as e:
+        raise ValueError(f"ベースラインを読み込めません: {e}") from e
+    except ValueError as e:
+        raise ValueError(f"ベースラインの JSON が不正です: {path}: {e}") from e
+    if not isinstance(baseline, dict):
+        raise ValueError(f"ベースラインの JSON が不正です: {path}")
+    return baseline
+
+
+def _positive_float(text: str) -> float:
+    try:
+        value = float(text)
+    except ValueError:
+        value = math.nan
+    if not math.isfinite(value) or value <= 0:
+        raise argparse.ArgumentTypeError(f"正の数が必要です: {text}")
+    return value
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """`lispy bench` のエントリーポイント
+
+    退行があれば 1、ベースラインと計測条件が違って比較できなければ 2 を返す。
+    """
+    parser = argparse.ArgumentParser(
+        prog='lispy bench',
+        description='トークン化・パース・評価のベンチマークを実行する'
+    )
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help="実行するベンチマーク（省略時は全て: "
+                             f"{', '.join(BENCHMARKS)}）")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='tree',
+                        help='評価のベンチマークに使うエンジン (デフォルト: tree)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='各ベンチマークの実行回数 (デフォルト: 5)')
+    parser.add_argument('--scale', type=_positive_float, default=1.0,
+                        help='入力の大きさの倍率 (デフォルト: 1.0)')
+    parser.add_argument('--output', '-o', type=str, metavar='FILE',
+                        help='結果の JSON を書き出すファイル（省略時は標準出力）')
+    parser.add_argument('--baseline', type=str, metavar='FILE',
+                        help='比較するベースラインの JSON')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='退行とみなす遅くなった割合 (デフォルト: 0.2)')
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知のベンチマークです: {', '.join(unknown)}")
+
+    current = run_benchmarks(args.names or None, args.engine, args.repeat,
+                             args.scale)
+    text = json.dumps(current, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline is None:
+        return 0
+    try:
+        rows = compare(current, load_baseline(args.baseline), args.threshold)
+    except ValueError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 2
+    print(format_comparison(rows), file=sys.stderr)
+    return 1 if any(row['regressed'] for row in rows) else 0
@@ -1,11 +1,24 @@
 import math
+import operator
 import re
+import sys
+from collections import OrderedDict
 from functools import reduce
-from operator import le
+from itertools import islice
+from types import MappingProxyType
+
+from .symbols import Symbol
 
 
 def operator_add(*args):
-    return sum(args)
+    # 2引数の呼び出し (operator.add) と同じ結果になるように左から順に足す
+    if len(args) == 0:
+        return 0
+
+    result = args[0]
+    for x in args[1:]:
+        result = result + x
+    return result
 
 
 def operator_mul(*args):
@@ -29,7 +42,10 @@ def operator_sub(*args):
     if len(args) == 1:
         return -args[0]
 
-    return args[0] - sum(args[1:])
+    if len(args) == 2:
+        return args[0] - args[1]
+
+    return args[0] - sum(islice(args, 1, None))
 
 
 def operator_div(*args):
@@ -46,6 +62,19 @@ def operator_div(*args):
     return result
 
 
+def comparison(op):
+    """2項比較から (< a b c) のように連鎖できる比較関数を作る"""
+    def compare(*args):
+        if len(args) == 2:
+            # 2引数はそのまま返す（NumPy 配列の要素ごとの比較を保つ）
+            return op(args[0], args[1])
+        for i in range(len(args) - 1):
+            if not op(args[i], args[i + 1]):
+                return False
+        return True
+    return compare
+
+
 # 演算子
 OPERATORS = {
     '+': operator_add,
@@ -53,13 +82,296 @@ OPERATORS = {
     '*': operator_mul,
     '/': operator_div,
     '%': lambda a, b: a % b,
-    '=': lambda a, b: a == b,
-    '<': lambda a, b: a < b,
-    '>': lambda a, b: a > b,
-    '<=': lambda a, b: a <= b,
-    '>=': lambda a, b: a >= b,
+    '=': comparison(operator.eq),
+    '<': comparison(operator.lt),
+    '>': comparison(operator.gt),
+    '<=': comparison(operator.le),
+    '>=': comparison(operator.ge),
 }
 
+
+def _symbol_keys(table):
+    """キーをシンボルにした辞書（パーサーが作るシンボルと同一性で一致する）"""
+    return {Symbol(name): value for name, value in table.items()}
+
+
+# 引数の個数が決まっている呼び出しで汎用の演算子関数の代わりに使う関数。
+# シンボルが再束縛されていないときだけコンパイラが使う
+FAST_BINARY = _symbol_keys({
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+    '=': operator.eq,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+})
+
+FAST_UNARY = _symbol_keys({
+    '-': operator.neg,
+    'not': operator.not_,
+})
+
+
+# 遅延シーケンスが計算した要素を覚えておく最大数
+CACHE_LIMIT = 100_000
+
+
+class LazySeq:
+    """遅延シーケンス
+
+    要素は必要になったときに元のシーケンスから1つずつ計算される。
+    range/map/filter/take を重ねても中間リストは作らず、1回のストリーミング
+    処理として評価される。cache を指定したシーケンス（map/filter）は
+    計算した要素を覚えておき、2回目以降の走査では関数を呼び直さない。
+    覚えるのは CACHE_LIMIT 個までで、それより長いシーケンスは定数メモリで
+    走査するために走査のたびに計算し直す。
+    """
+
+    __slots__ = ('_factory', '_length', '_cache', '_source', '_done')
+
+    def __init__(self, factory, length=None, cache=False):
+        # factory は呼ぶたびに新しいイテレータを返す関数
+        self._factory = factory
+        self._length = length
+        # 計算済みの要素と、その続きを計算するイテレータ
+        self._cache = [] if cache else None
+        self._source = None
+        self._done = False
+
+    def __iter__(self):
+        if self._cache is None:
+            return self._factory()
+        return self._iter_cached(self._cache)
+
+    def _iter_cached(self, cache):
+        index = 0
+        while True:
+            while index < len(cache):
+                yield cache[index]
+                index += 1
+            if self._done:
+                return
+            if self._cache is not cache:
+                # 別の走査が要素を覚えるのをやめた
+                yield from islice(self._factory(), index, None)
+                return
+            if self._source is None:
+                self._source = islice(self._factory(), len(cache), None)
+            source = self._source
+            append = cache.append
+            try:
+                for item in source:
+                    if index >= CACHE_LIMIT:
+                        # 長すぎるので覚えるのをやめ、そのまま続きを計算する
+                        self._cache = self._source = None
+                        yield item
+                        yield from source
+                        return
+                    append(item)
+                    index += 1
+                    yield item
+                    if len(cache) != index:
+                        # 別の走査が先に進めたので覚えた要素から読む
+                        break
+                else:
+                    self._done = True
+                    self._source = None
+                    return
+            except GeneratorExit:
+                # 呼び出し側が走査を途中でやめた（続きは次の走査で計算する）
+                raise
+            except BaseException:
+                # 途中でエラーになったら、次の走査は続きから計算し直す
+                if self._source is source:
+                    self._source = None
+                raise
+
+    def count(self):
+        """要素数（分かっていなければ走査して数える）"""
+        if self._length is not None:
+            return self._length
+        count = 0
+        for _ in self:
+            count += 1
+        return count
+
+    def __bool__(self):
+        for _ in self:
+            return True
+        return False
+
+    def __eq__(self, other):
+        if isinstance(other, (LazySeq, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class Memoized:
+    """引数をキーに結果をキャッシュする関数（LRUで古いものから捨てる）"""
+
+    __slots__ = ('func', 'maxsize', 'cache', 'hits', 'misses')
+
+    def __init__(self, func, maxsize=1024):
+        if not callable(func):
+            raise TypeError(f"{func} は呼び出し可能ではありません")
+        if not isinstance(maxsize, int) or maxsize <= 0:
+            raise ValueError(f"memoize の最大サイズは正の整数が必要です: {maxsize}")
+        self.func = func
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, *args):
+        try:
+            key = tuple(_freeze(arg) for arg in args)
+            hash(key)
+        except TypeError:
+            # 遅延シーケンスや NumPy 配列などキーにできない引数はキャッシュしない
+            self.misses += 1
+            return self.func(*args)
+        cache = self.cache
+        if key in cache:
+            self.hits += 1
+            cache.move_to_end(key)
+            return cache[key]
+        self.misses += 1
+        value = self.func(*args)
+        cache[key] = value
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+        return value
+
+    def stats(self):
+        """(ヒット数 ミス数 現在のサイズ 最大サイズ) のリスト"""
+        return [self.hits, self.misses, len(self.cache), self.maxsize]
+
+    def clear(self):
+        """キャッシュと統計をリセット"""
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"<memoized {self.func!r}>"
+
+
+def _freeze(value):
+    """値を型付きのキャッシュのキーに変換する
+
+    1 と 1.0 と True を区別するため、値と型の組にする（lru_cache の
+    typed=True と同じ）。リストはタプルに変換する。遅延シーケンスは
+    キーを作るために全体を計算することになるので TypeError にする
+    """
+    if type(value) is LazySeq:
+        raise TypeError("遅延シーケンスはキャッシュのキーにできません")
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(_freeze(item) for item in value)
+    return type(value), value
+
+
+def _memoized(func):
+    if not isinstance(func, Memoized):
+        raise TypeError(f"{func} は memoize された関数ではありません")
+    return func
+
+
+def builtin_range(start, end=None):
+    r = range(start, end) if end is not None else range(start)
+    return LazySeq(r.__iter__, len(r))
+
+
+def builtin_map(func, lst):
+    if is_array(lst):
+        # NumPy 配列は配列演算としてまとめて評価する
+        from .vectorize import map_array
+        return map_array(func, lst)
+    if PARALLEL_MAP is not None:
+        return PARALLEL_MAP(func, lst)
+    if isinstance(lst, (list, tuple)):
+        # 計算済みのリストはその場で計算する（エラーも呼び出した式で起きる）
+        return [func(x) for x in lst]
+    # 副作用のない組み込み関数なら、走査せずに長さが分かる
+    length = _known_length(lst) if id(func) in _PURE_IDS else None
+    return LazySeq(lambda: map(func, lst), length, cache=True)
+
+
+def builtin_filter(func, lst):
+    if is_array(lst):
+        from .vectorize import filter_array
+        return filter_array(func, lst)
+    if isinstance(lst, (list, tuple)):
+        return [x for x in lst if func(x)]
+    return LazySeq(lambda: filter(func, lst), cache=True)
+
+
+def builtin_take(n, lst):
+    length = _known_length(lst)
+    return LazySeq(lambda: islice(lst, n),
+                   None if length is None else min(n, length))
+
+
+def builtin_length(lst):
+    if type(lst) is LazySeq:
+        return lst.count()
+    return len(lst)
+
+
+def builtin_reduce(func, initial, lst):
+    return reduce(func, lst, initial)
+
+
+def builtin_sum(lst):
+    return sum(lst)
+
+
+def _known_length(lst):
+    if type(lst) is LazySeq:
+        return lst._length
+    if isinstance(lst, (list, tuple, str)):
+        return len(lst)
+    return None
+
+
+# 並列 map が有効な場合に parallel.enable() が設定する関数
+PARALLEL_MAP = None
+
+
+def builtin_pmap(func, lst):
+    from .parallel import pmap
+    return pmap(func, lst)
+
+
+def builtin_pfilter(func, lst):
+    from .parallel import pfilter
+    return pfilter(func, lst)
+
+
+def builtin_array(lst):
+    from .vectorize import to_array
+    return to_array(lst)
+
+
+def builtin_arange(start, end=None):
+    from .vectorize import arange
+    return arange(start, end)
+
+
+def is_array(value):
+    """値が NumPy 配列かどうか（NumPy を読み込んでいなければ常に偽）"""
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
 # 組み込み関数
 BUILTINS = {
     'sin': math.sin,
@@ -68,14 +380,31 @@ BUILTINS = {
     'print': lambda x: print(x) or x,  # printして値を返す
     'str': str,  # 文字列変換
     'concat': lambda *args: ''.join(str(arg) for arg in args),  # 文字列結合
-    'range': lambda start, end=None: (
-        list(range(start, end) if end is not None else range(start))
-    ),
-    'length': len,
-    'map': lambda func, lst: [func(x) for x in lst],
-    'filter': lambda func, lst: [x for x in lst if func(x)],
+    'range': builtin_range,  # 遅延シーケンス
+    'length': builtin_length,
+    'map': builtin_map,
+    'filter': builtin_filter,
+    'take': builtin_take,
+    'reduce': builtin_reduce,  # (reduce func initial seq)
+    'sum': builtin_sum,
+    'pmap': builtin_pmap,  # プロセスプールで並列に map
+    'pfilter': builtin_pfilter,
+    'array': builtin_array,  # NumPy 配列を作成（NumPy が必要）
+    'arange': builtin_arange,
+    'memoize': Memoized,  # (memoize func [maxsize])
+    'memo_stats': lambda func: _memoized(func).stats(),
+    'memo_clear': lambda func: _memoized(func).clear(),
     'list': lambda *args: list(args),
     'and': lambda a, b: a and b,
     'or': lambda a, b: a or b,
     'not': lambda x: not x,
 }
+
+# グローバル環境の初期値（起動時に一度だけ構築する読み取り専用テーブル）
+GLOBALS = MappingProxyType(_symbol_keys({**OPERATORS, **BUILTINS}))
+
+# 副作用がなく、どんな引数でも例外を出さないため map で呼ぶのを省いてよい
+# 組み込み関数。関数を受け取る高階関数や、引数によっては例外を出す関数
+# （sqrt に負の数を渡すなど）は含めない
+_PURE_IDS = frozenset(
+    id(BUILTINS[name]) for name in ('str', 'concat', 'list', 'not'))
@@ -0,0 +1,277 @@
+"""
+LISPインタープリターのバイトコードコンパイラモジュール
+
+S式を定数プール付きの平坦な命令列に変換する。
+命令は (オペコード, 引数) の2要素を int 配列に並べた固定長形式。
+"""
+
+from array import array
+from typing import Any, Optional
+
+from .builtins import FAST_BINARY, FAST_UNARY, GLOBALS
+from .compiler import Scope, scope_at
+from .evaluator import expand_defmemo
+from .packed import PackedNode
+from .symbols import is_string_literal
+
+# オペコード
+CONST = 0           # 定数をプッシュ                      arg: 定数番号
+LOAD_LOCAL = 1      # 現在のフレームのスロットをプッシュ   arg: スロット番号
+LOAD_DEREF = 2      # 外側のフレームのスロットをプッシュ   arg: (深さ, スロット番号) の定数番号
+LOAD_GLOBAL = 3     # グローバル変数をプッシュ             arg: 変数名の定数番号
+STORE_LOCAL = 4     # スタック先頭を現在のフレームに格納   arg: スロット番号
+STORE_GLOBAL = 5    # スタック先頭をグローバルに定義       arg: 変数名の定数番号
+POP = 6             # スタック先頭を捨てる
+JUMP = 7            # 無条件ジャンプ                       arg: ジャンプ先
+JUMP_IF_FALSE = 8   # 先頭をポップして偽ならジャンプ       arg: ジャンプ先
+MAKE_FRAME = 9      # n個の値をポップして新しいフレームへ  arg: 値の個数
+POP_FRAME = 10      # 親フレームに戻る
+CALL = 11           # 関数呼び出し                         arg: 引数の個数
+TAIL_CALL = 12      # 末尾呼び出し                         arg: 引数の個数
+RETURN = 13         # 呼び出し元に戻る
+MAKE_CLOSURE = 14   # クロージャを作成                     arg: コードオブジェクトの定数番号
+FOR_SETUP = 15      # start/end をポップしてループを準備
+FOR_NEXT = 16       # 次の値をループ変数へ、終了ならジャンプ  arg: ジャンプ先
+FOR_STORE = 17      # 本体の値を結果に保存してループ先頭へ    arg: ジャンプ先
+BINARY_OP = 18      # 組み込みの2項演算                    arg: (名前, 汎用関数, 高速関数) の定数番号
+UNARY_OP = 19       # 組み込みの単項演算                   arg: (名前, 汎用関数, 高速関数) の定数番号
+LOAD_DEFINED = 20   # 代入済みか確かめてローカル define を読む  arg: (変数名, 候補) の定数番号
+
+OPNAMES = {
+    value: name for name, value in dict(globals()).items()
+    if name.isupper() and isinstance(value, int)
+}
+
+
+class CodeObject:
+    """コンパイル済みのコード（命令列と定数プール）"""
+
+    __slots__ = ('code', 'consts', 'nparams', 'name')
+
+    def __init__(self, code: array, consts: list, nparams: int = 0,
+                 name: str = '<toplevel>'):
+        self.code = code
+        self.consts = consts
+        self.nparams = nparams
+        self.name = name
+
+    def __repr__(self):
+        return f"<code {self.name}>"
+
+
+class _Assembler:
+    """命令列と定数プールを組み立てる"""
+
+    def __init__(self):
+        self.code = array('i')
+        self.consts: list = []
+        self._const_index: dict = {}
+
+    def emit(self, op: int, arg: int = 0) -> int:
+        """命令を追加し、その位置を返す"""
+        self.code.extend((op, arg))
+        return len(self.code) - 2
+
+    def patch(self, position: int, target: int):
+        """ジャンプ命令の飛び先を書き換える"""
+        self.code[position + 1] = target
+
+    def here(self) -> int:
+        return len(self.code)
+
+    def const(self, value: Any) -> int:
+        """定数プールに値を追加して番号を返す（同じ値は共有する）"""
+        key = (type(value), value) if _hashable(value) else None
+        if key is not None and key in self._const_index:
+            return self._const_index[key]
+        self.consts.append(value)
+        index = len(self.consts) - 1
+        if key is not None:
+            self._const_index[key] = index
+        return index
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def compile_bytecode(expr: Any) -> CodeObject:
+    """トップレベルのS式をコードオブジェクトにコンパイル"""
+    asm = _Assembler()
+    _compile(asm, expr, None, False)
+    asm.emit(RETURN)
+    return CodeObject(asm.code, asm.consts)
+
+
+def _compile(asm: _Assembler, expr: Any, scope: Optional[Scope], tail: bool):
+    """S式の値をスタックに積む命令を出力する"""
+    # 数値リテラル
+    if isinstance(expr, (int, float)):
+        asm.emit(CONST, asm.const(expr))
+        return
+
+    # 文字列リテラル
+    if is_string_literal(expr):
+        asm.emit(CONST, asm.const(expr[1]))
+        return
+
+    # シンボル（変数参照）
+    if isinstance(expr, str):
+        address = scope.resolve(expr) if scope is not None else None
+        if address is None:
+            asm.emit(LOAD_GLOBAL, asm.const(expr))
+        elif address[1] >= scope_at(scope, address[0]).fixed:
+            # ローカル define のスロットはまだ代入されていない可能性がある
+            candidates = scope.candidates(expr)
+            asm.emit(LOAD_DEFINED, asm.const((expr, candidates)))
+        elif address[0] == 0:
+            asm.emit(LOAD_LOCAL, address[1])
+        else:
+            asm.emit(LOAD_DEREF, asm.const(address))
+        return
+
+    # パック済みASTのノードはリストと同じようにたどる
+    if not isinstance(expr, (list, PackedNode)):
+        raise TypeError(f"コンパイルできない式です: {expr!r}")
+
+    if not expr:
+        asm.emit(CONST, asm.const(expr if isinstance(expr, list) else []))
+        return
+
+    if expr[0] == 'if':
+        # (if condition then-expr else-expr)
+        if len(expr) != 4:
+            raise ValueError("if式は4つの要素が必要です: (if condition then else)")
+        _compile(asm, expr[1], scope, False)
+        jump_else = asm.emit(JUMP_IF_FALSE)
+        _compile(asm, expr[2], scope, tail)
+        jump_end = asm.emit(JUMP)
+        asm.patch(jump_else, asm.here())
+        _compile(asm, expr[3], scope, tail)
+        asm.patch(jump_end, asm.here())
+
+    elif expr[0] == 'define':
+        # (define var value)
+        if len(expr) != 3:
+            raise ValueError("define式は3つの要素が必要です: (define var value)")
+        if scope is None:
+            _compile(asm, expr[2], scope, False)
+            asm.emit(STORE_GLOBAL, asm.const(expr[1]))
+        else:
+            # 値より先に名前を登録して再帰的な参照を解決できるようにする
+            index = len(scope.names)
+            scope.names.append(expr[1])
+            _compile(asm, expr[2], scope, False)
+            asm.emit(STORE_LOCAL, index)
+
+    elif expr[0] == 'defmemo':
+        # (defmemo name (params) body)
+        _compile(asm, expand_defmemo(expr), scope, tail)
+
+    elif expr[0] == 'let':
+        # (let ((var1 val1) (var2 val2) ...) body)
+        if len(expr) < 3:
+            raise ValueError("let式は最低3つの要素が必要です")
+        names = []
+        for binding in expr[1]:
+            if len(binding) != 2:
+                raise ValueError("letの束縛は [変数名 値] の形式が必要です")
+            var_name, var_value = binding
+            names.append(var_name)
+            _compile(asm, var_value, scope, False)
+        asm.emit(MAKE_FRAME, len(names))
+        let_scope = Scope(names, scope)
+        body = expr[2:]
+        for body_expr in body[:-1]:
+            _compile(asm, body_expr, let_scope, False)
+            asm.emit(POP)
+        _compile(asm, body[-1], let_scope, tail)
+        asm.emit(POP_FRAME)
+
+    elif expr[0] == 'for':
+        # (for var start end body)
+        if len(expr) != 5:
+            raise ValueError("for式は5つの要素が必要です: (for var start end body)")
+        _compile(asm, expr[2], scope, False)
+        _compile(asm, expr[3], scope, False)
+        asm.emit(FOR_SETUP)
+        loop = asm.emit(FOR_NEXT)
+        _compile(asm, expr[4], Scope([expr[1]], scope), False)
+        asm.emit(FOR_STORE, loop)
+        asm.patch(loop, asm.here())
+
+    elif expr[0] == 'lambda':
+        # (lambda (param1 param2 ...) body)
+        if len(expr) != 3:
+            raise ValueError("lambda式は3つの要素が必要です: (lambda (params) body)")
+        params = expr[1]
+        body_asm = _Assembler()
+        _compile(body_asm, expr[2], Scope(params, scope), True)
+        body_asm.emit(RETURN)
+        code = CodeObject(body_asm.code, body_asm.consts, len(params),
+                          '<lambda>')
+        asm.emit(MAKE_CLOSURE, asm.const(code))
+
+    elif _is_fast_call(expr, scope):
+        # 組み込み演算子の固定長の呼び出し（関数自体はスタックに積まない）
+        head = expr[0]
+        for item in expr[1:]:
+            _compile(asm, item, scope, False)
+        if len(expr) == 3:
+            op, fast = BINARY_OP, FAST_BINARY[head]
+        else:
+            op, fast = UNARY_OP, FAST_UNARY[head]
+        asm.emit(op, asm.const((head, GLOBALS[head], fast)))
+
+    else:
+        # 通常の関数呼び出し
+        for item in expr:
+            _compile(asm, item, scope, False)
+        asm.emit(TAIL_CALL if tail else CALL, len(expr) - 1)
+
+
+def _is_fast_call(expr: list, scope: Optional[Scope]) -> bool:
+    """再束縛されていない組み込み演算子の固定長の呼び出しか"""
+    head = expr[0]
+    if not isinstance(head, str) or head not in GLOBALS:
+        return False
+    if scope is not None and scope.resolve(head) is not None:
+        return False
+    if len(expr) == 3:
+        return head in FAST_BINARY
+    return len(expr) == 2 and head in FAST_UNARY
+
+
+def disassemble(code: CodeObject) -> str:
+    """コードオブジェクトを人が読める形式に変換する"""
+    lines = []
+    _disassemble(code, lines)
+    return '\n'.join(lines)
+
+
+def _disassemble(code: CodeObject, lines: list):
+    lines.append(f"Disassembly of {code.name} (params={code.nparams}):")
+    nested = []
+    for pc in range(0, len(code.code), 2):
+        op, arg = code.code[pc], code.code[pc + 1]
+        name = OPNAMES[op]
+        if op in (BINARY_OP, UNARY_OP):
+            operator_name = code.consts[arg][0]
+            lines.append(f"{pc:6d} {name:<14} {arg:<4} ({operator_name!r})")
+        elif op in (CONST, LOAD_GLOBAL, STORE_GLOBAL, LOAD_DEREF,
+                    LOAD_DEFINED, MAKE_CLOSURE):
+            value = code.consts[arg]
+            if isinstance(value, CodeObject):
+                nested.append(value)
+            lines.append(f"{pc:6d} {name:<14} {arg:<4} ({value!r})")
+        elif op in (POP, POP_FRAME, RETURN, FOR_SETUP):
+            lines.append(f"{pc:6d} {name}")
+        else:
+            lines.append(f"{pc:6d} {name:<14} {arg}")
+    for inner in nested:
+        lines.append('')
+        _disassemble(inner, lines)
@@ -0,0 +1,97 @@
+"""
+LISPインタープリターのキャッシュモジュール
+
+パース済みのプログラム（と位置の対応表）をソースのハッシュと一緒に .lspc ファイルへ
+保存し、ソースが変わっていなければ再実行時にトークン化とパースを省略する。
+パック済みASTは配列をそのまま書き出し、読み込み時は mmap するだけで使える
+"""
+
+import hashlib
+import os
+import pickle
+import struct
+from pathlib import Path
+from typing import Any, Optional
+
+from .packed import PackedAST
+
+CACHE_DIR = '__lspcache__'
+CACHE_SUFFIX = '.lspc'
+MAGIC = b'LSPC'
+# キャッシュ形式のバージョン（パース結果の表現が変わったら上げる）
+FORMAT_VERSION = 4
+
+# MAGIC の次の1バイトで中身の形式を区別する
+KIND_PICKLE = b'K'
+KIND_PACKED = b'P'
+_HEADER = struct.Struct('<I')
+
+
+def source_hash(source: bytes) -> str:
+    """ソースコードのハッシュ値を計算"""
+    return hashlib.sha256(source).hexdigest()
+
+
+def cache_path(source_path: Path) -> Path:
+    """ソースファイルに対応するキャッシュファイルのパス"""
+    return source_path.parent / CACHE_DIR / (source_path.name + CACHE_SUFFIX)
+
+
+def _version_tag() -> str:
+    from . import __version__
+    return f"{__version__}/{FORMAT_VERSION}"
+
+
+def load(path: Path, digest: str) -> Optional[Any]:
+    """キャッシュを読み込む。存在しないか古い場合は None
+
+    パック済みASTは mmap して配列をコピーせずに読み込む。
+    """
+    try:
+        with open(path, 'rb') as f:
+            prefix = f.read(len(MAGIC) + 1 + _HEADER.size)
+            if not prefix.startswith(MAGIC):
+                return None
+            kind = prefix[len(MAGIC):len(MAGIC) + 1]
+            (header_size,) = _HEADER.unpack_from(prefix, len(MAGIC) + 1)
+            version, cached_digest = pickle.loads(f.read(header_size))
+            if version != _version_tag() or cached_digest != digest:
+                return None
+            if kind == KIND_PICKLE:
+                return pickle.load(f)
+            if kind == KIND_PACKED:
+                return PackedAST.load(path, f.tell())
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError,
+            struct.error):
+        return None
+    return None
+
+
+def store(path: Path, digest: str, program: Any) -> bool:
+    """キャッシュを書き込む。書き込めなかった場合は False"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            header = pickle.dumps((_version_tag(), digest),
+                                  protocol=pickle.HIGHEST_PROTOCOL)
+            # パック済みASTの配列がファイルの4バイト境界から始まるように埋める
+            # （pickle は末尾の余分なバイトを無視する）
+            offset = len(MAGIC) + 1 + _HEADER.size + len(header)
+            header += b'\0' * (-offset % 4)
+            packed = isinstance(program, PackedAST)
+            f.write(MAGIC + (KIND_PACKED if packed else KIND_PICKLE))
+            f.write(_HEADER.pack(len(header)) + header)
+            if packed:
+                f.write(program.to_bytes())
+            else:
+                pickle.dump(program, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # 書きかけのファイルを他のプロセスが読まないように置き換える
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        return False
+    return True
@@ -0,0 +1,364 @@
+"""
+LISPインタープリターのコンパイラモジュール
+
+S式を一度だけ解析し、事前に解決されたPythonクロージャの木に変換する
+"""
+
+from typing import Any, Callable, Optional
+
+from .builtins import FAST_BINARY, FAST_UNARY, GLOBALS
+from .evaluator import Environment, create_global_env, expand_defmemo
+from .packed import PackedNode
+from .symbols import is_string_literal
+
+Compiled = Callable[[Environment, Optional['Frame']], Any]
+
+# まだ実行されていないローカル define のスロットを表す番兵
+UNBOUND = object()
+
+
+class Frame:
+    """ローカル変数のフレーム（値はスロット番号で参照する）"""
+
+    __slots__ = ('values', 'parent')
+
+    def __init__(self, values: list, parent: Optional['Frame'] = None):
+        self.values = values
+        self.parent = parent
+
+
+class Scope:
+    """コンパイル時のスコープ（変数名とスロット番号の対応）"""
+
+    __slots__ = ('names', 'parent', 'fixed')
+
+    def __init__(self, names, parent: Optional['Scope'] = None):
+        self.names = list(names)
+        self.parent = parent
+        # 引数や let の束縛の数。これ以降のスロットはローカル define が後から追加する
+        self.fixed = len(self.names)
+
+    def resolve(self, name: str) -> Optional[tuple[int, int]]:
+        """変数を (深さ, スロット番号) に解決する。ローカルでなければ None"""
+        scope, depth = self, 0
+        while scope is not None:
+            names = scope.names
+            # 同じスコープ内で重複した名前は後の束縛が優先される
+            for index in range(len(names) - 1, -1, -1):
+                if names[index] == name:
+                    return depth, index
+            scope, depth = scope.parent, depth + 1
+        return None
+
+    def candidates(self, name: str) -> list[tuple[int, int]]:
+        """変数の候補となる (深さ, スロット番号) を内側から順に列挙する
+
+        ローカル define のスロットは実行されるまで値がないため、その外側の
+        束縛も候補に含める。常に値を持つスロットが見つかった時点で打ち切る
+        """
+        result = []
+        scope, depth = self, 0
+        while scope is not None:
+            names = scope.names
+            for index in range(len(names) - 1, -1, -1):
+                if names[index] == name:
+                    result.append((depth, index))
+                    if index < scope.fixed:
+                        return result
+            scope, depth = scope.parent, depth + 1
+        return result
+
+
+def scope_at(scope: Scope, depth: int) -> Scope:
+    """depth 段外側のスコープを返す"""
+    for _ in range(depth):
+        scope = scope.parent
+    return scope
+
+
+def load_defined(env: Environment, frame: 'Frame', name: str,
+                 candidates: list) -> Any:
+    """ローカル define のスロットを含む変数を読み出す
+
+    値のあるスロットが見つからなければグローバル環境を参照するので、
+    木構造の評価器と同じく未定義の変数は NameError になる
+    """
+    for depth, index in candidates:
+        target = frame
+        for _ in range(depth):
+            target = target.parent
+        values = target.values
+        if index < len(values) and values[index] is not UNBOUND:
+            return values[index]
+    return env.lookup(name)
+
+
+def compile_lisp(expr: Any) -> Callable[[Environment], Any]:
+    """S式を環境を受け取るクロージャにコンパイル"""
+    code = _compile(expr, None)
+    return lambda env: code(env, None)
+
+
+def eval_compiled(expr: Any, env: Optional[Environment] = None) -> Any:
+    """S式をコンパイルしてから環境下で評価"""
+    if env is None:
+        env = create_global_env()
+    return _compile(expr, None)(env, None)
+
+
+def _compile(expr: Any, scope: Optional[Scope]) -> Compiled:
+    """スコープ情報を使ってS式をコンパイル"""
+    # 数値リテラル
+    if isinstance(expr, (int, float)):
+        return _compile_constant(expr)
+
+    # 文字列リテラル
+    if is_string_literal(expr):
+        return _compile_constant(expr[1])
+
+    # シンボル（変数参照）
+    if isinstance(expr, str):
+        return _compile_symbol(expr, scope)
+
+    # リスト（関数呼び出しまたは特殊形式）。パック済みASTのノードもそのままたどる
+    if isinstance(expr, (list, PackedNode)):
+        if not expr:
+            empty = expr if isinstance(expr, list) else []
+            return lambda env, frame: empty
+
+        if expr[0] == 'if':
+            return _compile_if(expr, scope)
+        elif expr[0] == 'define':
+            return _compile_define(expr, scope)
+        elif expr[0] == 'defmemo':
+            return _compile_define(expand_defmemo(expr), scope)
+        elif expr[0] == 'let':
+            return _compile_let(expr, scope)
+        elif expr[0] == 'for':
+            return _compile_for(expr, scope)
+        elif expr[0] == 'lambda':
+            return _compile_lambda(expr, scope)
+
+        return _compile_call(expr, scope)
+
+    raise TypeError(f"コンパイルできない式です: {expr!r}")
+
+
+def _compile_constant(value: Any) -> Compiled:
+    return lambda env, frame: value
+
+
+def _compile_symbol(name: str, scope: Optional[Scope]) -> Compiled:
+    address = scope.resolve(name) if scope is not None else None
+    if address is None:
+        # ローカルに束縛されていなければグローバル環境を参照する
+        return lambda env, frame: env.lookup(name)
+
+    depth, index = address
+    if index >= scope_at(scope, depth).fixed:
+        # ローカル define のスロットはまだ代入されていない可能性がある
+        candidates = scope.candidates(name)
+        return lambda env, frame: load_defined(env, frame, name, candidates)
+
+    # 浅い参照は親フレームをたどるループを展開しておく
+    if depth == 0:
+        return lambda env, frame: frame.values[index]
+    if depth == 1:
+        return lambda env, frame: frame.parent.values[index]
+    if depth == 2:
+        return lambda env, frame: frame.parent.parent.values[index]
+
+    def lookup_deep(env, frame):
+        for _ in range(depth):
+            frame = frame.parent
+        return frame.values[index]
+
+    return lookup_deep
+
+
+def _compile_if(expr: list, scope: Optional[Scope]) -> Compiled:
+    # (if condition then-expr else-expr)
+    if len(expr) != 4:
+        raise ValueError("if式は4つの要素が必要です: (if condition then else)")
+    condition = _compile(expr[1], scope)
+    then_branch = _compile(expr[2], scope)
+    else_branch = _compile(expr[3], scope)
+
+    def run_if(env, frame):
+        if condition(env, frame):
+            return then_branch(env, frame)
+        return else_branch(env, frame)
+
+    return run_if
+
+
+def _compile_define(expr: list, scope: Optional[Scope]) -> Compiled:
+    # (define var value)
+    if len(expr) != 3:
+        raise ValueError("define式は3つの要素が必要です: (define var value)")
+
+    name = expr[1]
+    if scope is None:
+        value = _compile(expr[2], scope)
+
+        def run_define_global(env, frame):
+            result = value(env, frame)
+            env.define(name, result)
+            return result
+
+        return run_define_global
+
+    # ローカルスコープでの定義は新しいスロットを割り当てる。
+    # 値より先に名前を登録して再帰的な参照を解決できるようにする
+    index = len(scope.names)
+    scope.names.append(name)
+    value = _compile(expr[2], scope)
+
+    def run_define_local(env, frame):
+        result = value(env, frame)
+        values = frame.values
+        while len(values) <= index:
+            values.append(UNBOUND)
+        values[index] = result
+        return result
+
+    return run_define_local
+
+
+def _compile_let(expr: list, scope: Optional[Scope]) -> Compiled:
+    # (let ((var1 val1) (var2 val2) ...) body)
+    if len(expr) < 3:
+        raise ValueError("let式は最低3つの要素が必要です")
+
+    names = []
+    values = []
+    for binding in expr[1]:
+        if len(binding) != 2:
+            raise ValueError("letの束縛は [変数名 値] の形式が必要です")
+        var_name, var_value = binding
+        names.append(var_name)
+        # 束縛の値は外側のスコープで評価する
+        values.append(_compile(var_value, scope))
+
+    let_scope = Scope(names, scope)
+    body = [_compile(body_expr, let_scope) for body_expr in expr[2:]]
+
+    def run_let(env, frame):
+        new_frame = Frame([value(env, frame) for value in values], frame)
+        result = None
+        for body_expr in body:
+            result = body_expr(env, new_frame)
+        return result
+
+    return run_let
+
+
+def _compile_for(expr: list, scope: Optional[Scope]) -> Compiled:
+    # (for var start end body)
+    if len(expr) != 5:
+        raise ValueError("for式は5つの要素が必要です: (for var start end body)")
+
+    start = _compile(expr[2], scope)
+    end = _compile(expr[3], scope)
+    body = _compile(expr[4], Scope([expr[1]], scope))
+
+    def run_for(env, frame):
+        start_val = start(env, frame)
+        end_val = end(env, frame)
+        new_frame = Frame([None], frame)
+        values = new_frame.values
+        result = None
+        for i in range(start_val, end_val + 1):
+            values[0] = i
+            result = body(env, new_frame)
+        return result
+
+    return run_for
+
+
+def _compile_lambda(expr: list, scope: Optional[Scope]) -> Compiled:
+    # (lambda (param1 param2 ...) body)
+    if len(expr) != 3:
+        raise ValueError("lambda式は3つの要素が必要です: (lambda (params) body)")
+
+    nparams = len(expr[1])
+    body = _compile(expr[2], Scope(expr[1], scope))
+
+    def make_lambda(env, frame):
+        def lambda_func(*args):
+            if len(args) != nparams:
+                expected, actual = nparams, len(args)
+                raise ValueError(f"引数の数が一致しません: 期待値{expected}, 実際{actual}")
+            return body(env, Frame(list(args), frame))
+
+        return lambda_func
+
+    return make_lambda
+
+
+def _compile_call(expr: list, scope: Optional[Scope]) -> Compiled:
+    func = _compile(expr[0], scope)
+    args = [_compile(arg, scope) for arg in expr[1:]]
+    run_call = _compile_generic_call(func, args)
+
+    head = expr[0]
+    if (not isinstance(head, str) or head not in GLOBALS or
+            (scope is not None and scope.resolve(head) is not None)):
+        return run_call
+
+    # 組み込み演算子の固定長の呼び出しは operator モジュールの関数を直接呼ぶ。
+    # 実行時にグローバルのシンボルが再束縛されていれば汎用の呼び出しに戻る
+    generic = GLOBALS[head]
+    if len(args) == 2 and head in FAST_BINARY:
+        fast = FAST_BINARY[head]
+        a, b = args
+
+        def run_binary(env, frame):
+            if env.bindings.get(head) is generic:
+                return fast(a(env, frame), b(env, frame))
+            return run_call(env, frame)
+
+        return run_binary
+
+    if len(args) == 1 and head in FAST_UNARY:
+        fast = FAST_UNARY[head]
+        (a,) = args
+
+        def run_unary(env, frame):
+            if env.bindings.get(head) is generic:
+                return fast(a(env, frame))
+            return run_call(env, frame)
+
+        return run_unary
+
+    return run_call
+
+
+def _compile_generic_call(func: Compiled, args: list) -> Compiled:
+    def check(f):
+        if not callable(f):
+            raise TypeError(f"{f} は呼び出し可能ではありません")
+        return f
+
+    # 引数の個数ごとに特化して、呼び出しごとのリスト生成を避ける
+    if len(args) == 0:
+        def run_call(env, frame):
+            return check(func(env, frame))()
+    elif len(args) == 1:
+        (a,) = args
+
+        def run_call(env, frame):
+            f = check(func(env, frame))
+            return f(a(env, frame))
+    elif len(args) == 2:
+        a, b = args
+
+        def run_call(env, frame):
+            f = check(func(env, frame))
+            return f(a(env, frame), b(env, frame))
+    else:
+        def run_call(env, frame):
+            f = check(func(env, frame))
+            return f(*[arg(env, frame) for arg in args])
+
+    return run_call
@@ -6,7 +6,17 @@ S式を環境下で評価して結果を返す
 
 from typing import Any, Dict, Optional
 
-from .builtins import BUILTINS, OPERATORS
+from .builtins import FAST_BINARY, GLOBALS, Memoized
+from .packed import PackedNode
+from .symbols import (DEFINE, DEFMEMO, FOR, IF, LAMBDA, LET, MEMOIZE,
+                      StringLiteral, Symbol, is_string_literal)
+
+# プロファイル中に profiler.Profiler.enable() が設定するプロファイラー
+PROFILER = None
+# 計測中に metrics.Metrics.enable() が設定するメトリクス
+METRICS = None
+# 資源の制限 (limits.Limits) の with 文の中で設定される制限
+LIMITS = None
 
 
 class Environment:
@@ -15,139 +25,276 @@ class Environment:
     def __init__(self, parent=None):
         self.bindings: Dict[str, Any] = {}
         self.parent = parent
+        if METRICS is not None:
+            METRICS.environments += 1
 
     def define(self, name: str, value: Any):
         """変数を定義"""
         self.bindings[name] = value
+        if METRICS is not None:
+            METRICS.defines += 1
 
     def lookup(self, name: str) -> Any:
         """変数を検索"""
-        if name in self.bindings:
-            return self.bindings[name]
-        elif self.parent:
-            return self.parent.lookup(name)
-        else:
-            raise NameError(f"Undefined variable: {name}")
+        env = self
+        while name not in env.bindings:
+            env = env.parent
+            if env is None:
+                if METRICS is not None:
+                    METRICS.count_lookup(self, None)
+                raise NameError(f"Undefined variable: {name}")
+        if METRICS is not None:
+            METRICS.count_lookup(self, env)
+        return env.bindings[name]
 
 
 def create_global_env() -> Environment:
     """グローバル環境を作成"""
     env = Environment()
-    # 演算子を定義
-    for name, func in OPERATORS.items():
-        env.define(name, func)
-    # 組み込み関数を定義
-    for name, func in BUILTINS.items():
-        env.define(name, func)
+    # 演算子と組み込み関数は構築済みのテーブルから一括でコピーする
+    env.bindings.update(GLOBALS)
     return env
 
 
-def eval_lisp(expr: Any, env: Optional[Environment] = None) -> Any:
-    """S式を環境下で評価"""
-    if env is None:
-        env = create_global_env()
+class Procedure:
+    """lambda式で作られるユーザー定義関数"""
 
-    # 数値リテラル
-    if isinstance(expr, (int, float)):
-        return expr
-
-    # 文字列リテラル（タプルで表現）
-    if (isinstance(expr, tuple) and len(expr) == 2 and
-            expr[0] == 'STRING_LITERAL'):
-        return expr[1]
-
-    # シンボル（変数参照）
-    if isinstance(expr, str):
-        return env.lookup(expr)
-
-    # リスト（関数呼び出しまたは特殊形式）
-    if isinstance(expr, list):
-        if not expr:
-            return expr
-
-        # 特殊形式の処理
-        if expr[0] == 'if':
-            # (if condition then-expr else-expr)
-            if len(expr) != 4:
-                raise ValueError("if式は4つの要素が必要です: (if condition then else)")
-            condition = eval_lisp(expr[1], env)
-            if condition:
-                return eval_lisp(expr[2], env)
-            else:
-                return eval_lisp(expr[3], env)
-
-        elif expr[0] == 'let':
-            # (let ((var1 val1) (var2 val2) ...) body)
-            if len(expr) < 3:
-                raise ValueError("let式は最低3つの要素が必要です")
-
-            # 新しい環境を作成
-            new_env = Environment(parent=env)
-
-            # 変数束縛を処理
-            bindings = expr[1]
-            for binding in bindings:
-                if len(binding) != 2:
-                    raise ValueError("letの束縛は [変数名 値] の形式が必要です")
-                var_name, var_value = binding
-                new_env.define(var_name, eval_lisp(var_value, env))
-
-            # 本体を新しい環境で評価
-            result = None
-            for body_expr in expr[2:]:
-                result = eval_lisp(body_expr, new_env)
-            return result
-
-        elif expr[0] == 'for':
-            # (for var start end body)
-            if len(expr) != 5:
-                raise ValueError("for式は5つの要素が必要です: (for var start end body)")
-
-            var_name = expr[1]
-            start_val = eval_lisp(expr[2], env)
-            end_val = eval_lisp(expr[3], env)
-            body = expr[4]
-
-            # 新しい環境を作成
-            new_env = Environment(parent=env)
-
-            result = None
-            for i in range(start_val, end_val + 1):
-                new_env.define(var_name, i)
-                result = eval_lisp(body, new_env)
-            return result
-
-        elif expr[0] == 'lambda':
-            # (lambda (param1 param2 ...) body)
-            if len(expr) != 3:
-                raise ValueError("lambda式は3つの要素が必要です: (lambda (params) body)")
-
-            params = expr[1]
-            body = expr[2]
-
-            def lambda_func(*args):
-                if len(args) != len(params):
-                    expected, actual = len(params), len(args)
-                    raise ValueError(f"引数の数が一致しません: 期待値{expected}, 実際{actual}")
+    __slots__ = ('params', 'body', 'env', 'name')
 
-                # 新しい環境を作成
-                func_env = Environment(parent=env)
+    def __init__(self, params: list, body: Any, env: Environment):
+        self.params = params
+        self.body = body
+        self.env = env
+        # define で束縛されたときの名前（プロファイラーの表示用）
+        self.name: Optional[str] = None
+        if METRICS is not None:
+            METRICS.closures += 1
+
+    def bind(self, args) -> Environment:
+        """引数を束縛した関数本体の評価環境を作成"""
+        params = self.params
+        if len(args) != len(params):
+            expected, actual = len(params), len(args)
+            raise ValueError(f"引数の数が一致しません: 期待値{expected}, 実際{actual}")
+
+        # 新しい環境を作成
+        func_env = Environment(parent=self.env)
+
+        # パラメータを束縛
+        for param, arg in zip(params, args):
+            func_env.define(param, arg)
+        return func_env
+
+    def __call__(self, *args):
+        if PROFILER is not None:
+            return PROFILER.call(self, args)
+        return eval_lisp(self.body, self.bind(args))
+
+
+def _name_procedure(value: Any, name: str):
+    if isinstance(value, Memoized):
+        value = value.func
+    if type(value) is Procedure and value.name is None:
+        value.name = name
+
+
+def expand_defmemo(expr: list) -> list:
+    """(defmemo name (params) body) を展開する
+
+    展開後は (define name (memoize (lambda (params) body)))。
+    """
+    if len(expr) != 4:
+        raise ValueError("defmemo式は4つの要素が必要です: (defmemo name (params) body)")
+    return [DEFINE, expr[1], [MEMOIZE, [LAMBDA, expr[2], expr[3]]]]
 
-                # パラメータを束縛
-                for param, arg in zip(params, args):
-                    func_env.define(param, arg)
 
-                return eval_lisp(body, func_env)
+# 要素数が決まっている特殊形式と、違ったときのエラーメッセージ
+_FORM_LENGTHS = {
+    IF: (4, "if式は4つの要素が必要です: (if condition then else)"),
+    DEFINE: (3, "define式は3つの要素が必要です: (define var value)"),
+    FOR: (5, "for式は5つの要素が必要です: (for var start end body)"),
+    LAMBDA: (3, "lambda式は3つの要素が必要です: (lambda (params) body)"),
+}
 
-            return lambda_func
 
-        # 通常の関数呼び出し
-        func = eval_lisp(expr[0], env)
+def check_form(expr: list, head: Symbol):
+    """特殊形式の要素数を確かめる（aio の非同期評価器と共通）"""
+    length, message = _FORM_LENGTHS[head]
+    if len(expr) != length:
+        raise ValueError(message)
 
-        # 残りの要素が引数
-        args = [eval_lisp(arg, env) for arg in expr[1:]]
-        # 関数呼び出し
-        if callable(func):
-            return func(*args)
-        else:
-            raise TypeError(f"{func} は呼び出し可能ではありません")
+
+def let_bindings(expr: list) -> list:
+    """(let ((var1 val1) ...) body) の (変数名, 値の式) のリスト"""
+    if len(expr) < 3:
+        raise ValueError("let式は最低3つの要素が必要です")
+    bindings = []
+    for binding in expr[1]:
+        if len(binding) != 2:
+            raise ValueError("letの束縛は [変数名 値] の形式が必要です")
+        var_name, var_value = binding
+        bindings.append((var_name, var_value))
+    return bindings
+
+
+def define_variable(env: Environment, name: str, value: Any):
+    """define の値を環境に定義し、無名の関数には名前を付ける"""
+    env.define(name, value)
+    _name_procedure(value, name)
+
+
+def make_procedure(expr: list, env: Environment) -> Procedure:
+    """(lambda (param1 param2 ...) body) の関数を作る"""
+    check_form(expr, LAMBDA)
+    params = expr[1]
+    if type(params) is PackedNode:
+        params = params.children()
+    return Procedure(params, expr[2], env)
+
+
+def eval_lisp(expr: Any, env: Optional[Environment] = None) -> Any:
+    """S式を環境下で評価
+
+    if の分岐、let の最後の式、ユーザー定義関数の呼び出しといった末尾位置の式は
+    再帰せずにループで評価するため、末尾呼び出しはPythonのスタックを消費しない。
+    """
+    if env is None:
+        env = create_global_env()
+
+    if METRICS is not None:
+        METRICS.evaluated_nodes += 1
+    limits = LIMITS
+    try:
+        if limits is not None:
+            limits.enter()
+        while True:
+            cls = type(expr)
+
+            # シンボル（変数参照）
+            if cls is Symbol:
+                return env.lookup(expr)
+
+            if cls is not list:
+                # 数値リテラル
+                if cls is int or cls is float:
+                    return expr
+                # 文字列リテラル
+                if cls is StringLiteral:
+                    return expr[1]
+                # パック済みASTのノードは子のリストを評価する。エラーの位置は
+                # SourceMap.annotate がローカル変数 packed から求める
+                if cls is PackedNode:
+                    packed = expr
+                    expr = expr.children()
+                    if not expr:
+                        return []
+                    continue
+                # 以下は手で組み立てたS式（素の str やタプル）
+                if isinstance(expr, (int, float)):
+                    return expr
+                if is_string_literal(expr):
+                    return expr[1]
+                if isinstance(expr, str):
+                    return env.lookup(expr)
+                return None
+
+            # リスト（関数呼び出しまたは特殊形式）
+            if not expr:
+                return expr
+
+            # 特殊形式は同一性で判定する
+            head = expr[0]
+            if type(head) is str:
+                head = Symbol(head)
+
+            if head is IF:
+                # (if condition then-expr else-expr)
+                check_form(expr, IF)
+                condition = eval_lisp(expr[1], env)
+                expr = expr[2] if condition else expr[3]
+                continue
+
+            elif head is DEFINE:
+                # (define var value)
+                check_form(expr, DEFINE)
+                value = eval_lisp(expr[2], env)
+                define_variable(env, expr[1], value)
+                return value
+
+            elif head is DEFMEMO:
+                # (defmemo name (params) body)
+                expr = expand_defmemo(expr)
+                continue
+
+            elif head is LET:
+                # (let ((var1 val1) (var2 val2) ...) body)
+                bindings = let_bindings(expr)
+
+                # 新しい環境を作成して変数束縛を処理
+                new_env = Environment(parent=env)
+                for var_name, var_value in bindings:
+                    new_env.define(var_name, eval_lisp(var_value, env))
+
+                # 本体を新しい環境で評価（最後の式は末尾位置）
+                for body_expr in expr[2:-1]:
+                    eval_lisp(body_expr, new_env)
+                expr, env = expr[-1], new_env
+                continue
+
+            elif head is FOR:
+                # (for var start end body)
+                check_form(expr, FOR)
+
+                var_name = expr[1]
+                start_val = eval_lisp(expr[2], env)
+                end_val = eval_lisp(expr[3], env)
+                body = expr[4]
+
+                # 新しい環境を作成
+                new_env = Environment(parent=env)
+
+                result = None
+                for i in range(start_val, end_val + 1):
+                    new_env.define(var_name, i)
+                    result = eval_lisp(body, new_env)
+                return result
+
+            elif head is LAMBDA:
+                # (lambda (param1 param2 ...) body)
+                return make_procedure(expr, env)
+
+            # 通常の関数呼び出し
+            func = eval_lisp(head, env)
+
+            # 再束縛されていない組み込み演算子の2引数呼び出しは直接計算する
+            # （資源の制限中は結果の大きさを確かめるので通常の呼び出しにする）
+            if len(expr) == 3 and type(head) is Symbol and limits is None:
+                fast = FAST_BINARY.get(head)
+                if fast is not None and func is GLOBALS[head]:
+                    if METRICS is not None:
+                        METRICS.call(func)
+                    return fast(eval_lisp(expr[1], env),
+                                eval_lisp(expr[2], env))
+
+            # 残りの要素が引数
+            args = [eval_lisp(arg, env) for arg in expr[1:]]
+
+            # ユーザー定義関数は本体を同じループで評価する（末尾呼び出し）
+            if type(func) is Procedure:
+                if PROFILER is not None:
+                    return PROFILER.call(func, args)
+                expr, env = func.body, func.bind(args)
+                continue
+
+            # 関数呼び出し
+            if callable(func):
+                if METRICS is not None:
+                    METRICS.call(func)
+                if limits is not None:
+                    return limits.check_size(func(*args))
+                return func(*args)
+            else:
+                raise TypeError(f"{func} は呼び出し可能ではありません")
+    finally:
+        if limits is not None:
+            limits.depth -= 1
@@ -0,0 +1,89 @@
+"""
+LISPインタープリターのセッションモジュール
+
+グローバル環境を一度だけ構築し、複数のトップレベル式を同じ環境で評価する
+"""
+
+from importlib import import_module
+from typing import Any, Callable, Optional
+
+from . import evaluator
+from .evaluator import create_global_env
+from .limits import Limits
+from .packed import PackedNode
+from .parser import SourceMap, parse
+from .tokenizer import tokenize
+
+# 評価エンジン: tree はS式を直接たどる評価器、compile はクロージャにコンパイルしてから実行する、
+# vm はバイトコードにコンパイルしてスタックマシンで実行する。
+# 起動を速くするため、エンジンのモジュールは使うときに読み込む（モジュール名, 関数名）
+ENGINES = {
+    'tree': ('evaluator', 'eval_lisp'),
+    'compile': ('compiler', 'eval_compiled'),
+    'vm': ('vm', 'eval_bytecode'),
+}
+
+
+def load_engine(engine: str) -> Callable:
+    """評価エンジンの評価関数を返す"""
+    if engine not in ENGINES:
+        raise ValueError(f"未知の評価エンジンです: {engine}")
+    module, name = ENGINES[engine]
+    return getattr(import_module(f'.{module}', __package__), name)
+
+
+class Interpreter:
+    """グローバル環境を共有する評価セッション"""
+
+    def __init__(self, engine: str = 'tree', optimize: bool = False,
+                 limits: Optional[Limits] = None):
+        self._evaluate = load_engine(engine)
+        if limits is not None and engine != 'tree':
+            raise ValueError("資源の制限は tree エンジンでのみ使えます")
+        self.engine = engine
+        self.optimize = optimize
+        # トップレベルの式ごとに適用する資源の上限
+        self.limits = limits
+        # 定数畳み込みで取り除いたノードの累計
+        self.folded = 0
+        self.env = create_global_env()
+        if optimize:
+            from .optimizer import fold_constants
+            self._fold = fold_constants
+
+    def eval(self, expr: Any, source_map: Optional[SourceMap] = None) -> Any:
+        """S式をセッションのグローバル環境で評価
+
+        source_map を渡すと、エラーに発生位置 (file:line:col) の注記を付ける。
+        """
+        if type(expr) is PackedNode and source_map is None:
+            # パック済みのノードは自分の位置を持っているので、注記に使う
+            source_map = SourceMap(expr.ast.filename)
+        source = expr
+        try:
+            if self.optimize:
+                # 最適化後の式は新しいリストなので、位置は元の式から探す
+                expr, folded = self._fold(expr, self.env)
+                self.folded += folded
+            if self.limits is not None:
+                with self.limits:
+                    return self._run(source, expr, source_map)
+            return self._run(source, expr, source_map)
+        except Exception as e:
+            if source_map is not None:
+                source_map.annotate(e, source)
+            raise
+
+    def _run(self, source: Any, expr: Any,
+             source_map: Optional[SourceMap]) -> Any:
+        profiler = evaluator.PROFILER
+        if profiler is not None:
+            return profiler.form(source, expr, self._evaluate, self.env,
+                                 source_map)
+        return self._evaluate(expr, self.env)
+
+    def run(self, code: str, filename: str = '<string>') -> list[Any]:
+        """ソースコード中の全ての式を順に評価し、結果のリストを返す"""
+        source_map = SourceMap(filename)
+        return [self.eval(expr, source_map)
+                for expr in parse(tokenize(code), source_map)]
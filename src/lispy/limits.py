@@ -0,0 +1,132 @@
+"""
+LISPインタープリターの資源制限モジュール
+
+1回の評価で使える評価ステップ数・実行時間・リストの大きさ・入れ子の深さに
+上限を設け、超えたら ResourceExhausted を送出する。有効にしている間だけ
+evaluator.LIMITS に設定され、eval_lisp が式を評価するたびに数える。
+制限の対象はツリー評価器 (tree) のみ。
+"""
+
+from time import perf_counter
+from typing import Any, Optional
+
+from . import evaluator
+from .builtins import LazySeq
+
+# 実行時間を確認する間隔（評価ステップ数）
+CHECK_INTERVAL = 1000
+
+# Limits の引数になる上限の名前
+LIMIT_NAMES = ('max_steps', 'max_time', 'max_list_size', 'max_depth')
+
+
+class ResourceExhausted(RuntimeError):
+    """評価が資源の上限を超えた"""
+
+    def __init__(self, resource: str, limit: Any):
+        self.resource = resource
+        self.limit = limit
+        super().__init__(f"資源の上限を超えました: {resource} (上限 {limit})")
+
+
+class Limits:
+    """評価に使える資源の上限（None は無制限）
+
+    with 文の中でツリー評価器に上限が適用され、入るたびに使用量は 0 に戻る。
+    同時に有効にできるのは1つだけ。評価ステップは評価した式（ノード）の数。
+    ステップは残りが 0 になるまで数を減らすだけで、実行時間は
+    CHECK_INTERVAL ステップごとにだけ確認する。組み込み関数の1回の呼び出しの
+    途中では止まらないため、確実に止めるには別プロセスで評価して
+    タイムアウトさせる（lispy serve など）。
+    """
+
+    def __init__(self, max_steps: Optional[int] = None,
+                 max_time: Optional[float] = None,
+                 max_list_size: Optional[int] = None,
+                 max_depth: Optional[int] = None):
+        self.max_steps = max_steps
+        self.max_time = max_time
+        self.max_list_size = max_list_size
+        self.max_depth = max_depth
+        self.depth = 0
+        # 前回の確認までに数えたステップ数と、次の確認までの残り
+        self._counted = 0
+        self._interval = 0
+        self._countdown = 0
+        self._deadline: Optional[float] = None
+        self._max_depth = 0
+
+    @property
+    def steps(self) -> int:
+        """with 文に入ってから評価したステップ数"""
+        return self._counted + self._interval - self._countdown
+
+    def __enter__(self) -> 'Limits':
+        if evaluator.LIMITS is not None:
+            raise RuntimeError("他の資源の制限が有効になっています")
+        self.depth = 0
+        self._counted = 0
+        self._deadline = (perf_counter() + self.max_time
+                          if self.max_time is not None else None)
+        self._max_depth = (self.max_depth if self.max_depth is not None
+                           else float('inf'))
+        self._reset_countdown()
+        evaluator.LIMITS = self
+        return self
+
+    def __exit__(self, *exc_info):
+        if evaluator.LIMITS is not self:
+            raise RuntimeError("資源の制限が有効になっていません")
+        evaluator.LIMITS = None
+        return False
+
+    def enter(self):
+        """式の評価を始める（評価器から呼ばれる）
+
+        深さは評価器が式の評価を終えたときに 1 減らす。
+        """
+        self.depth += 1
+        self._countdown -= 1
+        if self._countdown <= 0:
+            self._checkpoint()
+        if self.depth > self._max_depth:
+            raise ResourceExhausted('depth', self.max_depth)
+
+    def _reset_countdown(self):
+        interval = CHECK_INTERVAL
+        if self.max_steps is not None:
+            # 上限を1つ超えたステップでちょうど確認する
+            interval = min(interval, self.max_steps - self._counted + 1)
+        self._interval = self._countdown = interval
+
+    def _checkpoint(self):
+        """カウントダウンが 0 になったときに上限を確認する"""
+        self._counted += self._interval
+        self._interval = self._countdown = 0
+        if self.max_steps is not None and self._counted > self.max_steps:
+            raise ResourceExhausted('steps', self.max_steps)
+        if self._deadline is not None and perf_counter() > self._deadline:
+            raise ResourceExhausted('time', self.max_time)
+        self._reset_countdown()
+
+    def check_size(self, value: Any) -> Any:
+        """値がリストの大きさの上限を超えていないか確認して、値を返す"""
+        if self.max_list_size is None:
+            return value
+        if type(value) is list:
+            size = len(value)
+        elif type(value) is LazySeq:
+            # 要素数が分かっている遅延シーケンスは、展開されたときの大きさで判定する
+            size = value._length
+            if size is None:
+                return value
+        else:
+            return value
+        if size > self.max_list_size:
+            raise ResourceExhausted('list_size', self.max_list_size)
+        return value
+
+    def as_dict(self) -> dict:
+        """上限を辞書で返す（設定されているものだけ）"""
+        return {name: getattr(self, name) for name in LIMIT_NAMES
+                if getattr(self, name) is not None}
@@ -5,29 +5,46 @@ This module provides the main LISP interpreter functionality including
 parsing, evaluation, and the REPL.
 """
 
-import argparse
-import re
 import sys
-from pathlib import Path
-from typing import Any
+from time import perf_counter
+from typing import Any, Iterable
 
-from prompt_toolkit import PromptSession
-from prompt_toolkit.history import FileHistory
-
-from .evaluator import eval_lisp
-from .parser import parse
-from .tokenizer import tokenize
+# 起動を速くするため、REPL の prompt_toolkit、引数解析の argparse、
+# ファイル実行だけで使うモジュールは必要になったときに読み込む
+from .interpreter import ENGINES, Interpreter
+from .parser import SourceMap, iter_parse, parse, parse_packed
+from .tokenizer import iter_tokens, iter_tokens_chunked, tokenize
 
 __version__ = "0.1.0"
 
 
-def run(code, debug=False):
-    """コードを実行する"""
-    tokens = tokenize(code)
+def run(code, debug=False, engine='tree', interpreter=None, optimize=False,
+        filename='<string>'):
+    """コードを実行する
+
+    interpreter を渡すとそのセッションのグローバル環境で評価し、
+    定義が呼び出しをまたいで保持される。
+    """
+    source_map = SourceMap(filename)
     if debug:
+        tokens = tokenize(code)
         print("tokens:", [str(token) for token in tokens])
+        s_expr: Iterable[Any] = parse(tokens, source_map)
+    else:
+        # トップレベルの式は閉じ括弧が来た時点で評価を始める
+        s_expr = iter_parse(iter_tokens(code), source_map)
+    return run_program(s_expr, debug, engine, interpreter, optimize,
+                       source_map)
+
+
+def run_program(s_expr, debug=False, engine='tree', interpreter=None,
+                optimize=False, source_map=None):
+    """パース済みのS式の列を実行する
 
-    s_expr: list[Any] = parse(tokens)
+    source_map を渡すと、エラーやデバッグ出力に式の位置 (file:line:col) を含める。
+    """
+    if interpreter is None:
+        interpreter = Interpreter(engine, optimize)
     if debug:
         print("s_expr:", [str(d) for d in s_expr])
 
@@ -35,28 +52,49 @@ def run(code, debug=False):
     results = []
     for expr in s_expr:
         if debug:
-            print(f"評価中: {expr}")
-        result = eval_lisp(expr)
+            location = None
+            if source_map is not None:
+                location = source_map.location(expr)
+            if location is not None:
+                print(f"評価中 ({location}): {expr}")
+            else:
+                print(f"評価中: {expr}")
+            if interpreter.engine == 'vm':
+                from .bytecode import compile_bytecode, disassemble
+                print(disassemble(compile_bytecode(expr)))
+        result = interpreter.eval(expr, source_map)
         if debug:
             print(f"評価結果: {result}")
         results.append(result)
 
+    if debug and interpreter.optimize:
+        print(f"定数畳み込み: {interpreter.folded} ノード")
+
     if len(results) == 1:
         return results[0]
     else:
         return '(' + ' '.join(str(r) for r in results) + ')'
 
 
-def run_file(filename, debug=False):
-    """ファイルを実行する"""
+def run_file(filename, debug=False, engine='tree', use_cache=True,
+             optimize=False, interpreter=None):
+    """ファイルを実行する
+
+    use_cache が真の場合、パース結果を __lspcache__ に保存し、
+    ソースが変わっていなければ次回はトークン化とパースを省略する。
+    """
+    from pathlib import Path
+
+    from . import cache
     try:
         file_path = Path(filename)
         if not file_path.exists():
             print(f"エラー: ファイル '{filename}' が見つかりません。", file=sys.stderr)
             return None
 
-        with open(file_path, 'r', encoding='utf-8') as f:
-            code = f.read()
+        with open(file_path, 'rb') as f:
+            source = f.read()
+        code = source.decode('utf-8')
 
         if debug:
             print(f"ファイル '{filename}' の内容:")
@@ -66,15 +104,77 @@ def run_file(filename, debug=False):
         else:
             print(f"ファイル '{filename}' を実行中...")
 
-        return run(code, debug)
+        if not use_cache:
+            return run(code, debug, engine, interpreter, optimize=optimize,
+                       filename=str(filename))
+
+        digest = cache.source_hash(source)
+        path = cache.cache_path(file_path)
+        cached = cache.load(path, digest)
+        if cached is None:
+            # パック済みASTは位置も持っているので、そのまま保存できる
+            s_expr = parse_packed(tokenize(code), str(filename))
+            cache.store(path, digest, s_expr)
+        else:
+            s_expr = cached
+            s_expr.filename = str(filename)
+            if debug:
+                print(f"キャッシュを使用: {path}")
+        return run_program(s_expr, debug, engine, interpreter,
+                           optimize=optimize,
+                           source_map=SourceMap(str(filename)))
+    except Exception as e:
+        print(f"ファイル実行エラー: {format_error(e)}", file=sys.stderr)
+        return None
+
+
+# ストリーミング実行で一度に読み込む文字数
+STREAM_CHUNK_SIZE = 1 << 16
+
+
+def run_stream(filename, debug=False, engine='tree', optimize=False,
+               interpreter=None):
+    """ファイルを少しずつ読み込みながら、式が揃うたびに評価する
+
+    結果は保持せずに捨てるため（debug 時は表示する）、メモリ使用量は
+    最大の式1つ分に比例する。評価した式の数を返す。
+    """
+    from pathlib import Path
+    try:
+        file_path = Path(filename)
+        if not file_path.exists():
+            print(f"エラー: ファイル '{filename}' が見つかりません。", file=sys.stderr)
+            return None
+
+        if interpreter is None:
+            interpreter = Interpreter(engine, optimize)
+        source_map = SourceMap(str(filename))
+        count = 0
+        with open(file_path, 'r', encoding='utf-8') as f:
+            chunks = iter(lambda: f.read(STREAM_CHUNK_SIZE), '')
+            for expr in iter_parse(iter_tokens_chunked(chunks), source_map):
+                result = interpreter.eval(expr, source_map)
+                # メモリ使用量を一定に保つため、評価し終えた式の位置は捨てる
+                source_map.clear()
+                if debug:
+                    print(f"評価結果: {result}")
+                count += 1
+        if debug and interpreter.optimize:
+            print(f"定数畳み込み: {interpreter.folded} ノード")
+        return count
     except Exception as e:
-        print(f"ファイル実行エラー: {e}", file=sys.stderr)
+        print(f"ファイル実行エラー: {format_error(e)}", file=sys.stderr)
         return None
 
 
 def repl():
     """対話式REPL"""
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.history import FileHistory
+
     session = PromptSession(history=FileHistory(".history"))
+    # REPLの全入力で同じグローバル環境を使い、defineした値を保持する
+    interpreter = Interpreter()
     print("LISPY REPL - 'exit' または 'quit' で終了")
     while True:
         try:
@@ -83,20 +183,74 @@ def repl():
                 print("Exiting lispy.")
                 break
             if code.strip():
-                result = run(code)
+                result = run(code, interpreter=interpreter, filename='<stdin>')
                 print(result)
         except (EOFError, KeyboardInterrupt):
             print("\nExiting lispy.")
             break
 
 
+def format_error(error):
+    """例外のメッセージに注記（発生位置など）を付けて整形"""
+    notes = getattr(error, '__notes__', None)
+    if not notes:
+        return str(error)
+    return '\n'.join([str(error), *(f"  {note}" for note in notes)])
+
+
+class StartupStats:
+    """起動にかかった時間を段階ごとに記録する（--startup-stats）"""
+
+    def __init__(self, main_started: float):
+        from . import _IMPORT_FINISHED, _IMPORT_STARTED
+        self.started = _IMPORT_STARTED
+        self.stages = [
+            ('lispy パッケージの読み込み', _IMPORT_FINISHED - _IMPORT_STARTED),
+            ('CLI モジュールの読み込み', main_started - _IMPORT_FINISHED),
+        ]
+        self._last = main_started
+
+    def mark(self, stage: str):
+        """前回の記録からこの段階までの時間を記録する"""
+        now = perf_counter()
+        self.stages.append((stage, now - self._last))
+        self._last = now
+
+    def report(self) -> str:
+        lines = ["起動時間:"]
+        for stage, seconds in self.stages:
+            lines.append(f"  {stage:<20} {seconds * 1000:9.3f} ms")
+        total = self._last - self.started
+        lines.append(f"  {'合計':<20} {total * 1000:9.3f} ms")
+        repl_loaded = 'あり' if 'prompt_toolkit' in sys.modules else 'なし'
+        lines.append(f"  読み込んだモジュール: {len(sys.modules)} 個 "
+                     f"(prompt_toolkit の読み込み: {repl_loaded})")
+        return '\n'.join(lines)
+
+
 def main():
 
 
     """メイン関数 - コマンドライン引数を処理"""
+    started = perf_counter()
+    if sys.argv[1:2] == ['bench']:
+        from .bench import main as bench_main
+        sys.exit(bench_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['serve']:
+        from .server import main as serve_main
+        sys.exit(serve_main(sys.argv[2:]))
+
+    import argparse
     parser = argparse.ArgumentParser(
         description='LISPY - Simple LISP Interpreter',
-        prog='lispy'
+        prog='lispy',
+        epilog=(
+            'ベンチマーク: lispy bench [--baseline FILE] '
+            '(詳細は lispy bench --help)\n'
+            '評価サーバー: lispy serve [--socket PATH] '
+            '(詳細は lispy serve --help)'
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter
     )
 
     parser.add_argument(
@@ -123,11 +277,117 @@ def main():
         help='詳細なデバッグ情報を表示する'
     )
 
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='ファイルを逐次読み込みながら式ごとに評価し、結果を保持しない'
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='ファイル実行時にパース結果のキャッシュ (.lspc) を使わない'
+    )
+
+    parser.add_argument(
+        '--optimize', '-O',
+        action='store_true',
+        help='評価前に定数畳み込みなどの最適化を行う'
+    )
+
+    parser.add_argument(
+        '--parallel',
+        type=int,
+        nargs='?',
+        const=0,
+        metavar='WORKERS',
+        help='組み込みの map をプロセスプールで並列実行する（WORKERS 省略時はCPU数）'
+    )
+
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='式ごと・関数ごとの実行時間を計測してレポートを表示する'
+    )
+
+    parser.add_argument(
+        '--profile-output',
+        type=str,
+        metavar='FILE',
+        help='プロファイル結果を collapsed stack 形式 (flamegraph 用) で書き出す'
+    )
+
+    parser.add_argument(
+        '--metrics',
+        action='store_true',
+        help='評価した式や組み込み関数の呼び出しの回数を Prometheus 形式で標準エラーに表示する'
+    )
+
+    parser.add_argument(
+        '--engine',
+        choices=sorted(ENGINES),
+        default='tree',
+        help='評価エンジンを選択する (デフォルト: tree)'
+    )
+
+    parser.add_argument(
+        '--startup-stats',
+        action='store_true',
+        help='モジュールの読み込みや環境の構築にかかった時間を標準エラーに表示する'
+    )
+
     args = parser.parse_args()
+    stats = StartupStats(started) if args.startup_stats else None
+    if stats is not None:
+        stats.mark('引数の解析')
+
+    if args.parallel is not None:
+        from .parallel import enable
+        enable(args.parallel or None)
+
+    profiler = None
+    if args.profile or args.profile_output:
+        from .profiler import Profiler
+        profiler = Profiler()
+        profiler.enable()
+    metrics = None
+    if args.metrics:
+        from .metrics import Metrics
+        metrics = Metrics()
+        metrics.enable()
+    try:
+        _run_mode(args, stats)
+    finally:
+        if metrics is not None:
+            metrics.disable()
+            print(metrics.prometheus(), end='', file=sys.stderr)
+        if profiler is not None:
+            profiler.disable()
+            print(profiler.report(), file=sys.stderr)
+            if args.profile_output:
+                profiler.write_collapsed(args.profile_output)
+        if stats is not None:
+            stats.mark('実行')
+            print(stats.report(), file=sys.stderr)
+
+
+def _run_mode(args, stats=None):
+    """コマンドライン引数に応じた実行モードで実行する"""
+    if args.file or args.eval:
+        interpreter = Interpreter(args.engine, args.optimize)
+        if stats is not None:
+            stats.mark('環境の構築')
 
     # ファイル実行モード
+    if args.file and args.stream:
+        if run_stream(args.file, args.debug, interpreter=interpreter) is None:
+            sys.exit(1)
+        print("実行完了")
+        return
+
     if args.file:
-        result = run_file(args.file, args.debug)
+        result = run_file(args.file, args.debug, use_cache=not args.no_cache,
+                          interpreter=interpreter)
         if result is None:
             sys.exit(1)
         print("実行完了")
@@ -136,11 +396,14 @@ def main():
     # コード直接実行モード
     if args.eval:
         try:
-            result = run(args.eval, args.debug)
+            result = run(args.eval, args.debug, interpreter=interpreter,
+                         filename='<eval>')
         except Exception as e:
-            print(f"実行エラー: {e}", file=sys.stderr)
+            print(f"実行エラー: {format_error(e)}", file=sys.stderr)
             sys.exit(1)
-        return    # デフォルト: REPLモード
+        return
+
+    # デフォルト: REPLモード
     repl()
 
 
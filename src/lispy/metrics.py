@@ -0,0 +1,181 @@
+"""
+LISPインタープリターのメトリクスモジュール
+
+評価した式の数、環境の変数検索がどのスコープの深さで見つからなかったか、
+環境とクロージャを作った数、組み込み関数ごとの呼び出し回数を数える。
+有効にしている間だけ evaluator.METRICS に設定され、eval_lisp と
+Environment・Procedure がそれぞれの処理の中で数える。結果は辞書か
+Prometheus のテキスト形式で取り出せる。計測の対象はツリー評価器 (tree) のみ
+（環境と変数検索の計数は全てのエンジンが対象）。
+"""
+
+from collections import Counter
+from typing import Any, Optional
+
+from . import evaluator
+from .builtins import GLOBALS
+from .evaluator import Environment
+
+# 組み込み関数（演算子を含む）の id -> 名前
+_BUILTIN_NAMES = {id(func): str(name) for name, func in GLOBALS.items()}
+
+# 変数が見つかったスコープの深さのヒストグラムのバケット（0 は最も内側）
+LOOKUP_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16)
+
+# 単純な計数器の名前と Prometheus の説明
+_COUNTERS = (
+    ('evaluated_nodes', "ツリー評価器で評価した式の数"),
+    ('lookups', "変数の検索回数"),
+    ('undefined_lookups', "未定義の変数の検索回数"),
+    ('defines', "環境への変数の定義回数"),
+    ('environments', "作成した環境の数"),
+    ('closures', "作成したクロージャ（lambda）の数"),
+)
+
+
+class Metrics:
+    """評価器の計数器とヒストグラム
+
+    enable() から disable() までの間（または with 文の中）の評価を数える。
+    同時に有効にできるのは1つだけ。
+    """
+
+    def __init__(self):
+        # 変数が見つかったスコープの深さ -> 回数
+        self.lookup_depths: Counter = Counter()
+        # スコープの深さ -> その深さで見つからなかった回数
+        self.lookup_misses: Counter = Counter()
+        # 組み込み関数の名前 -> 呼び出し回数
+        self.builtin_calls: Counter = Counter()
+        self._enabled = False
+        self.reset()
+
+    def reset(self):
+        """全ての計数を 0 に戻す"""
+        self.evaluated_nodes = 0
+        self.undefined_lookups = 0
+        self.defines = 0
+        self.environments = 0
+        self.closures = 0
+        self.lookup_depths.clear()
+        self.lookup_misses.clear()
+        self.builtin_calls.clear()
+
+    @property
+    def lookups(self) -> int:
+        """変数の検索回数"""
+        return sum(self.lookup_depths.values()) + self.undefined_lookups
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def enable(self):
+        """評価器に計測を設定する"""
+        if self.enabled:
+            return
+        if evaluator.METRICS is not None:
+            raise RuntimeError("他のメトリクスの計測が有効になっています")
+        evaluator.METRICS = self
+        self._enabled = True
+
+    def disable(self):
+        """評価器から計測を外す"""
+        if not self.enabled:
+            return
+        if evaluator.METRICS is not self:
+            raise RuntimeError("評価器に設定されているメトリクスが違います")
+        evaluator.METRICS = None
+        self._enabled = False
+
+    def __enter__(self) -> 'Metrics':
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+        return False
+
+    def call(self, func: Any):
+        """呼び出される関数が組み込み関数なら回数を数える（評価器から呼ばれる）"""
+        name = _BUILTIN_NAMES.get(id(func))
+        if name is not None:
+            self.builtin_calls[name] += 1
+
+    def count_lookup(self, env: Environment, found: Optional[Environment]):
+        """変数の検索を数える（Environment.lookup から呼ばれる）
+
+        found は変数が見つかった環境。見つからなければ None。
+        """
+        depth = 0
+        while env is not found:
+            self.lookup_misses[depth] += 1
+            env = env.parent
+            depth += 1
+        if found is None:
+            self.undefined_lookups += 1
+        else:
+            self.lookup_depths[depth] += 1
+
+    def merge(self, data: dict):
+        """as_dict() の結果（別プロセスの計測結果など）を足し合わせる"""
+        for name, _ in _COUNTERS:
+            if name != 'lookups':
+                setattr(self, name, getattr(self, name) + data.get(name, 0))
+        for name in ('lookup_depths', 'lookup_misses'):
+            counter = getattr(self, name)
+            for depth, count in data.get(name, {}).items():
+                counter[int(depth)] += count
+        self.builtin_calls.update(data.get('builtin_calls', {}))
+
+    def as_dict(self) -> dict:
+        """計測結果を辞書で返す"""
+        result = {name: getattr(self, name) for name, _ in _COUNTERS}
+        result['lookup_depths'] = dict(sorted(self.lookup_depths.items()))
+        result['lookup_misses'] = dict(sorted(self.lookup_misses.items()))
+        result['builtin_calls'] = dict(self.builtin_calls.most_common())
+        return result
+
+    def prometheus(self, prefix: str = 'lispy') -> str:
+        """計測結果を Prometheus のテキスト形式で返す"""
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        def sample(name, value, label=''):
+            lines.append(f"{prefix}_{name}{label} {value}")
+
+        for name, help_text in _COUNTERS:
+            header(f"{name}_total", 'counter', help_text)
+            sample(f"{name}_total", getattr(self, name))
+
+        header('lookup_misses_total', 'counter',
+               "スコープの深さごとの変数が見つからなかった回数")
+        for depth, count in sorted(self.lookup_misses.items()):
+            sample('lookup_misses_total', count, f'{{depth="{depth}"}}')
+
+        header('lookup_depth', 'histogram',
+               "変数が見つかったスコープの深さ（0 は最も内側）")
+        depths = self.lookup_depths.items()
+        for bound in LOOKUP_DEPTH_BUCKETS:
+            cumulative = sum(count for depth, count in depths
+                             if depth <= bound)
+            sample('lookup_depth_bucket', cumulative, f'{{le="{bound}"}}')
+        found = sum(self.lookup_depths.values())
+        sample('lookup_depth_bucket', found, '{le="+Inf"}')
+        sample('lookup_depth_sum',
+               sum(depth * count for depth, count in depths))
+        sample('lookup_depth_count', found)
+
+        header('builtin_calls_total', 'counter', "組み込み関数ごとの呼び出し回数")
+        for name, count in sorted(self.builtin_calls.items()):
+            sample('builtin_calls_total', count,
+                   f'{{name="{_label_value(name)}"}}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label_value(value: str) -> str:
+    """Prometheus のラベル値のエスケープ"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
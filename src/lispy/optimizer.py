@@ -0,0 +1,179 @@
+"""
+LISPインタープリターの最適化モジュール
+
+パース済みのS式に対して評価前に定数畳み込みと部分評価を行う
+"""
+
+from typing import Any, Optional
+
+from .builtins import GLOBALS, OPERATORS
+from .evaluator import Environment, expand_defmemo
+from .packed import PackedNode
+from .symbols import (DEFINE, FOR, IF, LAMBDA, LET, StringLiteral,
+                      is_string_literal)
+
+# 副作用がなく、定数引数に対して事前に計算してよい関数
+PURE_FUNCTIONS = frozenset(OPERATORS) | {
+    'sin', 'cos', 'sqrt', 'str', 'concat', 'length', 'and', 'or', 'not',
+}
+
+
+def fold_constants(expr: Any,
+                   env: Optional[Environment] = None) -> tuple[Any, int]:
+    """S式を最適化し、(最適化後のS式, 畳み込んだノード数) を返す
+
+    - 定数引数に対する純粋な組み込み関数の呼び出しを計算結果に置き換える
+    - 条件が定数の if を該当する分岐に置き換える
+    - let で定数に束縛された変数を本体に埋め込む
+
+    env を渡すと、その環境で組み込み関数が再定義されていないかを確認する。
+    """
+    folder = _Folder(env, _defined_names(expr))
+    result = folder.fold(expr, {}, frozenset())
+    return result, folder.count
+
+
+def is_constant(expr: Any) -> bool:
+    """S式がリテラル定数かどうか"""
+    if isinstance(expr, (int, float)):
+        return True
+    return is_string_literal(expr)
+
+
+def _constant_value(expr: Any) -> Any:
+    return expr[1] if isinstance(expr, tuple) else expr
+
+
+def _to_literal(value: Any) -> Any:
+    """値をS式のリテラルに変換する。表現できなければ None"""
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        return StringLiteral(value)
+    return None
+
+
+def _defined_names(expr: Any) -> set:
+    """式の中で define される全ての名前を集める"""
+    names = set()
+    stack = [expr]
+    while stack:
+        item = stack.pop()
+        if type(item) is PackedNode:
+            item = item.children()
+        if isinstance(item, list) and item:
+            if item[0] in ('define', 'defmemo') and len(item) >= 3:
+                names.add(item[1])
+            stack.extend(item)
+    return names
+
+
+class _Folder:
+    """定数畳み込みの状態（畳み込んだ数と再定義された名前）"""
+
+    def __init__(self, env: Optional[Environment], defined: set):
+        self.env = env
+        self.defined = defined
+        self.count = 0
+
+    def is_pure(self, name: Any, shadowed: frozenset) -> bool:
+        """名前が再定義されていない純粋な組み込み関数を指すか"""
+        if not isinstance(name, str) or name not in PURE_FUNCTIONS:
+            return False
+        if name in shadowed or name in self.defined:
+            return False
+        if self.env is not None:
+            return self.env.bindings.get(name) is GLOBALS[name]
+        return True
+
+    def fold(self, expr: Any, consts: dict, shadowed: frozenset) -> Any:
+        # シンボル（letで定数に束縛された変数は値に置き換える）
+        if isinstance(expr, str):
+            if expr in consts:
+                self.count += 1
+                return consts[expr]
+            return expr
+
+        # パック済みASTのノードは子のリストを畳み込む（結果は新しいリスト）
+        if type(expr) is PackedNode:
+            expr = expr.children()
+        if not isinstance(expr, list) or not expr:
+            return expr
+
+        head = expr[0]
+        if head == 'if' and len(expr) == 4:
+            condition = self.fold(expr[1], consts, shadowed)
+            if is_constant(condition):
+                self.count += 1
+                branch = expr[2] if _constant_value(condition) else expr[3]
+                return self.fold(branch, consts, shadowed)
+            return [IF, condition,
+                    self.fold(expr[2], consts, shadowed),
+                    self.fold(expr[3], consts, shadowed)]
+
+        if head == 'define' and len(expr) == 3:
+            return [DEFINE, expr[1], self.fold(expr[2], consts, shadowed)]
+
+        if head == 'defmemo' and len(expr) == 4:
+            return self.fold(expand_defmemo(expr), consts, shadowed)
+
+        if head == 'let' and len(expr) >= 3 and _valid_bindings(expr[1]):
+            return self.fold_let(expr, consts, shadowed)
+
+        if head == 'for' and len(expr) == 5:
+            var_name = expr[1]
+            inner = {k: v for k, v in consts.items() if k != var_name}
+            return [FOR, var_name,
+                    self.fold(expr[2], consts, shadowed),
+                    self.fold(expr[3], consts, shadowed),
+                    self.fold(expr[4], inner, shadowed | {var_name})]
+
+        if (head == 'lambda' and len(expr) == 3
+                and isinstance(expr[1], (list, PackedNode))):
+            params = list(expr[1])
+            inner = {k: v for k, v in consts.items() if k not in params}
+            return [LAMBDA, params,
+                    self.fold(expr[2], inner, shadowed | set(params))]
+
+        # 関数呼び出し
+        items = [self.fold(item, consts, shadowed) for item in expr]
+        if not self.is_pure(head, shadowed):
+            return items
+        args = items[1:]
+        if not all(is_constant(arg) for arg in args):
+            return items
+        try:
+            value = GLOBALS[head](*[_constant_value(arg) for arg in args])
+        except Exception:
+            # エラーは実行時に通常どおり報告させる
+            return items
+        literal = _to_literal(value)
+        if literal is None:
+            return items
+        self.count += 1
+        return literal
+
+    def fold_let(self, expr: list, consts: dict, shadowed: frozenset) -> list:
+        names = [binding[0] for binding in expr[1]]
+        inner = {k: v for k, v in consts.items() if k not in names}
+        bindings = []
+        for var_name, var_value in expr[1]:
+            value = self.fold(var_value, consts, shadowed)
+            # 再定義されない定数の束縛は本体に埋め込んで取り除く
+            if (is_constant(value) and var_name not in self.defined and
+                    names.count(var_name) == 1):
+                self.count += 1
+                inner[var_name] = value
+            else:
+                bindings.append([var_name, value])
+        inner_shadowed = shadowed | set(names)
+        body = [self.fold(body_expr, inner, inner_shadowed)
+                for body_expr in expr[2:]]
+        return [LET, bindings, *body]
+
+
+def _valid_bindings(bindings: Any) -> bool:
+    return isinstance(bindings, (list, PackedNode)) and all(
+        isinstance(binding, (list, PackedNode)) and len(binding) == 2
+        for binding in bindings
+    )
@@ -0,0 +1,293 @@
+"""
+LISPインタープリターのパック済みASTモジュール
+
+S式をリストの入れ子ではなく整数の配列と定数プールで表現する。ノードは
+前順（親が子より先）に並び、1ノードあたり (種類, 値, 部分木のノード数) の
+3つの整数を持つ。リストの値は子の数、それ以外の値は定数プールの番号。
+配列はそのままファイルに書き出せるため、キャッシュから mmap で読み込める。
+"""
+
+import sys
+from array import array
+from typing import Any, Iterator, Optional
+
+# ノードの種類
+LIST = 0
+ATOM = 1
+
+# 1ノードあたりの整数の数 (種類, 値, 部分木のノード数)
+NODE_WIDTH = 3
+
+# ヘッダーの長さの形式。struct/pickle/mmap は書き出しと読み込みでしか
+# 使わないので、起動を速くするためにそのときに読み込む
+_HEADER_FORMAT = '<I'
+
+
+class PackedAST:
+    """パック済みのS式の列（プログラム全体）"""
+
+    __slots__ = ('nodes', 'positions', 'roots', 'consts', 'filename',
+                 '_buffer')
+
+    def __init__(self, nodes: Any, positions: Any, roots: Any, consts: list,
+                 filename: str = '<string>', buffer: Any = None):
+        # nodes/positions/roots は array('i') か、mmap を cast した memoryview
+        self.nodes = nodes
+        # 各ノードの (行, 列)。不明なら 0
+        self.positions = positions
+        # トップレベルの式のノード番号
+        self.roots = roots
+        self.consts = consts
+        self.filename = filename
+        # mmap で読み込んだ場合、配列が参照するバッファ
+        self._buffer = buffer
+
+    def __len__(self) -> int:
+        return len(self.roots)
+
+    def __iter__(self) -> Iterator[Any]:
+        for root in self.roots:
+            yield self.node(root)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.nodes) // NODE_WIDTH
+
+    def node(self, index: int) -> Any:
+        """ノード番号の値（リストなら PackedNode、それ以外は定数）"""
+        base = index * NODE_WIDTH
+        if self.nodes[base] == LIST:
+            return PackedNode(self, index)
+        return self.consts[self.nodes[base + 1]]
+
+    def position(self, index: int) -> Optional[tuple[int, int]]:
+        """ノードの (行, 列)。記録されていなければ None"""
+        line = self.positions[index * 2]
+        if not line:
+            return None
+        return line, self.positions[index * 2 + 1]
+
+    def unpack(self, index: int, source_map: Any = None) -> Any:
+        """ノードを通常のS式（リストの入れ子）に展開する
+
+        source_map を渡すと、展開したリストの位置を記録する。
+        """
+        nodes = self.nodes
+        consts = self.consts
+        if nodes[index * NODE_WIDTH] != LIST:
+            return consts[nodes[index * NODE_WIDTH + 1]]
+
+        # 再帰を使わずに展開する（スタックには (リスト, 残りの子の数) を積む）
+        root: list = []
+        stack = [(root, nodes[index * NODE_WIDTH + 1])]
+        if source_map is not None:
+            self._record(source_map, root, index)
+        current = index + 1
+        while stack:
+            parent, remaining = stack[-1]
+            if not remaining:
+                stack.pop()
+                continue
+            stack[-1] = (parent, remaining - 1)
+            base = current * NODE_WIDTH
+            if nodes[base] == LIST:
+                child: list = []
+                parent.append(child)
+                stack.append((child, nodes[base + 1]))
+                if source_map is not None:
+                    self._record(source_map, child, current)
+            else:
+                parent.append(consts[nodes[base + 1]])
+            current += 1
+        return root
+
+    def _record(self, source_map: Any, node: list, index: int):
+        position = self.position(index)
+        if position is not None:
+            source_map.add(node, *position)
+
+    def to_bytes(self) -> bytes:
+        """ファイルに書き出す形式に変換する
+
+        ヘッダー（長さ + pickle した定数プールなど）に続けて、先頭から4バイト
+        境界に揃えた roots/nodes/positions の配列をそのまま並べる。
+        """
+        import pickle
+        import struct
+        header = pickle.dumps(
+            (sys.byteorder, len(self.roots), len(self.nodes),
+             len(self.positions), self.consts, self.filename),
+            protocol=pickle.HIGHEST_PROTOCOL)
+        size = struct.calcsize(_HEADER_FORMAT)
+        padding = b'\0' * (-(len(header) + size) % 4)
+        return b''.join([
+            struct.pack(_HEADER_FORMAT, len(header)), header, padding,
+            _to_array(self.roots).tobytes(),
+            _to_array(self.nodes).tobytes(),
+            _to_array(self.positions).tobytes(),
+        ])
+
+    @classmethod
+    def from_buffer(cls, buffer: Any, offset: int = 0) -> 'PackedAST':
+        """to_bytes の形式のバッファから配列をコピーせずに読み込む"""
+        import pickle
+        import struct
+        view = memoryview(buffer)
+        (header_size,) = struct.unpack_from(_HEADER_FORMAT, view, offset)
+        start = offset + struct.calcsize(_HEADER_FORMAT)
+        byteorder, nroots, nnodes, npositions, consts, filename = pickle.loads(
+            view[start:start + header_size])
+        if byteorder != sys.byteorder:
+            raise ValueError("バイトオーダーが異なるため読み込めません")
+        start += header_size
+        start += -(start - offset) % 4
+        arrays = []
+        for length in (nroots, nnodes, npositions):
+            size = length * 4
+            arrays.append(view[start:start + size].cast('i'))
+            start += size
+        roots, nodes, positions = arrays
+        return cls(nodes, positions, roots, consts, filename, buffer)
+
+    @classmethod
+    def load(cls, path: Any, offset: int = 0) -> 'PackedAST':
+        """ファイルを mmap して読み込む"""
+        import mmap
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_buffer(mapped, offset)
+
+
+class PackedNode:
+    """パック済みASTのリストのノード
+
+    リストと同じように長さ・添字・スライス・反復で子を参照できるため、
+    コンパイラはリストに展開せずにそのままたどれる。
+    """
+
+    __slots__ = ('ast', 'index', '_children')
+
+    def __init__(self, ast: PackedAST, index: int):
+        self.ast = ast
+        self.index = index
+        self._children: Optional[list] = None
+
+    def children(self) -> list:
+        """子の値のリスト（子のリストは PackedNode のまま）"""
+        if self._children is None:
+            ast = self.ast
+            nodes = ast.nodes
+            children = []
+            current = self.index + 1
+            for _ in range(nodes[self.index * NODE_WIDTH + 1]):
+                children.append(ast.node(current))
+                current += nodes[current * NODE_WIDTH + 2]
+            self._children = children
+        return self._children
+
+    def __len__(self) -> int:
+        return self.ast.nodes[self.index * NODE_WIDTH + 1]
+
+    def __getitem__(self, key: Any) -> Any:
+        return self.children()[key]
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.children())
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (list, PackedNode)):
+            if isinstance(other, PackedNode):
+                other = other.unpack()
+            return self.unpack() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def position(self) -> Optional[tuple[int, int]]:
+        return self.ast.position(self.index)
+
+    def unpack(self, source_map: Any = None) -> list:
+        """通常のS式（リストの入れ子）に展開する"""
+        return self.ast.unpack(self.index, source_map)
+
+    def __repr__(self) -> str:
+        return repr(self.unpack())
+
+
+class PackedBuilder:
+    """前順にノードを追加してパック済みASTを組み立てる"""
+
+    def __init__(self, filename: str = '<string>'):
+        self.nodes = array('i')
+        self.positions = array('i')
+        self.roots = array('i')
+        self.consts: list = []
+        self.filename = filename
+        self._const_index: dict = {}
+        # 閉じていないリストのノード番号
+        self._open: list[int] = []
+
+    def _append(self, kind: int, value: int, line: int, column: int) -> int:
+        index = len(self.nodes) // NODE_WIDTH
+        if self._open:
+            # 親の子の数を1つ増やす
+            self.nodes[self._open[-1] * NODE_WIDTH + 1] += 1
+        else:
+            self.roots.append(index)
+        self.nodes.extend((kind, value, 1))
+        self.positions.extend((line, column))
+        return index
+
+    def atom(self, value: Any, line: int = 0, column: int = 0):
+        """リスト以外の値を追加"""
+        key = (type(value), value)
+        index = self._const_index.get(key)
+        if index is None:
+            index = self._const_index[key] = len(self.consts)
+            self.consts.append(value)
+        self._append(ATOM, index, line, column)
+
+    def open(self, line: int = 0, column: int = 0):
+        """リストを開始"""
+        self._open.append(self._append(LIST, 0, line, column))
+
+    def close(self):
+        """最も内側のリストを閉じる"""
+        index = self._open.pop()
+        size = len(self.nodes) // NODE_WIDTH - index
+        self.nodes[index * NODE_WIDTH + 2] = size
+
+    @property
+    def depth(self) -> int:
+        """閉じていないリストの数"""
+        return len(self._open)
+
+    def build(self) -> PackedAST:
+        return PackedAST(self.nodes, self.positions, self.roots, self.consts,
+                         self.filename)
+
+
+def pack(program: list[Any], filename: str = '<string>') -> PackedAST:
+    """通常のS式の列をパック済みASTに変換"""
+    builder = PackedBuilder(filename)
+    for expr in program:
+        # リストの終わりに閉じる印を積み、再帰を使わずにたどる
+        stack: list = [expr]
+        while stack:
+            item = stack.pop()
+            if item is _CLOSE:
+                builder.close()
+            elif isinstance(item, list):
+                builder.open()
+                stack.append(_CLOSE)
+                stack.extend(reversed(item))
+            else:
+                builder.atom(item)
+    return builder.build()
+
+
+_CLOSE = object()
+
+
+def _to_array(values: Any) -> array:
+    return values if isinstance(values, array) else array('i', values)
@@ -0,0 +1,233 @@
+"""
+LISPインタープリターの並列実行モジュール
+
+map/filter をプロセスプールで並列に実行する。評価器が作る関数は
+pickle できないため、lambda のソース（引数と本体）と捕捉した変数を
+ワーカーに送り、ワーカー側で関数を組み立て直す。
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+from . import builtins
+from .builtins import GLOBALS, LazySeq
+from .evaluator import (Environment, Procedure, create_global_env,
+                        expand_defmemo)
+from .packed import PackedNode
+
+# 特殊形式の名前（自由変数として扱わない）
+_SPECIAL_FORMS = frozenset({'if', 'define', 'defmemo', 'let', 'for', 'lambda'})
+
+_executor: Optional[ProcessPoolExecutor] = None
+_max_workers: Optional[int] = None
+# 並列map を有効にしたとき、これより短いリストは逐次処理する
+_threshold = 1000
+
+
+class ProcedureSpec:
+    """ワーカーに送る関数の表現（ソースと捕捉した変数）"""
+
+    __slots__ = ('params', 'body', 'captured')
+
+    def __init__(self, params: list, body: Any):
+        self.params = params
+        self.body = body
+        self.captured: dict = {}
+
+    def __getstate__(self):
+        return self.params, self.body, self.captured
+
+    def __setstate__(self, state):
+        self.params, self.body, self.captured = state
+
+
+class BuiltinSpec:
+    """組み込み関数は名前で送る"""
+
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getstate__(self):
+        return self.name
+
+    def __setstate__(self, state):
+        self.name = state
+
+
+class NotShippable(Exception):
+    """ワーカーに送れない値"""
+
+
+def pmap(func: Any, lst: Any) -> list:
+    """リストの各要素に関数を並列に適用する"""
+    items = list(lst)
+    spec = _ship_or_none(func)
+    if spec is None or len(items) < 2:
+        return [func(x) for x in items]
+    return _run_chunks('map', spec, items)
+
+
+def pfilter(func: Any, lst: Any) -> list:
+    """条件を満たす要素を並列に選択する"""
+    items = list(lst)
+    spec = _ship_or_none(func)
+    if spec is None or len(items) < 2:
+        return [x for x in items if func(x)]
+    return _run_chunks('filter', spec, items)
+
+
+def enable(max_workers: Optional[int] = None, threshold: int = 1000):
+    """組み込みの map を並列実行に切り替える"""
+    global _max_workers, _threshold
+    _max_workers = max_workers
+    _threshold = threshold
+    builtins.PARALLEL_MAP = _parallel_map
+
+
+def disable():
+    """組み込みの map を逐次実行に戻し、プロセスプールを終了する"""
+    global _executor
+    builtins.PARALLEL_MAP = None
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+def _parallel_map(func: Any, lst: Any) -> list:
+    lst = list(lst)
+    if len(lst) < _threshold:
+        return [func(x) for x in lst]
+    return pmap(func, lst)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=_max_workers)
+    return _executor
+
+
+def _run_chunks(kind: str, spec: Any, items: list) -> list:
+    executor = _get_executor()
+    workers = _max_workers or os.cpu_count() or 1
+    # ワーカーあたり数個のチャンクに分けて負荷の偏りをならす
+    size = max(1, math.ceil(len(items) / (workers * 4)))
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    results = []
+    for part in executor.map(_run_chunk, [kind] * len(chunks),
+                             [spec] * len(chunks), chunks):
+        results.extend(part)
+    return results
+
+
+def _run_chunk(kind: str, spec: Any, chunk: list) -> list:
+    """ワーカープロセスでチャンクを処理する"""
+    func = _rebuild(spec, create_global_env(), {})
+    if kind == 'map':
+        return [func(x) for x in chunk]
+    return [x for x in chunk if func(x)]
+
+
+def _ship_or_none(func: Any) -> Any:
+    try:
+        return ship(func)
+    except NotShippable:
+        return None
+
+
+def ship(value: Any, memo: Optional[dict] = None) -> Any:
+    """値をワーカーに送れる形式に変換する
+
+    関数の本体が参照する自由変数は定義時の環境から値を取り出して一緒に送る。
+    再帰関数のように自分自身を参照する場合も memo で循環を保つ。
+    """
+    if memo is None:
+        memo = {}
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    if isinstance(value, (list, LazySeq)):
+        return [ship(item, memo) for item in value]
+    if type(value) is Procedure:
+        key = id(value)
+        if key in memo:
+            return memo[key]
+        body = value.body
+        if type(body) is PackedNode:
+            # パック済みASTは mmap を参照することがあるので展開して送る
+            body = body.unpack()
+        spec = ProcedureSpec(value.params, body)
+        memo[key] = spec
+        for name in sorted(_free_variables(body, set(value.params))):
+            try:
+                captured = value.env.lookup(name)
+            except NameError:
+                continue
+            if GLOBALS.get(name) is captured:
+                # ワーカーにも同じ組み込み関数がある
+                continue
+            spec.captured[name] = ship(captured, memo)
+        return spec
+    for name, builtin in GLOBALS.items():
+        if builtin is value:
+            return BuiltinSpec(name)
+    raise NotShippable(f"並列実行のためにワーカーへ送れない値です: {value!r}")
+
+
+def _rebuild(value: Any, global_env: Environment, memo: dict) -> Any:
+    """ship で変換した値をワーカー側の値に戻す"""
+    if isinstance(value, list):
+        return [_rebuild(item, global_env, memo) for item in value]
+    if isinstance(value, BuiltinSpec):
+        return global_env.lookup(value.name)
+    if isinstance(value, ProcedureSpec):
+        key = id(value)
+        if key in memo:
+            return memo[key]
+        env = Environment(parent=global_env)
+        procedure = Procedure(value.params, value.body, env)
+        memo[key] = procedure
+        for name, captured in value.captured.items():
+            env.define(name, _rebuild(captured, global_env, memo))
+        return procedure
+    return value
+
+
+def _free_variables(expr: Any, bound: set, found: Optional[set] = None) -> set:
+    """式の中で束縛されていない変数名を集める"""
+    if found is None:
+        found = set()
+    if isinstance(expr, str):
+        if expr not in bound:
+            found.add(expr)
+        return found
+    if not isinstance(expr, list) or not expr:
+        return found
+
+    head = expr[0]
+    if head == 'let' and len(expr) >= 3:
+        names = set()
+        for binding in expr[1]:
+            if isinstance(binding, list) and len(binding) == 2:
+                names.add(binding[0])
+                _free_variables(binding[1], bound, found)
+        for body_expr in expr[2:]:
+            _free_variables(body_expr, bound | names, found)
+    elif head == 'lambda' and len(expr) == 3:
+        _free_variables(expr[2], bound | set(expr[1]), found)
+    elif head == 'for' and len(expr) == 5:
+        _free_variables(expr[2], bound, found)
+        _free_variables(expr[3], bound, found)
+        _free_variables(expr[4], bound | {expr[1]}, found)
+    elif head == 'defmemo' and len(expr) == 4:
+        _free_variables(expand_defmemo(expr), bound, found)
+    elif head == 'define' and len(expr) == 3:
+        _free_variables(expr[2], bound | {expr[1]}, found)
+    else:
+        start = 1 if head in _SPECIAL_FORMS else 0
+        for item in expr[start:]:
+            _free_variables(item, bound, found)
+    return found
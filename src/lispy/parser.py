@@ -4,8 +4,11 @@ LISPインタープリターのパーサーモジュール
 トークンをS式に変換する
 """
 
-from typing import Any
+from array import array
+from typing import Any, Iterable, Iterator, Optional
 
+from .packed import ATOM, LIST, NODE_WIDTH, PackedAST, PackedNode
+from .symbols import SYMBOL_TABLE, StringLiteral, Symbol
 from .tokenizer import Token, TokenKind
 
 
@@ -13,54 +16,231 @@ class ParseError(Exception):
     """パースエラー"""
 
 
-def parse(tokens: list[Token]) -> list[Any]:
-    """トークンリストをS式リストに変換"""
-    if not tokens:
-        return []
-
-    expressions = []
-    i = 0
-
-    while i < len(tokens):
-        expr, i = parse_expression(tokens, i)
-        expressions.append(expr)
-
-    return expressions
-
-
-def parse_expression(tokens: list[Token], start: int) -> tuple[Any, int]:
-    """単一の式をパースする"""
-    if start >= len(tokens):
-        raise ParseError("Unexpected end of input")
-
-    token = tokens[start]
-
+class SourceMap:
+    """リストのノードからソース上の位置（行・列）への対応表
+
+    ノード自体は素のリストのままにして、位置は id をキーにした別の表に記録する。
+    評価器は位置を参照しないため、位置の記録は評価の速度に影響しない。
+    """
+
+    __slots__ = ('filename', '_spans')
+
+    def __init__(self, filename: str = '<string>'):
+        self.filename = filename
+        # id(ノード) -> (ノード, 行, 列)。ノードを保持して id の再利用を防ぐ
+        self._spans: dict[int, tuple[list, int, int]] = {}
+
+    def add(self, node: list, line: int, column: int):
+        """ノードの開き括弧の位置を記録"""
+        self._spans[id(node)] = (node, line, column)
+
+    def position(self, node: Any) -> Optional[tuple[int, int]]:
+        """ノードの (行, 列)。記録されていなければ None"""
+        entry = self._spans.get(id(node))
+        if entry is not None and entry[0] is node:
+            return entry[1], entry[2]
+        if type(node) is PackedNode:
+            # パック済みASTのノードは自分の位置を持っている
+            return node.position()
+        return None
+
+    def location(self, node: Any) -> Optional[str]:
+        """ノードの位置を file:line:col の形式で返す"""
+        position = self.position(node)
+        if position is None:
+            return None
+        return f"{self.filename}:{position[0]}:{position[1]}"
+
+    def annotate(self, error: BaseException, node: Any):
+        """例外に発生位置を注記として追加する
+
+        トレースバックをたどり、評価中だった式（ローカル変数 expr）のうち
+        位置が分かる最も内側のものを使う。見つからなければ node の位置を使う。
+        パック済みのノードを評価中のフレームでは、ローカル変数 packed の
+        ノードの位置を使う。
+        """
+        located = self.location(node)
+        tb = error.__traceback__
+        while tb is not None:
+            local_vars = tb.tb_frame.f_locals
+            expr = local_vars.get('expr')
+            if isinstance(expr, list):
+                location = self.location(expr)
+                packed = local_vars.get('packed')
+                if (location is None and type(packed) is PackedNode
+                        and packed.children() is expr):
+                    # 評価器はパック済みのノードの子のリストを評価している
+                    location = self.location(packed)
+                if location is not None:
+                    located = location
+            elif type(expr) is PackedNode:
+                located = self.location(expr) or located
+            tb = tb.tb_next
+        if located is not None:
+            error.add_note(f"場所: {located}")
+
+    def clear(self):
+        """記録した位置を全て削除"""
+        self._spans.clear()
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __getstate__(self):
+        # プログラムと一緒に pickle すればノードの同一性が保たれる
+        return self.filename, list(self._spans.values())
+
+    def __setstate__(self, state):
+        self.filename, spans = state
+        self._spans = {id(node): (node, line, column)
+                       for node, line, column in spans}
+
+
+def parse(tokens: Iterable[Token],
+          source_map: Optional[SourceMap] = None) -> list[Any]:
+    """トークン列をS式リストに変換"""
+    return list(iter_parse(tokens, source_map))
+
+
+def iter_parse(tokens: Iterable[Token],
+               source_map: Optional[SourceMap] = None) -> Iterator[Any]:
+    """トークン列を読み進め、トップレベルの式が完成するたびに返す
+
+    再帰を使わず明示的なスタックで入れ子を管理するため、
+    深い入れ子でもPythonの再帰上限に達しない。
+    source_map を渡すと、各リストの開き括弧の位置を記録する。
+    """
+    # 閉じていないリストのスタック（末尾が最も内側）
+    stack: list[list[Any]] = []
+    # 各リストの開き括弧のトークン
+    opened: list[Token] = []
+    symbols = SYMBOL_TABLE
+
+    for token in tokens:
+        kind = token.kind
+        if kind is TokenKind.LPAREN:
+            node: list[Any] = []
+            stack.append(node)
+            opened.append(token)
+            if source_map is not None:
+                source_map.add(node, token.line, token.column)
+            continue
+
+        if kind is TokenKind.RPAREN:
+            if not stack:
+                raise _error(f"Unexpected token: {token}", token, source_map)
+            expr = stack.pop()
+            opened.pop()
+        elif kind is TokenKind.SYMBOL or kind is TokenKind.OPERATOR:
+            # 既にインターンされたシンボルは表から直接取り出す
+            expr = symbols.get(token.value) or Symbol(token.value)
+        elif kind is TokenKind.STRING:
+            expr = _new_literal(StringLiteral,
+                                ('STRING_LITERAL', token.value[1:-1]))
+        else:
+            expr = parse_atom(token)
+
+        if stack:
+            stack[-1].append(expr)
+        else:
+            yield expr
+
+    if stack:
+        raise _error("Missing closing parenthesis", opened[-1], source_map)
+
+
+# StringLiteral.__new__ を経由せずに文字列リテラルを作る
+_new_literal = tuple.__new__
+
+
+def _error(message: str, token: Token,
+           source_map: Optional[SourceMap]) -> ParseError:
+    error = ParseError(message)
+    if token.line:
+        filename = (source_map.filename if source_map is not None
+                    else '<string>')
+        error.add_note(f"場所: {filename}:{token.line}:{token.column}")
+    return error
+
+
+def parse_packed(tokens: Iterable[Token],
+                 filename: str = '<string>') -> PackedAST:
+    """トークン列をリストを作らずにパック済みASTに変換
+
+    PackedBuilder と同じ配列を組み立てるが、トークンごとのメソッド呼び出しを
+    避けるためにループの中へ展開している。
+    """
+    # 配列より list の方が追加が速いので、最後にまとめて配列に変換する
+    nodes: list[int] = []
+    positions: list[int] = []
+    roots: list[int] = []
+    consts: list[Any] = []
+    symbols = SYMBOL_TABLE
+    # ソース上の綴り -> 定数プールの番号（シンボルとそれ以外で分ける）
+    symbol_index: dict[str, int] = {}
+    atom_index: dict[tuple, int] = {}
+    # 閉じていないリストの [ノード番号, 子の数] と開き括弧のトークン
+    stack: list[list[int]] = []
+    opened: list[Token] = []
+    count = 0
+
+    for token in tokens:
+        kind = token.kind
+        if kind is TokenKind.RPAREN:
+            if not stack:
+                raise _error(f"Unexpected token: {token}", token,
+                             SourceMap(filename))
+            index, children = stack.pop()
+            opened.pop()
+            base = index * NODE_WIDTH
+            nodes[base + 1] = children
+            nodes[base + 2] = count - index
+            continue
+
+        if stack:
+            stack[-1][1] += 1
+        else:
+            roots.append(count)
+        positions += (token.line, token.column)
+
+        if kind is TokenKind.LPAREN:
+            nodes += (LIST, 0, 1)
+            stack.append([count, 0])
+            opened.append(token)
+            count += 1
+            continue
+
+        value = token.value
+        if kind is TokenKind.SYMBOL or kind is TokenKind.OPERATOR:
+            const = symbol_index.get(value)
+            if const is None:
+                const = symbol_index[value] = len(consts)
+                consts.append(symbols.get(value) or Symbol(value))
+        else:
+            key = (kind, value)
+            const = atom_index.get(key)
+            if const is None:
+                const = atom_index[key] = len(consts)
+                consts.append(parse_atom(token))
+        nodes += (ATOM, const, 1)
+        count += 1
+
+    if opened:
+        raise _error("Missing closing parenthesis", opened[-1],
+                     SourceMap(filename))
+    return PackedAST(array('i', nodes), array('i', positions),
+                     array('i', roots), consts, filename)
+
+
+def parse_atom(token: Token) -> Any:
+    """括弧以外の単一トークンをパースする"""
     match token.kind:
-        case TokenKind.LPAREN:
-            return parse_list(tokens, start + 1)
         case TokenKind.INTEGER:
-            return int(token.value), start + 1
+            return int(token.value)
         case TokenKind.STRING:
-            # 文字列リテラルをタプルで包んで区別
-            return ('STRING_LITERAL', token.value[1:-1]), start + 1
-        case TokenKind.OPERATOR:
-            return token.value, start + 1
-        case TokenKind.SYMBOL:
-            return token.value, start + 1
+            # 文字列リテラルを包んでシンボルと区別
+            return StringLiteral(token.value[1:-1])
+        case TokenKind.OPERATOR | TokenKind.SYMBOL:
+            return Symbol(token.value)
         case _:
             raise ParseError(f"Unexpected token: {token}")
-
-
-def parse_list(tokens: list[Token], start: int) -> tuple[list[Any], int]:
-    """リスト式をパースする（開き括弧の後から）"""
-    elements = []
-    i: int = start
-
-    while i < len(tokens) and tokens[i].kind != TokenKind.RPAREN:
-        expr, i = parse_expression(tokens, i)
-        elements.append(expr)
-
-    if i >= len(tokens):
-        raise ParseError("Missing closing parenthesis")
-
-    return elements, i + 1
@@ -0,0 +1,186 @@
+"""
+LISPインタープリターのプロファイラーモジュール
+
+トップレベルの式ごとの実行時間と、ユーザー定義関数ごとの呼び出し回数・
+実行時間を計測する。有効にしている間はツリー評価器が関数呼び出しのたびに
+プロファイラーを経由するため、末尾呼び出しの最適化は行われない。
+"""
+
+from collections import Counter
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+from . import evaluator
+from .evaluator import Environment, Procedure, eval_lisp
+from .packed import PackedNode
+from .parser import SourceMap
+from .symbols import is_string_literal
+
+# レポートやスタックに表示するS式の最大文字数
+LABEL_WIDTH = 40
+
+
+class FunctionStats:
+    """関数ごとの計測結果"""
+
+    __slots__ = ('calls', 'total', 'self_time')
+
+    def __init__(self):
+        self.calls = 0
+        # 再帰呼び出しを重複して数えない累積時間
+        self.total = 0.0
+        # 呼び出した関数の時間を除いた時間
+        self.self_time = 0.0
+
+
+class Profiler:
+    """計測型のプロファイラー"""
+
+    def __init__(self):
+        self.forms: list[tuple[str, float]] = []
+        self.functions: dict[str, FunctionStats] = {}
+        # 呼び出しスタック（ラベルのタプル）ごとの自己時間
+        self.stacks: Counter = Counter()
+        self._stack: list[str] = []
+        self._children: list[float] = []
+        self._active: Counter = Counter()
+        # 評価中の式の位置の対応表と、関数本体ごとの表示名のキャッシュ
+        self._source_map: Optional[SourceMap] = None
+        self._labels: dict[int, tuple[Any, str]] = {}
+
+    def enable(self):
+        """評価器にプロファイラーを設定する"""
+        evaluator.PROFILER = self
+
+    def disable(self):
+        """評価器からプロファイラーを外す"""
+        if evaluator.PROFILER is self:
+            evaluator.PROFILER = None
+
+    def form(self, source: Any, expr: Any, evaluate: Callable,
+             env: Environment,
+             source_map: Optional[SourceMap] = None) -> Any:
+        """トップレベルの式を評価して実行時間を記録する
+
+        source はパースした元の式、expr は実際に評価する（最適化後の）式。
+        """
+        self._source_map = source_map
+        location = None
+        if source_map is not None:
+            location = source_map.location(source)
+        if location is None:
+            location = f"#{len(self.forms) + 1}"
+        label = f"{location} {format_expr(source)}"
+        start = perf_counter()
+        try:
+            return self._timed(label, None, evaluate, expr, env)
+        finally:
+            self.forms.append((label, perf_counter() - start))
+
+    def call(self, func: Procedure, args: Any) -> Any:
+        """ユーザー定義関数を呼び出して実行時間を記録する"""
+        label = self._label(func)
+        stats = self.functions.get(label)
+        if stats is None:
+            stats = self.functions[label] = FunctionStats()
+        stats.calls += 1
+        return self._timed(label, stats, eval_lisp, func.body, func.bind(args))
+
+    def _label(self, func: Procedure) -> str:
+        if func.name is not None:
+            return func.name
+        cached = self._labels.get(id(func.body))
+        if cached is not None and cached[0] is func.body:
+            return cached[1]
+        label = procedure_label(func)
+        if self._source_map is not None:
+            location = self._source_map.location(func.body)
+            if location is not None:
+                label = f"{label} {location}"
+        self._labels[id(func.body)] = (func.body, label)
+        return label
+
+    def _timed(self, label: str, stats: Optional[FunctionStats],
+               evaluate: Callable, expr: Any, env: Environment) -> Any:
+        stack = self._stack
+        stack.append(label)
+        self._children.append(0.0)
+        self._active[label] += 1
+        start = perf_counter()
+        try:
+            return evaluate(expr, env)
+        finally:
+            elapsed = perf_counter() - start
+            self_time = elapsed - self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            self.stacks[tuple(stack)] += self_time
+            stack.pop()
+            self._active[label] -= 1
+            if stats is not None:
+                stats.self_time += self_time
+                if not self._active[label]:
+                    stats.total += elapsed
+
+    def report(self, limit: int = 20) -> str:
+        """計測結果を実行時間の長い順に並べたレポート"""
+        lines = []
+        total = sum(elapsed for _, elapsed in self.forms)
+        lines.append(f"トップレベルの式: {len(self.forms)} 個, 合計 {total:.6f} 秒")
+        lines.append(f"{'時間(秒)':>12}  式")
+        slowest = sorted(self.forms, key=lambda item: -item[1])[:limit]
+        for label, elapsed in slowest:
+            lines.append(f"{elapsed:12.6f}  {label}")
+
+        lines.append("")
+        if not self.functions:
+            lines.append("関数の計測結果はありません"
+                         "（関数ごとの計測は tree エンジンのみ）")
+            return '\n'.join(lines)
+        lines.append(f"{'呼び出し':>10} {'累積(秒)':>12} {'自己(秒)':>12} "
+                     f"{'1回(ms)':>10}  関数")
+        ranked = sorted(self.functions.items(),
+                        key=lambda item: -item[1].total)
+        for label, stats in ranked[:limit]:
+            per_call = stats.total / stats.calls * 1000
+            lines.append(f"{stats.calls:10d} {stats.total:12.6f} "
+                         f"{stats.self_time:12.6f} {per_call:10.3f}  {label}")
+        return '\n'.join(lines)
+
+    def collapsed(self) -> str:
+        """flamegraph.pl などで読める collapsed stack 形式（単位はマイクロ秒）"""
+        lines = []
+        for stack, seconds in sorted(self.stacks.items()):
+            micros = round(seconds * 1_000_000)
+            if micros > 0:
+                names = ';'.join(label.replace(';', ',') for label in stack)
+                lines.append(f"{names} {micros}")
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def write_collapsed(self, path: str):
+        """collapsed stack 形式でファイルに書き出す"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+
+
+def procedure_label(func: Procedure) -> str:
+    """関数の表示名（define された名前、無名関数ならソース）"""
+    if func.name is not None:
+        return func.name
+    return format_expr(['lambda', func.params, func.body])
+
+
+def format_expr(expr: Any, width: int = LABEL_WIDTH) -> str:
+    """S式をソースの形式で1行に整形する（長い場合は省略する）"""
+    text = _format(expr)
+    if len(text) > width:
+        text = text[:width - 3] + '...'
+    return text
+
+
+def _format(expr: Any) -> str:
+    if isinstance(expr, (list, PackedNode)):
+        return '(' + ' '.join(_format(item) for item in expr) + ')'
+    if is_string_literal(expr):
+        return f'"{expr[1]}"'
+    return str(expr)
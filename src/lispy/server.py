@@ -0,0 +1,532 @@
+"""
+LISPインタープリターの評価サーバーモジュール
+
+Unix ソケットで JSON lines のリクエストを受け付け、起動済みのワーカープロセスの
+プールで評価して、結果を JSON lines で返す。Python の起動や環境の構築を
+スクリプトごとに繰り返さずに済む。`lispy serve` サブコマンドから実行する。
+
+リクエスト（1行に1つの JSON オブジェクト）:
+    {"id": 1, "source": "(+ 1 2)"}          ソースを評価する
+    {"id": 2, "program": "<プログラムID>"}   以前に送ったソースをもう一度評価する
+    任意で "engine"、"optimize"、"timeout"（秒。サーバーの上限より長くは
+    できない）と、tree エンジンの資源の上限
+    "limits"（{"max_steps": 100000, "max_depth": 500} など）を指定できる
+    {"id": 3, "metrics": "prometheus"}      ワーカー全体のメトリクスを返す（"dict" も可）
+レスポンス:
+    {"id": 1, "program": "...", "ok": true, "result": 3, "output": "",
+     "elapsed": 0.0001}
+    {"id": 2, "program": "...", "ok": false, "error": "...", "type": "Timeout"}
+
+1つの接続で送ったリクエストも並行して評価されるため、レスポンスは完了順に
+返る。どのリクエストへの応答かは "id" で対応づける。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import socketserver
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, Optional
+
+from .builtins import LazySeq
+from .cache import source_hash
+from .interpreter import ENGINES, Interpreter
+from .limits import LIMIT_NAMES, Limits
+from .lispy import format_error
+from .metrics import Metrics
+from .parser import SourceMap, parse_packed
+from .tokenizer import tokenize
+
+DEFAULT_SOCKET = 'lispy.sock'
+# リクエストごとの評価時間の上限（秒）
+DEFAULT_TIMEOUT = 10.0
+# サーバーが覚えておくプログラムの数と、各ワーカーがパース結果を保持する数
+PROGRAM_CACHE_SIZE = 4096
+WORKER_CACHE_SIZE = 256
+
+_READY = 'ready'
+
+
+def to_json(value: Any) -> Any:
+    """評価結果を JSON に変換できる値にする（関数などは文字列で表す）
+
+    JSON で表せない inf や nan も文字列にする。
+    """
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple, LazySeq)):
+        return [to_json(item) for item in value]
+    return str(value)
+
+
+def _worker_main(conn: Any, metrics: bool = False):
+    """ワーカープロセスの本体。ジョブを受け取って評価し、結果を送り返す"""
+    # パース済みのプログラム（プログラムID -> パック済みAST）
+    programs: OrderedDict = OrderedDict()
+    # 評価器の初回実行時の準備をここで済ませておく
+    Interpreter().eval(0)
+    counters = None
+    if metrics:
+        counters = Metrics()
+        counters.enable()
+    conn.send(_READY)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        response = _evaluate(job, programs)
+        if counters is not None:
+            # ジョブごとの計測結果をサーバーで集計する
+            response['metrics'] = counters.as_dict()
+            counters.reset()
+        conn.send(response)
+
+
+def _evaluate(job: dict, programs: OrderedDict) -> dict:
+    """ジョブのプログラムを新しいグローバル環境で評価する"""
+    output = io.StringIO()
+    start = perf_counter()
+    try:
+        program_id = job['program']
+        program = programs.get(program_id)
+        if program is None:
+            program = parse_packed(tokenize(job['source']), job['filename'])
+            programs[program_id] = program
+            if len(programs) > WORKER_CACHE_SIZE:
+                programs.popitem(last=False)
+        else:
+            programs.move_to_end(program_id)
+
+        # リクエスト同士が定義を共有しないよう、毎回新しい環境で評価する
+        interpreter = Interpreter(job['engine'], job['optimize'])
+        source_map = SourceMap(job['filename'])
+        result = None
+        # 資源の上限はリクエスト全体（全てのトップレベルの式）に適用する
+        limits = (Limits(**job['limits']) if job['limits']
+                  else contextlib.nullcontext())
+        with contextlib.redirect_stdout(output), limits:
+            for expr in program:
+                result = interpreter.eval(expr, source_map)
+            # 遅延シーケンスの要素の計算も上限と出力の対象にする
+            result = to_json(result)
+    except Exception as e:
+        return {'ok': False, 'error': format_error(e),
+                'type': type(e).__name__, 'output': output.getvalue()}
+    return {'ok': True, 'result': result, 'output': output.getvalue(),
+            'elapsed': perf_counter() - start}
+
+
+class Worker:
+    """評価用のワーカープロセス1つ"""
+
+    def __init__(self, context: Any, metrics: bool = False):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main,
+                                       args=(child, metrics), daemon=True)
+        self.process.start()
+        child.close()
+
+    def wait_ready(self):
+        """ワーカーの準備が終わるまで待つ"""
+        if self.conn.recv() != _READY:
+            raise RuntimeError("ワーカーの起動に失敗しました")
+
+    def run(self, job: dict, timeout: float) -> Optional[dict]:
+        """ジョブを評価する。timeout 秒以内に終わらなければ None"""
+        self.conn.send(job)
+        if not self.conn.poll(timeout):
+            return None
+        return self.conn.recv()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """起動済みのワーカープロセスのプール
+
+    時間切れになったワーカーや異常終了したワーカーは終了させ、新しいワーカーに
+    置き換える。空いているワーカーがなければ空くまで待つ。置き換えのワーカーを
+    起動できなかった枠は、次にその枠を使うリクエストで起動し直す。
+
+    サーバーはスレッドを使うため、ワーカーは fork ではなく forkserver
+    （使えなければ spawn）で起動する。
+    """
+
+    def __init__(self, size: Optional[int] = None, metrics: bool = False):
+        self.size = size or os.cpu_count() or 1
+        # ワーカーで評価のメトリクスを計測するか
+        self.metrics = metrics
+        self._context = _worker_context()
+        # 空いているワーカー。None はワーカーを起動できなかった枠
+        self._idle: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = [Worker(self._context, metrics)
+                         for _ in range(self.size)]
+        for worker in self._workers:
+            worker.wait_ready()
+            self._idle.put(worker)
+
+    def run(self, job: dict, timeout: float) -> dict:
+        """空いているワーカーでジョブを評価する"""
+        worker = self._idle.get()
+        if worker is None:
+            try:
+                worker = self._start()
+            except Exception as e:
+                self._idle.put(None)
+                return {'ok': False,
+                        'error': f"ワーカーを起動できませんでした: {e}",
+                        'type': 'WorkerUnavailable'}
+        try:
+            response = worker.run(job, timeout)
+        except (EOFError, OSError):
+            response = {'ok': False, 'error': "ワーカーが異常終了しました",
+                        'type': 'WorkerCrashed'}
+        except BaseException:
+            # 送受信の途中で止まったワーカーは再利用しない
+            self._replace(worker)
+            raise
+        else:
+            if response is not None:
+                self._idle.put(worker)
+                return response
+            response = {'ok': False,
+                        'error': f"{timeout:g} 秒以内に評価が終わりませんでした",
+                        'type': 'Timeout'}
+        self._replace(worker)
+        return response
+
+    def _start(self) -> Worker:
+        """ワーカーを1つ起動してプールに加える"""
+        worker = Worker(self._context, self.metrics)
+        try:
+            worker.wait_ready()
+        except BaseException:
+            worker.kill()
+            raise
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker: Worker):
+        """ワーカーを終了させ、新しいワーカー（起動できなければ None）を
+        空きに戻す"""
+        worker.kill()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        try:
+            replacement = self._start()
+        except Exception:
+            replacement = None
+        self._idle.put(replacement)
+
+    def close(self):
+        """全てのワーカーを終了する"""
+        with self._lock:
+            for worker in self._workers:
+                worker.stop()
+            self._workers = []
+
+
+class Server:
+    """リクエストをワーカープールに振り分ける評価サーバー"""
+
+    def __init__(self, path: str = DEFAULT_SOCKET,
+                 workers: Optional[int] = None,
+                 timeout: float = DEFAULT_TIMEOUT, engine: str = 'tree',
+                 optimize: bool = False, limits: Optional[dict] = None,
+                 metrics: bool = False):
+        if engine not in ENGINES:
+            raise ValueError(f"未知の評価エンジンです: {engine}")
+        self.path = path
+        self.timeout = timeout
+        self.engine = engine
+        self.optimize = optimize
+        # リクエストで指定がなければ使う資源の上限 (limits.Limits の引数)
+        self.limits = limits or {}
+        # 全ワーカーの計測結果の合計（metrics が偽なら計測しない）
+        self.metrics: Optional[Metrics] = Metrics() if metrics else None
+        self._metrics_lock = threading.Lock()
+        # プログラムID -> ソース（古いものから捨てる）
+        self._programs: OrderedDict = OrderedDict()
+        self._programs_lock = threading.Lock()
+        self.pool = WorkerPool(workers, metrics)
+        self._server: Optional[_UnixServer] = None
+
+    def handle(self, request: Any) -> dict:
+        """1つのリクエストを評価してレスポンスを返す"""
+        if not isinstance(request, dict):
+            return _bad_request(None, "リクエストは JSON オブジェクトで送ってください")
+        request_id = request.get('id')
+        if 'metrics' in request:
+            return self._metrics_response(request_id, request['metrics'])
+        source = request.get('source')
+        if source is not None:
+            if not isinstance(source, str):
+                return _bad_request(request_id, "source は文字列で指定してください")
+            program_id = self.register(source)
+        elif 'program' in request:
+            program_id = request['program']
+            if not isinstance(program_id, str):
+                return _bad_request(request_id, "program は文字列で指定してください")
+            source = self.source(program_id)
+            if source is None:
+                return {'id': request_id, 'program': program_id, 'ok': False,
+                        'error': f"未知のプログラムIDです: {program_id}",
+                        'type': 'UnknownProgram'}
+        else:
+            return _bad_request(request_id, "source か program を指定してください")
+
+        engine = request.get('engine', self.engine)
+        if engine not in ENGINES:
+            return _bad_request(request_id, f"未知の評価エンジンです: {engine}")
+        timeout = request.get('timeout', self.timeout)
+        if not _is_timeout(timeout):
+            return _bad_request(request_id, "timeout は正の秒数で指定してください")
+        timeout = min(timeout, self.timeout)
+        limits = request.get('limits', {})
+        if not isinstance(limits, dict) or not all(
+                name in LIMIT_NAMES and _is_limit(value)
+                for name, value in limits.items()):
+            names = ', '.join(LIMIT_NAMES)
+            return _bad_request(request_id,
+                                f"limits には {names} を正の数で指定してください")
+        limits = {name: value
+                  for name, value in {**self.limits, **limits}.items()
+                  if value is not None}
+        if limits and engine != 'tree':
+            return _bad_request(request_id, "資源の制限は tree エンジンでのみ使えます")
+
+        job = {
+            'program': program_id,
+            'source': source,
+            'filename': f"<{program_id[:12]}>",
+            'engine': engine,
+            'optimize': bool(request.get('optimize', self.optimize)),
+            'limits': limits,
+        }
+        response = self.pool.run(job, timeout)
+        counts = response.pop('metrics', None)
+        if counts is not None and self.metrics is not None:
+            with self._metrics_lock:
+                self.metrics.merge(counts)
+        return {'id': request_id, 'program': program_id, **response}
+
+    def _metrics_response(self, request_id: Any, output: Any) -> dict:
+        if self.metrics is None:
+            return _bad_request(
+                request_id, "メトリクスは --metrics を付けて起動したときだけ使えます")
+        with self._metrics_lock:
+            if output == 'prometheus':
+                metrics = self.metrics.prometheus()
+            elif output == 'dict':
+                metrics = self.metrics.as_dict()
+            else:
+                return _bad_request(
+                    request_id, "metrics には prometheus か dict を指定してください")
+        return {'id': request_id, 'ok': True, 'metrics': metrics}
+
+    def handle_line(self, line: bytes) -> dict:
+        """JSON lines の1行を処理する"""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return _bad_request(None, f"JSON として読めません: {e}")
+        try:
+            return self.handle(request)
+        except Exception as e:
+            # handle は JSON オブジェクト以外を先に BadRequest にしている
+            return _internal_error(request.get('id'), e)
+
+    def register(self, source: str) -> str:
+        """ソースを覚えてプログラムIDを返す"""
+        program_id = source_hash(source.encode('utf-8'))
+        with self._programs_lock:
+            self._programs[program_id] = source
+            self._programs.move_to_end(program_id)
+            if len(self._programs) > PROGRAM_CACHE_SIZE:
+                self._programs.popitem(last=False)
+        return program_id
+
+    def source(self, program_id: Any) -> Optional[str]:
+        """プログラムIDのソース。覚えていなければ None"""
+        with self._programs_lock:
+            if program_id not in self._programs:
+                return None
+            self._programs.move_to_end(program_id)
+            return self._programs[program_id]
+
+    def start(self):
+        """ソケットで待ち受けを開始する（serve_forever で処理する）"""
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        self._server = _UnixServer(self.path, _Handler)
+        self._server.lispy = self
+
+    def serve_forever(self):
+        if self._server is None:
+            self.start()
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """待ち受けを止めてワーカーを終了する（別スレッドから呼ぶ）"""
+        if self._server is not None:
+            self._server.shutdown()
+
+    def close(self):
+        if self._server is not None:
+            self._server.server_close()
+            self._server = None
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+        self.pool.close()
+
+
+def _worker_context() -> Any:
+    """ワーカーを起動する multiprocessing のコンテキスト"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        # フォークサーバーで読み込んでおき、ワーカーごとの import を省く
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _is_limit(value: Any) -> bool:
+    # null は上限なし（サーバーのデフォルトを打ち消す）
+    return value is None or (isinstance(value, (int, float))
+                             and not isinstance(value, bool) and value > 0)
+
+
+def _is_timeout(value: Any) -> bool:
+    # JSON の Infinity や NaN は conn.poll に渡せないので受け付けない
+    return (isinstance(value, (int, float)) and not isinstance(value, bool)
+            and math.isfinite(value) and value > 0)
+
+
+def _bad_request(request_id: Any, message: str) -> dict:
+    return {'id': request_id, 'ok': False, 'error': message,
+            'type': 'BadRequest'}
+
+
+def _internal_error(request_id: Any, error: Exception) -> dict:
+    return {'id': request_id, 'ok': False,
+            'error': f"{type(error).__name__}: {error}",
+            'type': 'InternalError'}
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    lispy: Server
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """1つの接続のリクエストを読み、ワーカーの数まで並行して評価する"""
+
+    def handle(self):
+        server = self.server.lispy
+        write_lock = threading.Lock()
+        with ThreadPoolExecutor(max_workers=server.pool.size) as executor:
+            for line in self.rfile:
+                if line.strip():
+                    executor.submit(self._respond, server, line, write_lock)
+
+    def _respond(self, server: Server, line: bytes,
+                 write_lock: threading.Lock):
+        response = None
+        try:
+            response = server.handle_line(line)
+            text = json.dumps(response, ensure_ascii=False, allow_nan=False)
+        except Exception as e:
+            # 応答がないとクライアントが待ち続けるので、必ずエラーを返す
+            request_id = (response.get('id')
+                          if isinstance(response, dict) else None)
+            text = json.dumps(_internal_error(request_id, e),
+                              ensure_ascii=False)
+        data = (text + '\n').encode('utf-8')
+        with write_lock:
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except OSError:
+                # クライアントが先に切断した
+                pass
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """`lispy serve` のエントリーポイント"""
+    parser = argparse.ArgumentParser(
+        prog='lispy serve',
+        description='Unix ソケットで JSON lines のリクエストを受け付けて評価する'
+    )
+    parser.add_argument('--socket', '-s', type=str, default=DEFAULT_SOCKET,
+                        metavar='PATH',
+                        help=f'待ち受ける Unix ソケットのパス (デフォルト: {DEFAULT_SOCKET})')
+    parser.add_argument('--workers', '-w', type=int, metavar='N',
+                        help='ワーカープロセスの数 (デフォルト: CPU数)')
+    parser.add_argument('--timeout', '-t', type=float, default=DEFAULT_TIMEOUT,
+                        help='リクエストごとの評価時間の上限（秒） '
+                             f'(デフォルト: {DEFAULT_TIMEOUT:g})')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='tree',
+                        help='デフォルトの評価エンジン (デフォルト: tree)')
+    parser.add_argument('--optimize', '-O', action='store_true',
+                        help='評価前に定数畳み込みなどの最適化を行う')
+    parser.add_argument('--max-steps', type=int, metavar='N',
+                        help='リクエストごとの評価ステップ数の上限 (tree エンジン)')
+    parser.add_argument('--max-depth', type=int, metavar='N',
+                        help='評価の入れ子の深さの上限 (tree エンジン)')
+    parser.add_argument('--max-list-size', type=int, metavar='N',
+                        help='評価で作るリストの要素数の上限 (tree エンジン)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='評価のメトリクスを計測し、'
+                             '{"metrics": "prometheus"} のリクエストで返す')
+    args = parser.parse_args(argv)
+    if not _is_timeout(args.timeout):
+        parser.error(f"--timeout は正の秒数で指定してください: {args.timeout}")
+
+    limits = {name: getattr(args, name) for name in LIMIT_NAMES
+              if getattr(args, name, None) is not None}
+    server = Server(args.socket, args.workers, args.timeout, args.engine,
+                    args.optimize, limits, args.metrics)
+    # SIGTERM でも KeyboardInterrupt と同じようにソケットを片付けて終了する
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.start()
+        print(f"待ち受け中: {args.socket} (ワーカー {server.pool.size} 個)",
+              file=sys.stderr)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
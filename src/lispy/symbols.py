@@ -0,0 +1,72 @@
+"""
+LISPインタープリターのシンボルモジュール
+
+パーサーが作るシンボルと文字列リテラルの型を定義する。シンボルは名前ごとに
+1つだけ作られる（インターンされる）ため、同一性で比較でき、環境の辞書の
+検索でも文字列の比較が起きない。
+"""
+
+from typing import Any
+
+# 名前 -> シンボル（インターン済みの全てのシンボル）
+SYMBOL_TABLE: dict[str, 'Symbol'] = {}
+
+
+class Symbol(str):
+    """インターンされたシンボル
+
+    str のサブクラスなので、通常の文字列と等しく比較でき、同じハッシュ値を持つ。
+    Symbol(name) は同じ名前に対して常に同じオブジェクトを返す。
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, name: str) -> 'Symbol':
+        symbol = SYMBOL_TABLE.get(name)
+        if symbol is None:
+            symbol = super().__new__(cls, name)
+            SYMBOL_TABLE[str(symbol)] = symbol
+        return symbol
+
+    def __reduce__(self):
+        # 読み込んだ先のプロセスでもインターンし直す
+        return Symbol, (str(self),)
+
+
+class StringLiteral(tuple):
+    """文字列リテラル
+
+    従来の ('STRING_LITERAL', value) タプルと等しく比較できる。評価器は型だけで
+    文字列リテラルを判別できる。
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, value: str) -> 'StringLiteral':
+        return super().__new__(cls, ('STRING_LITERAL', value))
+
+    @property
+    def value(self) -> str:
+        return self[1]
+
+    def __reduce__(self):
+        return StringLiteral, (self[1],)
+
+
+def is_string_literal(expr: Any) -> bool:
+    """S式が文字列リテラルかどうか（手で組み立てたタプルも含む）"""
+    return type(expr) is StringLiteral or (
+        isinstance(expr, tuple) and len(expr) == 2
+        and expr[0] == 'STRING_LITERAL')
+
+
+# 特殊形式の名前
+IF = Symbol('if')
+DEFINE = Symbol('define')
+DEFMEMO = Symbol('defmemo')
+LET = Symbol('let')
+FOR = Symbol('for')
+LAMBDA = Symbol('lambda')
+MEMOIZE = Symbol('memoize')
+# 非同期評価 (aio) だけの特殊形式
+PARALLEL = Symbol('parallel')
@@ -6,8 +6,8 @@ including token types and the main tokenize function.
 """
 
 import re
-from dataclasses import dataclass
 from enum import Enum
+from typing import Iterable, Iterator
 
 
 class TokenKind(Enum):
@@ -20,16 +20,154 @@ class TokenKind(Enum):
     SYMBOL = "SYMBOL"
 
 
-@dataclass
 class Token:
-    """Represents a single token in the LISP source code."""
-    kind: TokenKind
-    value: str
+    """Represents a single token in the LISP source code.
+
+    ``line`` and ``column`` are 1-based; 0 means the position is unknown.
+    They are ignored when comparing tokens.
+    """
+
+    # Written out by hand rather than with @dataclass: importing dataclasses
+    # (and inspect with it) was a large share of the CLI startup time.
+    __slots__ = ('kind', 'value', 'line', 'column')
+    __match_args__ = ('kind', 'value', 'line', 'column')
+
+    def __init__(self, kind: TokenKind, value: str, line: int = 0,
+                 column: int = 0):
+        self.kind = kind
+        self.value = value
+        self.line = line
+        self.column = column
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.kind == other.kind and self.value == other.value
+
+    __hash__ = None
+
+    def __repr__(self):
+        return (f"Token(kind={self.kind!r}, value={self.value!r}, "
+                f"line={self.line!r}, column={self.column!r})")
 
     def __str__(self):
         return f"Token('{self.kind.value}', '{self.value}')"
 
 
+_TOKEN_SPEC = {
+    "LPAREN":     r"\(",
+    "RPAREN":     r"\)",
+    "INTEGER":    r"[0-9]+",
+    "OPERATOR":   r"[+\-*/%=<>]|<=|>=",
+    "STRING":     r'"(\\.|[^"\\])*"',
+    "SYMBOL":     r"[a-zA-Z_][a-zA-Z0-9_]*",
+    "WHITESPACE": r"\s+",
+    "NEWLINE":    r"\n",
+    "MISMATCH":   r".",
+}
+
+# The master pattern is compiled once at import time instead of per call.
+_TOKEN_RE = re.compile("|".join(f"(?P<{name}>{pattern})"
+                                for name, pattern in _TOKEN_SPEC.items()))
+
+# Maps regex group names to token kinds; whitespace groups are absent.
+_GROUP_KINDS = {kind.value: kind for kind in TokenKind}
+
+
+def iter_tokens(code: str) -> Iterator[Token]:
+    """
+    Lazily tokenize LISP source code.
+
+    Args:
+        code: The LISP source code string to tokenize
+
+    Yields:
+        Token objects in source order
+
+    Raises:
+        RuntimeError: If an unexpected character is encountered
+    """
+    return _scan(code, 0, [1, 0], True)
+
+
+def iter_tokens_chunked(chunks: Iterable[str]) -> Iterator[Token]:
+    """
+    Lazily tokenize LISP source code that arrives in pieces.
+
+    A lexeme that touches the end of a chunk (or an unterminated string)
+    is carried over and rescanned together with the next chunk, so only
+    the unfinished tail is kept in memory between chunks.
+
+    Args:
+        chunks: An iterable of source code fragments, e.g. file reads
+
+    Yields:
+        Token objects in source order
+
+    Raises:
+        RuntimeError: If an unexpected character is encountered
+    """
+    rest = ""
+    offset = 0
+    position = [1, 0]
+    for chunk in chunks:
+        buffer = rest + chunk if rest else chunk
+        consumed = yield from _scan(buffer, offset, position, False)
+        rest = buffer[consumed:]
+        offset += consumed
+    yield from _scan(rest, offset, position, True)
+
+
+def _scan(buffer: str, offset: int, position: list[int],
+          final: bool) -> Iterator[Token]:
+    """
+    Tokenize one buffer and return how many characters were consumed.
+
+    ``offset`` is the absolute offset of the buffer in the source and
+    ``position`` holds the current line number and the absolute offset of
+    the start of that line; it is updated in place. Unless ``final`` is
+    set, scanning stops before a lexeme that may continue in the next
+    chunk.
+    """
+    kinds = _GROUP_KINDS
+    string_kind = TokenKind.STRING
+    end = len(buffer)
+    line, line_start = position
+    # Line starts are tracked relative to the buffer inside the loop.
+    line_start -= offset
+    try:
+        for m in _TOKEN_RE.finditer(buffer):
+            group = m.lastgroup
+            kind = kinds.get(group)
+            if kind is not None:
+                if not final and m.end() == end:
+                    return m.start()
+                start = m.start()
+                text = m.group()
+                yield Token(kind, text, line, start - line_start + 1)
+                if kind is string_kind and "\n" in text:
+                    line += text.count("\n")
+                    line_start = start + text.rindex("\n") + 1
+            elif group == "WHITESPACE":
+                if not final and m.end() == end:
+                    return m.start()
+                text = m.group()
+                if "\n" in text:
+                    line += text.count("\n")
+                    line_start = m.start() + text.rindex("\n") + 1
+            elif group == "MISMATCH":
+                text = m.group()
+                if not final and (m.end() == end or text == '"'):
+                    return m.start()
+                column = m.start() - line_start + 1
+                raise RuntimeError(f"Unexpected character: {text} "
+                                   f"(line {line}, column {column})")
+        return end
+    finally:
+        position[0] = line
+        position[1] = line_start + offset
+
+
 def tokenize(code: str) -> list[Token]:
     """
     Tokenize LISP source code into tokens.
@@ -43,45 +181,4 @@ def tokenize(code: str) -> list[Token]:
     Raises:
         RuntimeError: If an unexpected character is encountered
     """
-    token_spec = {
-        "LPAREN":     r"\(",
-        "RPAREN":     r"\)",
-        "INTEGER":    r"[0-9]+",
-        "OPERATOR":   r"[+\-*/%=<>]|<=|>=",
-        "STRING":     r'"(\\.|[^"\\])*"',
-        "SYMBOL":     r"[a-zA-Z_][a-zA-Z0-9_]*",
-        "WHITESPACE": r"\s+",
-        "NEWLINE":    r"\n",
-        "MISMATCH":   r".",
-    }
-
-    tok_regex = "|".join(f"(?P<{name}>{pattern})"
-                         for name, pattern in token_spec.items())
-    get_token = re.compile(tok_regex).finditer
-    tokens = []
-
-    for m in get_token(code):
-        kind = m.lastgroup
-        value = m.group()
-
-        match kind:
-            case "LPAREN":
-                tokens.append(Token(TokenKind.LPAREN, value))
-            case "RPAREN":
-                tokens.append(Token(TokenKind.RPAREN, value))
-            case "INTEGER":
-                tokens.append(Token(TokenKind.INTEGER, value))
-            case "OPERATOR":
-                tokens.append(Token(TokenKind.OPERATOR, value))
-            case "STRING":
-                tokens.append(Token(TokenKind.STRING, value))
-            case "SYMBOL":
-                tokens.append(Token(TokenKind.SYMBOL, value))
-            case "WHITESPACE" | "NEWLINE":
-                continue
-            case "MISMATCH":
-                raise RuntimeError(f"Unexpected character: {value}")
-            case _:
-                raise RuntimeError(f"Unknown token kind: {kind}")
-
-    return tokens
+    return list(iter_tokens(code))
@@ -0,0 +1,153 @@
+"""
+LISPインタープリターのベクトル化モジュール
+
+NumPy 配列に対する map/filter を要素ごとの関数呼び出しではなく
+配列演算としてまとめて実行する。NumPy はオプションの依存関係で、
+配列を作成したときに初めて読み込まれる。
+"""
+
+import math
+from typing import Any
+
+from .builtins import GLOBALS, OPERATORS
+from .evaluator import Environment, Procedure, eval_lisp
+from .packed import PackedNode
+
+# 数学関数と対応する NumPy の ufunc 名
+_UFUNC_NAMES = {
+    math.sin: 'sin',
+    math.cos: 'cos',
+    math.sqrt: 'sqrt',
+}
+
+# 配列の本体にそのまま適用できる演算子（OPERATORS の関数は配列にも対応している）
+VECTORIZABLE_SYMBOLS = frozenset(OPERATORS) | {'sin', 'cos', 'sqrt'}
+
+# 比較演算子は2引数のときだけ要素ごとの比較になる（連鎖した比較は真偽値を返す）
+_COMPARISONS = frozenset({'=', '<', '>', '<=', '>='})
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError(
+            "配列の機能には NumPy が必要です: pip install 'lispy[numpy]'"
+        ) from None
+    return numpy
+
+
+def to_array(values: Any) -> Any:
+    """リストなどのシーケンスを NumPy 配列に変換"""
+    numpy = _numpy()
+    if isinstance(values, numpy.ndarray):
+        return values
+    return numpy.asarray(list(values))
+
+
+def arange(start: Any, end: Any = None) -> Any:
+    """range と同じ範囲の NumPy 配列を作成"""
+    numpy = _numpy()
+    return numpy.arange(start) if end is None else numpy.arange(start, end)
+
+
+def lift(func: Any) -> Any:
+    """関数を配列全体に適用する関数に変換する。変換できなければ None
+
+    math の関数は対応する ufunc に、本体が演算子と数学関数だけからなる
+    1引数の lambda は引数に配列を束縛して本体を一度だけ評価する関数になる。
+    要素ごとの評価と結果が同じになるかは apply_lifted で確かめる。
+    """
+    numpy = _numpy()
+    if func in _UFUNC_NAMES:
+        return getattr(numpy, _UFUNC_NAMES[func])
+    if type(func) is not Procedure or len(func.params) != 1:
+        return None
+    if not _is_vectorizable(func.body, func.params[0], func.env):
+        return None
+
+    param, body, env = func.params[0], func.body, func.env
+
+    def lifted(array):
+        array_env = Environment(parent=env)
+        for name, ufunc in _UFUNC_NAMES.items():
+            array_env.define(ufunc, getattr(numpy, ufunc))
+        array_env.define(param, array)
+        result = eval_lisp(body, array_env)
+        # 本体が定数の場合も要素数分の配列を返す
+        return numpy.broadcast_to(result, array.shape).copy()
+
+    return lifted
+
+
+def _is_vectorizable(expr: Any, param: str, env: Environment) -> bool:
+    """式が配列の引数に対してそのまま評価できるか"""
+    if isinstance(expr, (int, float)):
+        return True
+    if isinstance(expr, str):
+        if expr == param:
+            return True
+        # 捕捉した変数は数値でなければならない
+        value = _lookup(env, expr)
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if isinstance(expr, (list, PackedNode)) and len(expr) > 1:
+        head = expr[0]
+        if not isinstance(head, str) or head not in VECTORIZABLE_SYMBOLS:
+            return False
+        # 演算子が再束縛されていないことを確認する
+        if head == param or _lookup(env, head) is not GLOBALS[head]:
+            return False
+        if head in _COMPARISONS and len(expr) != 3:
+            return False
+        return all(_is_vectorizable(arg, param, env) for arg in expr[1:])
+    return False
+
+
+def _lookup(env: Environment, name: str) -> Any:
+    try:
+        return env.lookup(name)
+    except NameError:
+        return None
+
+
+def apply_lifted(func: Any, array: Any) -> Any:
+    """関数を配列全体に一度に適用した結果。要素ごとの評価と結果が
+    変わりうるときは None
+
+    固定長の整数の配列は桁あふれで結果が変わるため、ufunc（結果は浮動小数点数）
+    だけを適用する。浮動小数点数の配列では 0 除算などで inf や nan が
+    できたら（要素ごとの評価ではエラーになるため）変換をやめる。
+    配列に対して評価できない式（ValueError や TypeError）も要素ごとの評価に任せる。
+    """
+    numpy = _numpy()
+    kind = array.dtype.kind
+    if kind != 'f' and not (kind in 'iu' and func in _UFUNC_NAMES):
+        return None
+    lifted = lift(func)
+    if lifted is None:
+        return None
+    try:
+        with numpy.errstate(all='raise'):
+            return lifted(array)
+    except (FloatingPointError, ValueError, TypeError):
+        return None
+
+
+def map_array(func: Any, array: Any) -> Any:
+    """配列の各要素に関数を適用した配列を返す"""
+    result = apply_lifted(func, array)
+    if result is not None:
+        return result
+    numpy = _numpy()
+    # 要素は Python の数値で渡す（リストに対する map と同じ結果にする）
+    return numpy.array([func(x) for x in array.tolist()])
+
+
+def filter_array(func: Any, array: Any) -> Any:
+    """条件を満たす要素だけからなる配列を返す"""
+    numpy = _numpy()
+    mask = apply_lifted(func, array)
+    if mask is None:
+        mask = numpy.array([bool(func(x)) for x in array.tolist()],
+                           dtype=bool)
+    return array[mask.astype(bool)]
@@ -0,0 +1,170 @@
+"""
+LISPインタープリターの仮想マシンモジュール
+
+バイトコードをスタックマシンで実行する
+"""
+
+from typing import Any, Optional
+
+from .bytecode import (BINARY_OP, CALL, CONST, FOR_NEXT, FOR_SETUP, FOR_STORE,
+                       JUMP, JUMP_IF_FALSE, LOAD_DEFINED, LOAD_DEREF,
+                       LOAD_GLOBAL, LOAD_LOCAL, MAKE_CLOSURE, MAKE_FRAME, POP,
+                       POP_FRAME, RETURN, STORE_GLOBAL, STORE_LOCAL, TAIL_CALL,
+                       UNARY_OP, CodeObject, compile_bytecode)
+from .compiler import UNBOUND, Frame, load_defined
+from .evaluator import Environment, create_global_env
+
+
+class VMClosure:
+    """仮想マシン上のユーザー定義関数"""
+
+    __slots__ = ('code', 'frame', 'env')
+
+    def __init__(self, code: CodeObject, frame: Optional[Frame],
+                 env: Environment):
+        self.code = code
+        self.frame = frame
+        self.env = env
+
+    def bind(self, args: list) -> Frame:
+        """引数を束縛したフレームを作成"""
+        if len(args) != self.code.nparams:
+            expected, actual = self.code.nparams, len(args)
+            raise ValueError(f"引数の数が一致しません: 期待値{expected}, 実際{actual}")
+        return Frame(args, self.frame)
+
+    def __call__(self, *args):
+        # 組み込み関数（map など）から呼ばれた場合は新しい実行ループで評価する
+        return execute(self.code, self.env, self.bind(list(args)))
+
+
+def eval_bytecode(expr: Any, env: Optional[Environment] = None) -> Any:
+    """S式をバイトコードにコンパイルしてから仮想マシンで評価"""
+    if env is None:
+        env = create_global_env()
+    return execute(compile_bytecode(expr), env)
+
+
+def execute(code_obj: CodeObject, env: Environment,
+            frame: Optional[Frame] = None) -> Any:
+    """コードオブジェクトを実行して結果を返す"""
+    code = code_obj.code
+    consts = code_obj.consts
+    pc = 0
+    stack: list = []
+    push = stack.append
+    pop = stack.pop
+    # 呼び出し元の (コード, 定数, pc, フレーム) を積むコールスタック
+    calls: list = []
+
+    while True:
+        op = code[pc]
+        arg = code[pc + 1]
+        pc += 2
+
+        if op == LOAD_LOCAL:
+            push(frame.values[arg])
+        elif op == BINARY_OP:
+            name, generic, fast = consts[arg]
+            right = pop()
+            left = pop()
+            if env.bindings.get(name) is generic:
+                push(fast(left, right))
+            else:
+                # 再束縛されていれば通常の呼び出しと同じ結果にする
+                push(_call(env.lookup(name), left, right))
+        elif op == LOAD_GLOBAL:
+            push(env.lookup(consts[arg]))
+        elif op == CONST:
+            push(consts[arg])
+        elif op == CALL or op == TAIL_CALL:
+            if arg:
+                args = stack[-arg:]
+                del stack[-arg:]
+            else:
+                args = []
+            func = pop()
+            if type(func) is VMClosure:
+                # ユーザー定義関数は同じループの中で実行する
+                new_frame = func.bind(args)
+                if op == CALL:
+                    calls.append((code, consts, pc, frame))
+                callee = func.code
+                code, consts = callee.code, callee.consts
+                pc, frame = 0, new_frame
+            elif callable(func):
+                push(func(*args))
+            else:
+                raise TypeError(f"{func} は呼び出し可能ではありません")
+        elif op == JUMP_IF_FALSE:
+            if not pop():
+                pc = arg
+        elif op == JUMP:
+            pc = arg
+        elif op == RETURN:
+            if not calls:
+                return pop()
+            code, consts, pc, frame = calls.pop()
+        elif op == LOAD_DEREF:
+            depth, index = consts[arg]
+            target = frame
+            for _ in range(depth):
+                target = target.parent
+            push(target.values[index])
+        elif op == FOR_NEXT:
+            for_value = next(stack[-1], _DONE)
+            if for_value is _DONE:
+                pop()
+                frame = frame.parent
+                pc = arg
+            else:
+                frame.values[0] = for_value
+        elif op == FOR_STORE:
+            stack[-2] = pop()
+            pc = arg
+        elif op == FOR_SETUP:
+            end_val = pop()
+            start_val = pop()
+            push(None)
+            push(iter(range(start_val, end_val + 1)))
+            frame = Frame([None], frame)
+        elif op == POP:
+            pop()
+        elif op == MAKE_FRAME:
+            if arg:
+                values = stack[-arg:]
+                del stack[-arg:]
+            else:
+                values = []
+            frame = Frame(values, frame)
+        elif op == POP_FRAME:
+            frame = frame.parent
+        elif op == MAKE_CLOSURE:
+            push(VMClosure(consts[arg], frame, env))
+        elif op == UNARY_OP:
+            name, generic, fast = consts[arg]
+            if env.bindings.get(name) is generic:
+                stack[-1] = fast(stack[-1])
+            else:
+                stack[-1] = _call(env.lookup(name), stack[-1])
+        elif op == STORE_GLOBAL:
+            env.define(consts[arg], stack[-1])
+        elif op == STORE_LOCAL:
+            values = frame.values
+            while len(values) <= arg:
+                values.append(UNBOUND)
+            values[arg] = stack[-1]
+        elif op == LOAD_DEFINED:
+            name, candidates = consts[arg]
+            push(load_defined(env, frame, name, candidates))
+        else:
+            raise RuntimeError(f"不明なオペコードです: {op}")
+
+
+_DONE = object()
+
+
+def _call(func: Any, *args) -> Any:
+    if not callable(func):
+        raise TypeError(f"{func} は呼び出し可能ではありません")
+    return func(*args)
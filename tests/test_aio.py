@@ -0,0 +1,193 @@
+import asyncio
+import importlib
+import unittest
+from unittest import mock
+
+from lispy import aio
+from lispy.aio import AsyncInterpreter, eval_async, run_async
+from lispy.builtins import LazySeq
+from lispy.interpreter import Interpreter
+from lispy.packed import PackedAST
+from lispy.parser import parse, parse_packed
+from lispy.tokenizer import tokenize
+
+FIB = '(define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))'
+
+
+class TestAsyncEvaluator(unittest.IsolatedAsyncioTestCase):
+
+    async def test_same_results_as_tree(self):
+        """同期の評価器と同じ結果になる"""
+        source = f'''
+        {FIB}
+        (fib 12)
+        (let ((a 1) (b 2)) (concat "x" (+ a b)))
+        (for i 1 5 (* i i))
+        (defmemo sq (x) (* x x))
+        (sq 9)
+        (sum (map (lambda (x) (* x 2)) (range 4)))
+        (filter (lambda (x) (> x 1)) (list 1 2 3))
+        (reduce (lambda (a b) (+ a b)) 0 (list 1 2 3))
+        '''
+        expected = Interpreter().run(source)
+        results = await AsyncInterpreter().run(source)
+        self.assertEqual(results[1:4], expected[1:4])
+        self.assertEqual(results[5:], [81, 12, [2, 3], 6])
+
+    async def test_yields_to_event_loop(self):
+        """一定ステップごとに他のタスクへ制御を返す"""
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(ticker())
+        interpreter = AsyncInterpreter(yield_steps=100)
+        await interpreter.run(f'{FIB} (fib 15)')
+        task.cancel()
+        self.assertGreater(ticks, 50)
+
+    async def test_parallel(self):
+        """parallel の各式は並行に評価される"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await AsyncInterpreter().run(
+            '(parallel (sleep (/ 1 5)) (sleep (/ 1 5)) (+ 1 2))')
+        self.assertEqual(result, [[None, None, 3]])
+        self.assertLess(loop.time() - start, 0.35)
+
+    async def test_parallel_error_cancels_others(self):
+        """parallel のどれかが失敗したら全体がエラーになる"""
+        with self.assertRaises(NameError):
+            await AsyncInterpreter().run('(parallel (sleep 10) (undefined 1))')
+
+    async def test_coroutine_builtins(self):
+        """コルーチン関数を組み込み関数として登録できる"""
+        async def fetch(x):
+            await asyncio.sleep(0)
+            return x * 10
+
+        interpreter = AsyncInterpreter()
+        interpreter.define('fetch', fetch)
+        results = await interpreter.run('''
+        (fetch 4)
+        (map fetch (list 1 2))
+        (map (lambda (x) (+ (fetch x) 1)) (list 1 2))
+        ''')
+        self.assertEqual(results, [40, [10, 20], [11, 21]])
+
+    async def test_map_result_types_match_sync(self):
+        """map/filter は同期の評価器と同じ種類の値（リストか遅延シーケンス）を返す"""
+        sync = Interpreter().run('''
+        (map (lambda (x) (* x 2)) (list 1 2))
+        (map (lambda (x) (* x 2)) (range 3))
+        (filter (lambda (x) (> x 0)) (range 3))
+        ''')
+        # 非同期の組み込み関数を呼ぶ関数は await して評価する
+        results = await AsyncInterpreter().run('''
+        (map (lambda (x) (if (sleep 0) x (* x 2))) (list 1 2))
+        (map (lambda (x) (if (sleep 0) x (* x 2))) (range 3))
+        (filter (lambda (x) (if (sleep 0) x (> x 0))) (range 3))
+        ''')
+        self.assertEqual([type(value) for value in sync], [list, LazySeq, LazySeq])
+        self.assertEqual([type(value) for value in results],
+                         [type(value) for value in sync])
+        self.assertEqual(results, sync)
+
+    async def test_special_forms_match_sync(self):
+        """特殊形式の規則（エラーを含む）は同期の評価器と同じ"""
+        for source in ('(if 1 2)', '(define x)', '(lambda (x))', '(for i 1 2)'):
+            with self.subTest(source=source):
+                with self.assertRaises(ValueError) as sync_error:
+                    Interpreter().run(source)
+                with self.assertRaises(ValueError) as async_error:
+                    await AsyncInterpreter().run(source)
+                self.assertEqual(str(async_error.exception),
+                                 str(sync_error.exception))
+
+    async def test_matches_eval_lisp(self):
+        """値とエラーが evaluator.eval_lisp と一致する"""
+        sources = [
+            '(if (< 1 2) "a" "b")',
+            '(if 0 1 (+ 1 1))',
+            '(define x 3) (* x x)',
+            '(let ((x 1) (y 2)) (define z 3) (+ x y z))',
+            '(for i 3 1 i)',
+            '(for i 1 4 (* i 2))',
+            '((lambda (x y) (- x y)) 5 2)',
+            '(defmemo sq (x) (* x x)) (list (sq 3) (sq 3))',
+            '(define count (lambda (n) (if (= n 0) 0 (count (- n 1)))))'
+            ' (count 3000)',
+            '(map (lambda (x) (* x x)) (list 1 2 3))',
+            '(+ 1 2 3) (- 5) (< 1 2 3) (list)',
+            '()',
+            'undefined',
+            '(1 2)',
+            '((lambda (x y) x) 1)',
+            '(if 1 2)',
+            '(define x)',
+            '(lambda (x))',
+            '(for i 1 2)',
+            '(let ((x)) x)',
+            '(let ((x 1)))',
+            '(defmemo f (x))',
+            '(car 1)',
+        ]
+
+        for source in sources:
+            with self.subTest(source=source):
+                try:
+                    expected = 'ok', Interpreter(engine='tree').run(source)[-1]
+                except Exception as e:
+                    expected = type(e), str(e)
+                try:
+                    actual = 'ok', (await AsyncInterpreter().run(source))[-1]
+                except Exception as e:
+                    actual = type(e), str(e)
+                self.assertEqual(actual, expected)
+
+    def test_import_does_not_need_source(self):
+        """ソースファイルがなくても（.pyc だけでも）読み込める"""
+        try:
+            with mock.patch('inspect.getsource', side_effect=OSError):
+                importlib.reload(aio)
+        finally:
+            importlib.reload(aio)
+
+    async def test_packed_nodes_are_not_unpacked(self):
+        """パック済みASTをリストに展開せずに評価する"""
+        interpreter = AsyncInterpreter()
+        with mock.patch.object(PackedAST, 'unpack', side_effect=AssertionError):
+            results = [await interpreter.eval(expr)
+                       for expr in parse_packed(tokenize(f'{FIB} (fib 10)'))]
+        self.assertEqual(results[-1], 55)
+
+    async def test_async_builtin_in_sync_context(self):
+        """同期的な評価から非同期の組み込み関数は呼べない"""
+        with self.assertRaises(TypeError):
+            await AsyncInterpreter().run('((memoize (lambda (x) (sleep x))) 0)')
+
+    async def test_error_location(self):
+        """エラーに発生位置の注記が付く"""
+        with self.assertRaises(NameError) as cm:
+            await AsyncInterpreter().run('(define f (lambda () (g 1)))\n(f)', 'x.lisp')
+        self.assertIn('場所: x.lisp:1:22', cm.exception.__notes__)
+
+    async def test_eval_async(self):
+        """環境を省略すると新しいグローバル環境で評価する"""
+        expr = parse(tokenize('(+ 1 2)'))[0]
+        self.assertEqual(await eval_async(expr), 3)
+
+
+class TestRunAsync(unittest.TestCase):
+
+    def test_run_async(self):
+        """同期コードから新しいイベントループで評価できる"""
+        self.assertEqual(run_async('(define x 2) (* x 21)')[-1], 42)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import contextlib
+import io
+import json
+import tempfile
+import unicodedata
+import unittest
+from pathlib import Path
+
+from lispy import bench
+
+
+def display_width(text):
+    return sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1
+               for c in text)
+
+
+class TestBench(unittest.TestCase):
+
+    def test_run_benchmarks(self):
+        """全てのベンチマークの統計を返す"""
+        for engine in ('tree', 'vm'):
+            with self.subTest(engine=engine):
+                result = bench.run_benchmarks(engine=engine, repeat=1, scale=0.001)
+                self.assertEqual(set(result['results']), set(bench.BENCHMARKS))
+                for stats in result['results'].values():
+                    self.assertGreaterEqual(stats['median'], stats['min'])
+
+    def test_unknown_benchmark(self):
+        """未知のベンチマーク名はエラー"""
+        with self.assertRaises(ValueError):
+            bench.run_benchmarks(['nothing'])
+
+    def test_compare_detects_regression(self):
+        """しきい値を超えて遅くなったものを退行とする"""
+        baseline = {'results': {'a': {'min': 1.0}, 'b': {'min': 1.0}}}
+        current = {'results': {'a': {'min': 1.1}, 'b': {'min': 1.5},
+                               'c': {'min': 9.0}}}
+        rows = bench.compare(current, baseline, threshold=0.2)
+        self.assertEqual([(row['name'], row['regressed']) for row in rows],
+                         [('a', False), ('b', True)])
+
+    def test_compare_requires_same_conditions(self):
+        """エンジンや入力の大きさが違うベースラインとは比較しない"""
+        current = {'engine': 'tree', 'scale': 1.0, 'python': '3.11.7',
+                   'results': {'a': {'min': 1.0}}}
+        for key, value in (('engine', 'vm'), ('scale', 0.5),
+                           ('python', '3.12.1')):
+            with self.subTest(key=key):
+                baseline = {**current, key: value}
+                with self.assertRaisesRegex(ValueError, key):
+                    bench.compare(current, baseline)
+        # Python のパッチバージョンの違いは比較できる
+        baseline = {**current, 'python': '3.11.2'}
+        self.assertEqual(len(bench.compare(current, baseline)), 1)
+
+    def test_format_comparison_columns(self):
+        """表の見出しと行の列の位置（表示幅）がそろう"""
+        rows = bench.compare({'results': {'parse_wide': {'min': 2.0}}},
+                             {'results': {'parse_wide': {'min': 1.0}}})
+        header, row = bench.format_comparison(rows).splitlines()
+        self.assertEqual(display_width(header),
+                         display_width(row.removesuffix('  退行')))
+        self.assertTrue(row.endswith('退行'))
+
+    def test_main_refuses_mismatched_baseline(self):
+        """計測条件の違うベースラインでは 2 を返す"""
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = Path(tmp) / 'baseline.json'
+            baseline.write_text(json.dumps(
+                {'engine': 'vm', 'results': {}}), encoding='utf-8')
+            with contextlib.redirect_stderr(io.StringIO()) as stderr, \
+                    contextlib.redirect_stdout(io.StringIO()):
+                status = bench.main(['parse_wide', '--repeat', '1',
+                                     '--scale', '0.001',
+                                     '--baseline', str(baseline)])
+            self.assertEqual(status, 2)
+            self.assertIn('engine', stderr.getvalue())
+
+    def test_main_rejects_non_positive_scale(self):
+        """--scale は正の数でなければならない"""
+        for scale in ('0', '-1', 'nan', 'abc'):
+            with contextlib.redirect_stderr(io.StringIO()) as stderr, \
+                    self.assertRaises(SystemExit) as cm:
+                bench.main(['eval_recursion', '--scale', scale])
+            self.assertEqual(cm.exception.code, 2)
+            self.assertIn('--scale', stderr.getvalue())
+
+    def test_main_reports_unreadable_baseline(self):
+        """ベースラインが読めなければ 2 を返す"""
+        with tempfile.TemporaryDirectory() as tmp:
+            broken = Path(tmp) / 'broken.json'
+            broken.write_text('{', encoding='utf-8')
+            for path in (Path(tmp) / 'missing.json', broken):
+                with contextlib.redirect_stderr(io.StringIO()) as stderr, \
+                        contextlib.redirect_stdout(io.StringIO()):
+                    status = bench.main(['parse_wide', '--repeat', '1',
+                                         '--scale', '0.001',
+                                         '--baseline', str(path)])
+                self.assertEqual(status, 2)
+                self.assertIn('ベースライン', stderr.getvalue())
+
+    def test_main_writes_json_and_fails_on_regression(self):
+        """JSON を書き出し、ベースラインより遅ければ 1 を返す"""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'result.json'
+            baseline = Path(tmp) / 'baseline.json'
+            baseline.write_text(json.dumps(
+                {'results': {'parse_wide': {'min': 1e-9}}}), encoding='utf-8')
+            with contextlib.redirect_stderr(io.StringIO()):
+                status = bench.main(['parse_wide', '--repeat', '1', '--scale', '0.001',
+                                     '-o', str(output), '--baseline', str(baseline)])
+            self.assertEqual(status, 1)
+            result = json.loads(output.read_text(encoding='utf-8'))
+            self.assertIn('parse_wide', result['results'])
+
+
+if __name__ == '__main__':
+    unittest.main()
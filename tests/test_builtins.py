@@ -0,0 +1,188 @@
+import unittest
+from unittest import mock
+
+from lispy import builtins
+from lispy.builtins import BUILTINS, LazySeq
+from lispy.evaluator import create_global_env, eval_lisp
+from lispy.interpreter import Interpreter
+from lispy.parser import parse
+from lispy.tokenizer import tokenize
+
+
+def run(code, env=None):
+    env = env or create_global_env()
+    result = None
+    for expr in parse(tokenize(code)):
+        result = eval_lisp(expr, env)
+    return result
+
+
+class TestLazySeq(unittest.TestCase):
+
+    def test_range_is_lazy(self):
+        """rangeは遅延シーケンスを返す"""
+        result = run('(range 0 5)')
+        self.assertIsInstance(result, LazySeq)
+        self.assertEqual(result, [0, 1, 2, 3, 4])
+        self.assertEqual(str(result), '[0, 1, 2, 3, 4]')
+
+    def test_huge_pipeline_is_not_materialized(self):
+        """巨大な範囲でも必要な分だけ計算する"""
+        result = run('(sum (take 5 (map (lambda (x) (* x x)) (range 0 1000000000000))))')
+        self.assertEqual(result, 0 + 1 + 4 + 9 + 16)
+
+    def test_length_of_range_does_not_iterate(self):
+        """長さが分かっているシーケンスは走査せずに長さを返す"""
+        self.assertEqual(run('(length (map str (range 0 1000000000000)))'), 1000000000000)
+
+    def test_length_of_filter(self):
+        """filterの長さは走査して数える"""
+        result = run('(length (filter (lambda (x) (= (% x 3) 0)) (range 0 30)))')
+        self.assertEqual(result, 10)
+
+    def test_sequence_can_be_traversed_twice(self):
+        """遅延シーケンスは何度でも走査できる"""
+        env = create_global_env()
+        run('(define xs (map (lambda (x) (+ x 1)) (range 0 3)))', env)
+        self.assertEqual(run('(sum xs)', env), 6)
+        self.assertEqual(run('(sum xs)', env), 6)
+
+    def test_reduce(self):
+        """reduceは初期値から順に畳み込む"""
+        result = run('(reduce (lambda (acc x) (+ acc (* 2 x))) 100 (range 1 4))')
+        self.assertEqual(result, 112)
+
+    def test_truthiness(self):
+        """空のシーケンスは偽"""
+        self.assertEqual(run('(if (filter (lambda (x) (> x 10)) (range 0 5)) 1 0)'), 0)
+        self.assertEqual(run('(if (range 0 1) 1 0)'), 1)
+
+    def test_map_over_list(self):
+        """通常のリストもmapできる"""
+        self.assertEqual(BUILTINS['map'](str, [1, 2]), ['1', '2'])
+
+    def test_map_over_list_is_eager(self):
+        """リストに対する map/filter はその場で計算してリストを返す"""
+        calls = []
+        env = create_global_env()
+        env.define('f', lambda x: calls.append(x) or x)
+        self.assertEqual(run('(map f (list 1 2))', env), [1, 2])
+        self.assertEqual(run('(filter f (list 0 3))', env), [3])
+        self.assertEqual(calls, [1, 2, 0, 3])
+        with self.assertRaises(NameError):
+            run('(map (lambda (x) (car x)) (list 1 2))')
+
+    def test_callbacks_run_once(self):
+        """map の関数は走査を繰り返しても1回ずつしか呼ばれない"""
+        calls = []
+        env = create_global_env()
+        env.define('f', lambda x: calls.append(x) or x)
+        run('(define xs (map f (range 0 3)))', env)
+        self.assertEqual(run('(if xs (+ (sum xs) (sum xs)) 0)', env), 6)
+        self.assertEqual(run('(length xs)', env), 3)
+        self.assertEqual(calls, [0, 1, 2])
+
+    def test_length_runs_callbacks(self):
+        """ユーザー定義関数の map の長さは関数を呼んで数える"""
+        with self.assertRaises(NameError):
+            run('(length (map (lambda (x) (car x)) (range 0 3)))')
+
+    def test_length_runs_partial_builtins(self):
+        """例外を出しうる組み込み関数の map の長さも関数を呼んで数える"""
+        with self.assertRaises(ValueError):
+            run('(length (map sqrt (range (- 0 5) 0)))')
+        with self.assertRaises(TypeError):
+            run('(length (map filter (range 0 3)))')
+
+    def test_long_sequence_is_not_cached(self):
+        """CACHE_LIMIT より長いシーケンスは覚えずに計算し直す"""
+        calls = []
+        env = create_global_env()
+        env.define('f', lambda x: calls.append(x) or x)
+        with mock.patch.object(builtins, 'CACHE_LIMIT', 2):
+            run('(define xs (map f (range 0 4)))', env)
+            self.assertEqual(run('(sum xs)', env), 6)
+            self.assertEqual(run('(sum xs)', env), 6)
+        self.assertEqual(calls, [0, 1, 2, 3, 0, 1, 2, 3])
+
+
+class TestOperators(unittest.TestCase):
+
+    def test_chained_comparison(self):
+        """比較演算子は3つ以上の引数を連鎖して比較する"""
+        self.assertIs(run('(< 1 2 3)'), True)
+        self.assertIs(run('(< 1 3 2)'), False)
+        self.assertIs(run('(= 2 2 2)'), True)
+
+    def test_subtraction(self):
+        """減算は最初の引数から残りを引く"""
+        self.assertEqual(run('(- 10 1 2 3)'), 4)
+        self.assertEqual(run('(- 10 4)'), 6)
+
+    def test_addition_is_the_same_at_every_arity(self):
+        """+ は引数の個数によらず同じ規則で足す（文字列は連結する）"""
+        for engine in ('tree', 'compile', 'vm'):
+            with self.subTest(engine=engine):
+                results = Interpreter(engine).run(
+                    '(+ "a" "b") (+ "a" "b" "c") (+ 1 2 3) (+)')
+                self.assertEqual(results, ['ab', 'abc', 6, 0])
+
+
+class TestMemoize(unittest.TestCase):
+
+    def test_cache_hit(self):
+        """同じ引数の2回目の呼び出しはキャッシュから返す"""
+        env = create_global_env()
+        run('(define sq (memoize (lambda (x) (* x x))))', env)
+        self.assertEqual(run('(sq 3) (sq 3) (sq 4)', env), 16)
+        self.assertEqual(run('(memo_stats sq)', env), [1, 2, 2, 1024])
+
+    def test_lru_eviction(self):
+        """最大サイズを超えると最も古く使われた結果を捨てる"""
+        env = create_global_env()
+        run('(define f (memoize (lambda (x) x) 2))', env)
+        run('(f 1) (f 2) (f 1) (f 3)', env)
+        self.assertEqual(run('(memo_stats f)', env), [1, 3, 2, 2])
+        run('(f 1) (f 2)', env)
+        self.assertEqual(run('(memo_stats f)', env), [2, 4, 2, 2])
+
+    def test_list_arguments(self):
+        """リストの引数もキーとして使える"""
+        env = create_global_env()
+        run('(define total (memoize (lambda (xs) (sum xs))))', env)
+        self.assertEqual(run('(total (list 1 2)) (total (list 1 2))', env), 3)
+        self.assertEqual(run('(memo_stats total)', env)[:2], [1, 1])
+
+    def test_typed_keys(self):
+        """1 と 1.0 は別のキーとしてキャッシュする"""
+        env = create_global_env()
+        run('(define f (memoize (lambda (x) (list x))))', env)
+        self.assertEqual(run('(f 1)', env), [1])
+        result = run('(f (/ 2 2))', env)
+        self.assertEqual(result, [1.0])
+        self.assertIs(type(result[0]), float)
+        self.assertIs(type(run('(f (list 1))', env)[0][0]), int)
+        self.assertIs(type(run('(f (list (/ 2 2)))', env)[0][0]), float)
+
+    def test_lazy_sequence_is_not_cached(self):
+        """遅延シーケンスの引数はキャッシュせずにそのまま呼び出す"""
+        env = create_global_env()
+        run('(define f (memoize (lambda (xs) (take 2 xs))))', env)
+        self.assertEqual(list(run('(f (range 0 1000000000000))', env)),
+                         [0, 1])
+        self.assertEqual(run('(memo_stats f)', env), [0, 1, 0, 1024])
+
+    def test_clear(self):
+        """memo_clearでキャッシュと統計をリセットする"""
+        env = create_global_env()
+        run('(define f (memoize (lambda (x) x))) (f 1) (memo_clear f)', env)
+        self.assertEqual(run('(memo_stats f)', env), [0, 0, 0, 1024])
+
+    def test_invalid_maxsize(self):
+        """最大サイズは正の整数でなければならない"""
+        with self.assertRaises(ValueError):
+            run('(memoize (lambda (x) x) 0)')
+
+
+if __name__ == '__main__':
+    unittest.main()
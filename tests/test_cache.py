@@ -0,0 +1,79 @@
+import contextlib
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lispy import cache
+from lispy.lispy import run_file
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmpdir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_store_and_load(self):
+        """保存したプログラムを読み込める"""
+        path = self.tmpdir / 'a.lspc'
+        program = [['+', 1, 2], ('STRING_LITERAL', 'x')]
+        self.assertTrue(cache.store(path, 'abc', program))
+        self.assertEqual(cache.load(path, 'abc'), program)
+
+    def test_stale_hash(self):
+        """ソースのハッシュが変わったキャッシュは使わない"""
+        path = self.tmpdir / 'a.lspc'
+        cache.store(path, 'abc', [1])
+        self.assertIsNone(cache.load(path, 'def'))
+
+    def test_missing_or_corrupt_file(self):
+        """存在しない・壊れたキャッシュは None"""
+        path = self.tmpdir / 'a.lspc'
+        self.assertIsNone(cache.load(path, 'abc'))
+        path.write_bytes(b'LSPC garbage')
+        self.assertIsNone(cache.load(path, 'abc'))
+
+    def test_cache_path(self):
+        """キャッシュはソースの隣の __lspcache__ に置かれる"""
+        path = cache.cache_path(Path('dir/prog.lisp'))
+        self.assertEqual(path, Path('dir/__lspcache__/prog.lisp.lspc'))
+
+    def test_run_file_uses_cache(self):
+        """2回目の実行ではパースを省略する"""
+        source = self.tmpdir / 'prog.lisp'
+        source.write_text('(+ 1 2)', encoding='utf-8')
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(run_file(source), 3)
+            self.assertTrue(cache.cache_path(source).exists())
+            with mock.patch('lispy.lispy.parse') as parse:
+                self.assertEqual(run_file(source), 3)
+                parse.assert_not_called()
+
+    def test_cached_program_keeps_positions(self):
+        """キャッシュから読み込んだプログラムでもエラーの位置が分かる"""
+        source = self.tmpdir / 'prog.lisp'
+        source.write_text('(+ 1 2)\n(car 1)', encoding='utf-8')
+        for _ in range(2):
+            err = io.StringIO()
+            with contextlib.redirect_stdout(io.StringIO()), \
+                    contextlib.redirect_stderr(err):
+                self.assertIsNone(run_file(source))
+            self.assertIn(f'{source}:2:1', err.getvalue())
+
+    def test_run_file_detects_changes(self):
+        """ソースが変わったら再パースする"""
+        source = self.tmpdir / 'prog.lisp'
+        with contextlib.redirect_stdout(io.StringIO()):
+            source.write_text('(+ 1 2)', encoding='utf-8')
+            self.assertEqual(run_file(source), 3)
+            source.write_text('(* 2 5)', encoding='utf-8')
+            self.assertEqual(run_file(source), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
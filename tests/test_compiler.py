@@ -0,0 +1,184 @@
+import unittest
+
+from lispy.compiler import Scope, compile_lisp, eval_compiled
+from lispy.evaluator import Environment, create_global_env, eval_lisp
+from lispy.parser import parse
+from lispy.tokenizer import tokenize
+
+
+def parse_one(code):
+    return parse(tokenize(code))[0]
+
+
+class TestCompiler(unittest.TestCase):
+
+    def test_compile_number(self):
+        """数値リテラルのコンパイル"""
+        self.assertEqual(eval_compiled(42), 42)
+
+    def test_compile_string_literal(self):
+        """文字列リテラルのコンパイル"""
+        self.assertEqual(eval_compiled(('STRING_LITERAL', 'hello')), 'hello')
+
+    def test_compile_symbol(self):
+        """シンボルのコンパイル（変数参照）"""
+        env = Environment()
+        env.define('x', 10)
+        self.assertEqual(eval_compiled('x', env), 10)
+
+    def test_compile_undefined_symbol(self):
+        """未定義シンボルは実行時にエラー"""
+        code = compile_lisp('undefined')
+        with self.assertRaises(NameError):
+            code(create_global_env())
+
+    def test_compile_nested_expression(self):
+        """入れ子式のコンパイル"""
+        self.assertEqual(eval_compiled(['+', 1, ['*', 2, 3]]), 7)
+
+    def test_compile_variadic_call(self):
+        """3個以上の引数を持つ呼び出し"""
+        self.assertEqual(eval_compiled(['+', 1, 2, 3, 4]), 10)
+
+    def test_compile_empty_list(self):
+        """空リストのコンパイル"""
+        self.assertEqual(eval_compiled([]), [])
+
+    def test_compile_if(self):
+        """if式のコンパイル"""
+        self.assertEqual(eval_compiled(parse_one('(if (< 1 2) 10 20)')), 10)
+        self.assertEqual(eval_compiled(parse_one('(if (> 1 2) 10 20)')), 20)
+
+    def test_compile_let(self):
+        """let式のコンパイル"""
+        code = parse_one('(let ((x 10) (y 20)) (+ x y))')
+        self.assertEqual(eval_compiled(code), 30)
+
+    def test_compile_lambda(self):
+        """lambda式のコンパイル"""
+        code = parse_one('((lambda (x y) (* x y)) 6 7)')
+        self.assertEqual(eval_compiled(code), 42)
+
+    def test_compile_lambda_arity_error(self):
+        """lambdaの引数の数が合わない場合のエラー"""
+        code = parse_one('((lambda (x) x) 1 2)')
+        with self.assertRaises(ValueError):
+            eval_compiled(code)
+
+    def test_compile_closure_captures_env(self):
+        """lambdaが定義時の環境を捕捉する"""
+        code = parse_one('(let ((n 5)) (map (lambda (x) (+ x n)) (range 0 3)))')
+        self.assertEqual(eval_compiled(code), [5, 6, 7])
+
+    def test_compile_for(self):
+        """for式のコンパイル"""
+        code = parse_one('(let ((f (lambda (i) (* i i)))) (for i 1 4 (f i)))')
+        self.assertEqual(eval_compiled(code), 16)
+
+    def test_compile_syntax_error(self):
+        """構文エラーはコンパイル時に検出される"""
+        with self.assertRaises(ValueError):
+            compile_lisp(['if', 1, 2])
+
+    def test_compile_non_callable_error(self):
+        """呼び出し不可能なオブジェクトのエラー"""
+        env = Environment()
+        env.define('not_func', 42)
+        with self.assertRaises(TypeError):
+            eval_compiled(['not_func', 1, 2], env)
+
+    def test_compiled_code_is_reusable(self):
+        """コンパイル結果は異なる環境で再利用できる"""
+        code = compile_lisp(['+', 'x', 1])
+        env1 = create_global_env()
+        env1.define('x', 1)
+        env2 = create_global_env()
+        env2.define('x', 41)
+        self.assertEqual(code(env1), 2)
+        self.assertEqual(code(env2), 42)
+
+    def test_scope_resolve(self):
+        """変数を (深さ, スロット番号) に解決する"""
+        outer = Scope(['x', 'y'])
+        inner = Scope(['z'], outer)
+        self.assertEqual(inner.resolve('z'), (0, 0))
+        self.assertEqual(inner.resolve('y'), (1, 1))
+        self.assertIsNone(inner.resolve('+'))
+
+    def test_scope_resolve_shadowing(self):
+        """内側の束縛が外側の同名の束縛を隠す"""
+        outer = Scope(['x'])
+        inner = Scope(['y', 'x'], outer)
+        self.assertEqual(inner.resolve('x'), (0, 1))
+
+    def test_compile_shadowing(self):
+        """ネストしたletで内側の束縛が優先される"""
+        code = parse_one('(let ((x 1)) (let ((x 2)) x))')
+        self.assertEqual(eval_compiled(code), 2)
+
+    def test_compile_deeply_nested_reference(self):
+        """深くネストしたスコープから外側の変数を参照する"""
+        code = parse_one(
+            '(let ((a 1)) (let ((b 2)) (let ((c 3)) (let ((d 4)) '
+            '((lambda (e) (+ a b c d e)) 5)))))'
+        )
+        self.assertEqual(eval_compiled(code), 15)
+
+    def test_compile_local_shadows_global(self):
+        """ローカル変数がグローバルの演算子を隠す"""
+        code = parse_one('(let ((+ (lambda (a b) (* a b)))) (+ 3 4))')
+        self.assertEqual(eval_compiled(code), 12)
+
+    def test_compile_redefined_operator(self):
+        """グローバルで再定義した演算子は高速パスを使わない"""
+        env = create_global_env()
+        eval_compiled(parse_one('(define + (lambda (a b) (* a b)))'), env)
+        self.assertEqual(eval_compiled(parse_one('(+ 3 4)'), env), 12)
+
+    def test_compile_unary_operator(self):
+        """単項の演算子呼び出し"""
+        self.assertEqual(eval_compiled(parse_one('(- 5)')), -5)
+        self.assertIs(eval_compiled(parse_one('(not 0)')), True)
+
+    def test_compile_define_global(self):
+        """トップレベルのdefineはグローバル環境に定義する"""
+        env = create_global_env()
+        self.assertEqual(eval_compiled(['define', 'x', 5], env), 5)
+        self.assertEqual(env.lookup('x'), 5)
+
+    def test_compile_define_local(self):
+        """ローカルスコープのdefineは新しいスロットに定義する"""
+        code = parse_one('(let ((x 1)) (define y 2) (+ x y))')
+        env = create_global_env()
+        self.assertEqual(eval_compiled(code, env), 3)
+        with self.assertRaises(NameError):
+            env.lookup('y')
+
+    def test_compile_unset_local_define(self):
+        """実行されなかったローカルdefineはツリー評価器と同じく外側を参照する"""
+        source = ("(define h (lambda (c) (let ((z 1))"
+                  " (if c (define w 2) 0) (define q 3) w)))")
+        env = create_global_env()
+        eval_compiled(parse_one(source), env)
+        with self.assertRaisesRegex(NameError, 'Undefined variable: w'):
+            eval_compiled(parse_one('(h 0)'), env)
+        self.assertEqual(eval_compiled(parse_one('(h 1)'), env), 2)
+        eval_compiled(parse_one('(define w 5)'), env)
+        self.assertEqual(eval_compiled(parse_one('(h 0)'), env), 5)
+
+    def test_matches_tree_evaluator(self):
+        """ツリー評価器と同じ結果を返す"""
+        sources = [
+            '(for i 1 15 (if (= (% i 15) 0) "FizzBuzz" (str i)))',
+            '(let ((sq (lambda (x) (* x x)))) (map sq (range 1 6)))',
+            '(filter (lambda (x) (= (% x 2) 0)) (range 0 10))',
+            '(concat "a" (str 1) "b")',
+        ]
+        for source in sources:
+            with self.subTest(source=source):
+                expr = parse_one(source)
+                self.assertEqual(eval_compiled(expr), eval_lisp(expr))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 
-from lispy.evaluator import Environment, create_global_env, eval_lisp
+from lispy.evaluator import (Environment, Procedure, create_global_env,
+                             eval_lisp)
 
 
 class TestEvaluator(unittest.TestCase):
@@ -104,6 +105,38 @@ class TestEvaluator(unittest.TestCase):
         self.assertTrue(callable(env.lookup('*')))
         self.assertTrue(callable(env.lookup('/')))
 
+    def test_eval_define(self):
+        """defineで変数を定義"""
+        env = create_global_env()
+        result = eval_lisp(['define', 'x', ['+', 1, 2]], env)
+        self.assertEqual(result, 3)
+        self.assertEqual(env.lookup('x'), 3)
+
+    def test_eval_lambda_is_procedure(self):
+        """lambda式はユーザー定義関数を返す"""
+        func = eval_lisp(['lambda', ['x'], ['*', 'x', 2]])
+        self.assertIsInstance(func, Procedure)
+        self.assertEqual(func(21), 42)
+
+    def test_eval_deep_tail_recursion(self):
+        """末尾再帰はPythonの再帰上限を超えても評価できる"""
+        env = create_global_env()
+        eval_lisp(['define', 'count',
+                   ['lambda', ['n', 'acc'],
+                    ['if', ['=', 'n', 0],
+                     'acc',
+                     ['count', ['-', 'n', 1], ['+', 'acc', 1]]]]], env)
+        self.assertEqual(eval_lisp(['count', 20000, 0], env), 20000)
+
+    def test_eval_tail_call_through_let(self):
+        """letの最後の式からの末尾呼び出し"""
+        env = create_global_env()
+        eval_lisp(['define', 'down',
+                   ['lambda', ['n'],
+                    ['let', [['m', ['-', 'n', 1]]],
+                     ['if', ['<', 'm', 0], 'n', ['down', 'm']]]]], env)
+        self.assertEqual(eval_lisp(['down', 20000], env), 0)
+
     def test_eval_non_callable_error(self):
         """呼び出し不可能なオブジェクトのエラー"""
         env = Environment()
@@ -0,0 +1,83 @@
+import unittest
+
+from lispy.builtins import GLOBALS
+from lispy.interpreter import ENGINES, Interpreter
+
+
+class TestInterpreter(unittest.TestCase):
+
+    def test_run_multiple_forms(self):
+        """複数の式を順に評価する"""
+        interpreter = Interpreter()
+        self.assertEqual(interpreter.run('(+ 1 2) (* 3 4)'), [3, 12])
+
+    def test_definitions_persist_across_forms(self):
+        """defineした値が後続の式から参照できる"""
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(engine)
+                interpreter.run('(define x 40)')
+                self.assertEqual(interpreter.run('(+ x 2)'), [42])
+
+    def test_recursive_definition(self):
+        """defineした関数から自分自身を再帰呼び出しできる"""
+        source = '''
+        (define fact (lambda (n) (if (= n 0) 1 (* n (fact (- n 1))))))
+        (fact 10)
+        '''
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(Interpreter(engine).run(source)[-1], 3628800)
+
+    def test_defmemo(self):
+        """defmemoで定義した再帰関数は部分問題の結果を再利用する"""
+        source = '''
+        (defmemo fib (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))
+        (fib 60)
+        (memo_stats fib)
+        '''
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                results = Interpreter(engine).run(source)
+                self.assertEqual(results[1], 1548008755920)
+                self.assertEqual(results[2], [58, 61, 61, 1024])
+
+    def test_error_location(self):
+        """実行時エラーには発生した式の位置の注記が付く"""
+        source = '(define f (lambda (x)\n  (+ x y)))\n(f 1)'
+        expected = {'tree': 'prog.lisp:2:3', 'compile': 'prog.lisp:3:1',
+                    'vm': 'prog.lisp:3:1'}
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                with self.assertRaises(NameError) as cm:
+                    Interpreter(engine).run(source, filename='prog.lisp')
+                self.assertEqual(cm.exception.__notes__,
+                                 [f'場所: {expected[engine]}'])
+
+    def test_global_env_is_built_once(self):
+        """同じセッションでは同じグローバル環境を使う"""
+        interpreter = Interpreter()
+        env = interpreter.env
+        interpreter.run('(+ 1 2)')
+        self.assertIs(interpreter.env, env)
+
+    def test_sessions_are_isolated(self):
+        """別のセッションの定義は見えない"""
+        first = Interpreter()
+        first.run('(define x 1)')
+        with self.assertRaises(NameError):
+            Interpreter().run('x')
+
+    def test_builtin_table_is_read_only(self):
+        """構築済みの組み込みテーブルは変更できない"""
+        with self.assertRaises(TypeError):
+            GLOBALS['+'] = None
+
+    def test_unknown_engine(self):
+        """未知の評価エンジンはエラー"""
+        with self.assertRaises(ValueError):
+            Interpreter('unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+
+from lispy import evaluator
+from lispy.interpreter import Interpreter
+from lispy.limits import Limits, ResourceExhausted
+from lispy.metrics import Metrics
+
+FIB = '(define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))'
+
+
+class TestLimits(unittest.TestCase):
+
+    def run_limited(self, source, **limits):
+        return Interpreter(limits=Limits(**limits)).run(source)
+
+    def test_max_steps(self):
+        """無限ループは評価ステップ数の上限で止まる"""
+        with self.assertRaises(ResourceExhausted) as cm:
+            self.run_limited('(define loop (lambda () (loop))) (loop)', max_steps=5000)
+        self.assertEqual(cm.exception.resource, 'steps')
+        self.assertEqual(cm.exception.limit, 5000)
+
+    def test_max_time(self):
+        """実行時間の上限を超えたら止まる"""
+        with self.assertRaises(ResourceExhausted) as cm:
+            self.run_limited('(for i 0 1000000000 i)', max_time=0.2)
+        self.assertEqual(cm.exception.resource, 'time')
+
+    def test_max_depth(self):
+        """末尾呼び出しでない再帰は深さの上限で止まる"""
+        with self.assertRaises(ResourceExhausted) as cm:
+            self.run_limited('(define f (lambda (n) (+ 1 (f n)))) (f 0)', max_depth=200)
+        self.assertEqual(cm.exception.resource, 'depth')
+
+    def test_max_list_size(self):
+        """大きすぎるリストを作ったら止まる"""
+        for source in ('(range 1000000)', '(list 1 2 3 4)'):
+            with self.subTest(source=source):
+                with self.assertRaises(ResourceExhausted) as cm:
+                    self.run_limited(source, max_list_size=3)
+                self.assertEqual(cm.exception.resource, 'list_size')
+        self.assertEqual(self.run_limited('(list 1 2 3)', max_list_size=3), [[1, 2, 3]])
+
+    def test_within_limits(self):
+        """上限に収まる評価は制限なしと同じ結果になる"""
+        source = f'{FIB} (fib 15) (map fib (range 10))'
+        self.assertEqual(
+            self.run_limited(source, max_steps=10**6, max_time=60, max_depth=500,
+                             max_list_size=100)[1:],
+            Interpreter().run(source)[1:])
+
+    def test_error_location(self):
+        """エラーに発生位置の注記が付く"""
+        with self.assertRaises(ResourceExhausted) as cm:
+            Interpreter(limits=Limits(max_steps=100)).run(
+                '(define loop (lambda () (loop)))\n(loop)', 'x.lisp')
+        self.assertTrue(any(note.startswith('場所: x.lisp:')
+                            for note in cm.exception.__notes__))
+
+    def test_steps(self):
+        """評価したステップ数（式の数）を数え、with 文に入るたびに 0 に戻す"""
+        limits = Limits(max_steps=1000)
+        with limits:
+            Interpreter().run('(+ 1 (* 2 3))')
+        self.assertEqual(limits.steps, 7)
+        with limits:
+            Interpreter().run('(+ 1 2)')
+        self.assertEqual(limits.steps, 4)
+
+    def test_restores_evaluator(self):
+        """with 文を抜けたら（例外でも）制限が外れる"""
+        original = evaluator.eval_lisp
+        with self.assertRaises(ResourceExhausted):
+            with Limits(max_steps=10):
+                Interpreter().run('(define loop (lambda () (loop))) (loop)')
+        self.assertIs(evaluator.eval_lisp, original)
+        self.assertIsNone(evaluator.LIMITS)
+        self.assertEqual(Interpreter().run('(+ 1 2)'), [3])
+
+    def test_interleaved_with_metrics(self):
+        """メトリクスと入れ子にならない順で有効・無効にしても元に戻る"""
+        original = evaluator.eval_lisp
+        limits, metrics = Limits(max_steps=10), Metrics()
+        limits.__enter__()
+        metrics.enable()
+        limits.__exit__(None, None, None)
+        metrics.disable()
+        self.assertIs(evaluator.eval_lisp, original)
+        self.assertIsNone(evaluator.LIMITS)
+        self.assertEqual(Interpreter().run('(for i 1 100 i)'), [100])
+
+    def test_only_one_at_a_time(self):
+        """同時に有効にできる制限は1つだけ"""
+        with Limits(max_steps=10):
+            with self.assertRaises(RuntimeError):
+                with Limits(max_steps=20):
+                    pass
+        with self.assertRaises(RuntimeError):
+            Limits().__exit__(None, None, None)
+
+    def test_tree_engine_only(self):
+        """tree 以外のエンジンでは使えない"""
+        with self.assertRaises(ValueError):
+            Interpreter(engine='vm', limits=Limits(max_steps=10))
+
+    def test_as_dict(self):
+        """設定した上限だけを辞書で返す"""
+        self.assertEqual(Limits(max_steps=10, max_depth=5).as_dict(),
+                         {'max_steps': 10, 'max_depth': 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lispy import lispy
+
+
+class TestRunStream(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.source = Path(self._tmp.name) / 'prog.lisp'
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_run_stream_evaluates_each_form(self):
+        """式ごとに評価し、評価した式の数を返す"""
+        self.source.write_text('(define x 2)\n(print (* x 21))\n', encoding='utf-8')
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            count = lispy.run_stream(self.source)
+        self.assertEqual(count, 2)
+        self.assertEqual(out.getvalue(), '42\n')
+
+    def test_run_stream_small_chunks(self):
+        """チャンク境界をまたぐ式も正しく評価する"""
+        self.source.write_text(
+            '(print (concat "fizz" "buzz"))\n(print (+ 100 200))\n',
+            encoding='utf-8')
+        out = io.StringIO()
+        with mock.patch.object(lispy, 'STREAM_CHUNK_SIZE', 3), \
+                contextlib.redirect_stdout(out):
+            lispy.run_stream(self.source, engine='compile')
+        self.assertEqual(out.getvalue(), 'fizzbuzz\n300\n')
+
+    def test_run_stream_missing_file(self):
+        """存在しないファイルは None"""
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertIsNone(lispy.run_stream(self.source))
+
+
+class TestStartup(unittest.TestCase):
+
+    def run_cli(self, *args):
+        code = ('import sys, lispy; lispy.main(); '
+                'print("prompt_toolkit" in sys.modules, "lispy.compiler" in sys.modules)')
+        src = str(Path(lispy.__file__).resolve().parents[1])
+        env = {**os.environ, 'PYTHONPATH': src}
+        return subprocess.run([sys.executable, '-c', code, *args], env=env,
+                              capture_output=True, text=True, check=True)
+
+    def test_eval_does_not_import_repl(self):
+        """-e の実行では REPL や tree 以外のエンジンを読み込まない"""
+        result = self.run_cli('-e', '(print (+ 1 2))')
+        self.assertEqual(result.stdout.split(), ['3', 'False', 'False'])
+
+    def test_startup_stats(self):
+        """--startup-stats で段階ごとの時間を標準エラーに表示する"""
+        result = self.run_cli('-e', '(+ 1 2)', '--startup-stats')
+        for stage in ('lispy パッケージの読み込み', '引数の解析', '環境の構築', '合計'):
+            self.assertIn(stage, result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
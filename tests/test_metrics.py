@@ -0,0 +1,140 @@
+import unittest
+
+from lispy import evaluator
+from lispy.evaluator import Environment, Procedure
+from lispy.interpreter import Interpreter
+from lispy.limits import Limits
+from lispy.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def measure(self, source, engine='tree'):
+        interpreter = Interpreter(engine)
+        with Metrics() as metrics:
+            interpreter.run(source)
+        return metrics
+
+    def test_evaluated_nodes(self):
+        """評価した式の数を数える"""
+        self.assertEqual(self.measure('(+ 1 (* 2 3))').evaluated_nodes, 7)
+
+    def test_lookup_depths(self):
+        """変数が見つかったスコープの深さと、見つからなかった深さを数える"""
+        metrics = self.measure('(define x 1) (let ((a 1)) (let ((b 2)) x))')
+        self.assertEqual(metrics.lookup_depths[2], 1)
+        self.assertEqual(metrics.lookup_misses[0], 1)
+        self.assertEqual(metrics.lookup_misses[1], 1)
+        self.assertEqual(metrics.lookups, 1)
+
+    def test_undefined_lookup(self):
+        """未定義の変数の検索も数え、エラーは変わらない"""
+        with self.assertRaisesRegex(NameError, 'Undefined variable: y'):
+            with Metrics() as metrics:
+                Interpreter().run('(let ((a 1)) y)')
+        self.assertEqual(metrics.undefined_lookups, 1)
+        self.assertEqual(metrics.lookup_misses[1], 1)
+
+    def test_allocations(self):
+        """環境とクロージャを作った数、変数の定義回数を数える"""
+        metrics = self.measure('(define f (lambda (x) x)) (f 1) (f 2)')
+        self.assertEqual(metrics.closures, 1)
+        self.assertEqual(metrics.environments, 2)
+        self.assertEqual(metrics.defines, 3)
+
+    def test_builtin_calls(self):
+        """組み込み関数ごとの呼び出し回数を数える（再束縛した名前は数えない）"""
+        metrics = self.measure('''
+        (+ 1 2)
+        (+ 1 2 3)
+        (length (list 1 2))
+        (let ((+ (lambda (a b) a))) (+ 1 2))
+        ''')
+        self.assertEqual(dict(metrics.builtin_calls), {'+': 2, 'list': 1, 'length': 1})
+
+    def test_other_engines(self):
+        """tree 以外のエンジンでも環境と変数検索は数える"""
+        metrics = self.measure('(define f (lambda (x) x)) (f 1)', engine='vm')
+        self.assertEqual(metrics.evaluated_nodes, 0)
+        self.assertGreater(metrics.lookups, 0)
+
+    def test_disable_restores(self):
+        """無効にすると元の関数に戻り、それ以降は数えない"""
+        originals = (evaluator.eval_lisp, Environment.__init__, Environment.define,
+                     Environment.lookup, Procedure.__init__)
+        metrics = Metrics()
+        with metrics:
+            Interpreter().run('(+ 1 2)')
+        counted = metrics.as_dict()
+        Interpreter().run('(+ 1 2)')
+        self.assertEqual(metrics.as_dict(), counted)
+        self.assertIsNone(evaluator.METRICS)
+        self.assertEqual((evaluator.eval_lisp, Environment.__init__, Environment.define,
+                          Environment.lookup, Procedure.__init__), originals)
+
+    def test_only_one_active(self):
+        """同時に有効にできるメトリクスは1つだけ"""
+        with Metrics():
+            with self.assertRaises(RuntimeError):
+                Metrics().enable()
+
+    def test_disable_checks_installed(self):
+        """評価器に設定されているのが自分でなければ無効にできない"""
+        metrics = Metrics()
+        metrics.enable()
+        evaluator.METRICS = None
+        with self.assertRaises(RuntimeError):
+            metrics.disable()
+
+    def test_interleaved_with_limits(self):
+        """資源の制限と入れ子にならない順で有効・無効にできる"""
+        metrics, limits = Metrics(), Limits(max_steps=1000)
+        metrics.enable()
+        limits.__enter__()
+        Interpreter().run('(+ 1 (* 2 3))')
+        metrics.disable()
+        limits.__exit__(None, None, None)
+        self.assertEqual(metrics.evaluated_nodes, limits.steps)
+        self.assertIsNone(evaluator.METRICS)
+        self.assertIsNone(evaluator.LIMITS)
+
+    def test_with_limits(self):
+        """資源の制限と同時に使える"""
+        with Metrics() as metrics:
+            with Limits(max_steps=1000) as limits:
+                Interpreter().run('(+ 1 (* 2 3))')
+        self.assertEqual(metrics.evaluated_nodes, limits.steps)
+
+    def test_merge_and_reset(self):
+        """as_dict の結果を足し合わせられる"""
+        metrics = self.measure('(let ((a 1)) (+ a a))')
+        total = Metrics()
+        total.merge(metrics.as_dict())
+        total.merge(metrics.as_dict())
+        self.assertEqual(total.evaluated_nodes, metrics.evaluated_nodes * 2)
+        self.assertEqual(total.lookup_depths[0], metrics.lookup_depths[0] * 2)
+        self.assertEqual(total.builtin_calls['+'], 2)
+        total.reset()
+        self.assertEqual(total.lookups, 0)
+        self.assertEqual(total.builtin_calls, {})
+
+    def test_prometheus(self):
+        """Prometheus のテキスト形式で出力する"""
+        text = self.measure(
+            '(define x 1) (let ((a 1)) (let ((b 2)) (+ a x)))').prometheus()
+        lines = text.splitlines()
+        self.assertIn('# TYPE lispy_evaluated_nodes_total counter', lines)
+        self.assertIn('lispy_builtin_calls_total{name="+"} 1', lines)
+        self.assertIn('lispy_lookup_misses_total{depth="0"} 3', lines)
+        # ヒストグラムのバケットは累積
+        self.assertIn('lispy_lookup_depth_bucket{le="0"} 0', lines)
+        self.assertIn('lispy_lookup_depth_bucket{le="1"} 1', lines)
+        self.assertIn('lispy_lookup_depth_bucket{le="2"} 3', lines)
+        self.assertIn('lispy_lookup_depth_bucket{le="+Inf"} 3', lines)
+        self.assertIn('lispy_lookup_depth_count 3', lines)
+        self.assertIn('lispy_lookup_depth_sum 5', lines)
+        self.assertTrue(text.endswith('\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+from lispy.evaluator import create_global_env, eval_lisp
+from lispy.interpreter import Interpreter
+from lispy.optimizer import fold_constants
+from lispy.parser import parse
+from lispy.tokenizer import tokenize
+
+
+def parse_one(code):
+    return parse(tokenize(code))[0]
+
+
+class TestOptimizer(unittest.TestCase):
+
+    def test_fold_arithmetic(self):
+        """定数同士の演算を畳み込む"""
+        expr, folded = fold_constants(parse_one('(+ 1 (* 2 3))'))
+        self.assertEqual(expr, 7)
+        self.assertEqual(folded, 2)
+
+    def test_fold_string_result(self):
+        """文字列の結果は文字列リテラルになる"""
+        expr, _ = fold_constants(parse_one('(str 3)'))
+        self.assertEqual(expr, ('STRING_LITERAL', '3'))
+
+    def test_fold_fizzbuzz_line(self):
+        """FizzBuzzの1行はprintの呼び出しだけが残る"""
+        source = ('(print (if (= (% 3 15) 0) "FizzBuzz" (if (= (% 3 3) 0) "Fizz" '
+                  '(if (= (% 3 5) 0) "Buzz" (str 3)))))')
+        expr, _ = fold_constants(parse_one(source))
+        self.assertEqual(expr, ['print', ('STRING_LITERAL', 'Fizz')])
+
+    def test_side_effects_are_kept(self):
+        """副作用のある組み込み関数は畳み込まない"""
+        expr, folded = fold_constants(parse_one('(print 1)'))
+        self.assertEqual(expr, ['print', 1])
+        self.assertEqual(folded, 0)
+
+    def test_prune_if(self):
+        """条件が定数のifは分岐を選択する"""
+        expr, _ = fold_constants(parse_one('(if (< 1 2) x y)'))
+        self.assertEqual(expr, 'x')
+
+    def test_inline_let_constants(self):
+        """letの定数束縛を本体に埋め込む"""
+        expr, _ = fold_constants(parse_one('(let ((x 2) (y z)) (* x y))'))
+        self.assertEqual(expr, ['let', [['y', 'z']], ['*', 2, 'y']])
+
+    def test_inner_binding_shadows_inlined_constant(self):
+        """内側の束縛は埋め込んだ定数を隠す"""
+        expr, _ = fold_constants(parse_one('(let ((x 1)) (lambda (x) (+ x 1)))'))
+        self.assertEqual(expr, ['let', [], ['lambda', ['x'], ['+', 'x', 1]]])
+
+    def test_shadowed_operator_is_not_folded(self):
+        """ローカルで再束縛された演算子は畳み込まない"""
+        expr, folded = fold_constants(parse_one('(lambda (+) (+ 1 2))'))
+        self.assertEqual(expr, ['lambda', ['+'], ['+', 1, 2]])
+        self.assertEqual(folded, 0)
+
+    def test_redefined_global_is_not_folded(self):
+        """環境で再定義された組み込み関数は畳み込まない"""
+        env = create_global_env()
+        eval_lisp(['define', '+', ['lambda', ['a', 'b'], 0]], env)
+        expr, folded = fold_constants(['+', 1, 2], env)
+        self.assertEqual(expr, ['+', 1, 2])
+        self.assertEqual(folded, 0)
+
+    def test_runtime_errors_are_preserved(self):
+        """評価時にエラーになる式はそのまま残す"""
+        expr, _ = fold_constants(parse_one('(/ 1 0)'))
+        self.assertEqual(expr, ['/', 1, 0])
+
+    def test_interpreter_optimize(self):
+        """最適化を有効にしても結果は変わらない"""
+        source = '''
+        (define f (lambda (n) (let ((k 3)) (* n (+ k 1)))))
+        (f (- 10 5))
+        (for i 1 3 (if (= (% 15 5) 0) (str i) "no"))
+        '''
+        plain = Interpreter().run(source)
+        optimized = Interpreter(optimize=True)
+        self.assertEqual(optimized.run(source)[1:], plain[1:])
+        self.assertGreater(optimized.folded, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
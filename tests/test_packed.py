@@ -0,0 +1,136 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lispy import cache
+from lispy.interpreter import Interpreter
+from lispy.packed import PackedAST, PackedNode, pack
+from lispy.parser import ParseError, SourceMap, parse, parse_packed
+from lispy.symbols import Symbol
+from lispy.tokenizer import tokenize
+
+SOURCE = '''
+(define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))
+(let ((a 1) (b 25)) (concat "x" (+ a b)))
+()
+(fib 15)
+'''
+
+
+class TestPackedAST(unittest.TestCase):
+
+    def setUp(self):
+        self.ast = parse_packed(tokenize(SOURCE), 'prog.lisp')
+
+    def test_unpack_matches_parse(self):
+        """展開すると parse と同じS式になる"""
+        program = parse(tokenize(SOURCE))
+        self.assertEqual([node.unpack() for node in self.ast], program)
+        self.assertEqual([node.unpack() for node in pack(program)], program)
+
+    def test_node_behaves_like_list(self):
+        """ノードは長さ・添字・スライスで子を参照できる"""
+        let = list(self.ast)[1]
+        self.assertIsInstance(let, PackedNode)
+        self.assertEqual(len(let), 3)
+        self.assertIs(let[0], Symbol('let'))
+        self.assertEqual(let[1], [['a', 1], ['b', 25]])
+        self.assertEqual(let[2][1], ('STRING_LITERAL', 'x'))
+        self.assertEqual(len(let[1:]), 2)
+        self.assertEqual(len(list(self.ast)[2]), 0)
+
+    def test_constants_are_shared(self):
+        """同じ綴りのアトムは定数プールで共有する"""
+        self.assertEqual(self.ast.consts.count(Symbol('fib')), 1)
+
+    def test_positions(self):
+        """ノードは開き括弧の位置を持っている"""
+        fib_call = list(self.ast)[3]
+        self.assertEqual(fib_call.position(), (5, 1))
+        source_map = SourceMap('prog.lisp')
+        self.assertEqual(source_map.location(fib_call), 'prog.lisp:5:1')
+
+    def test_unpack_records_positions(self):
+        """展開時に対応表へ位置を記録できる"""
+        source_map = SourceMap('prog.lisp')
+        let = list(self.ast)[1].unpack(source_map)
+        self.assertEqual(source_map.position(let[1][1]), (3, 13))
+
+    def test_parse_errors(self):
+        """括弧の対応の誤りは位置つきの ParseError"""
+        with self.assertRaises(ParseError) as cm:
+            parse_packed(tokenize('(+ 1\n(- 2'), 'bad.lisp')
+        self.assertIn('場所: bad.lisp:2:1', cm.exception.__notes__)
+        with self.assertRaises(ParseError):
+            parse_packed(tokenize('1)'))
+
+    def test_bytes_roundtrip(self):
+        """バイト列から配列をコピーせずに読み込める"""
+        loaded = PackedAST.from_buffer(b'xy' + self.ast.to_bytes(), 2)
+        self.assertIsInstance(loaded.nodes, memoryview)
+        self.assertEqual([node.unpack() for node in loaded],
+                         [node.unpack() for node in self.ast])
+        self.assertEqual(loaded.filename, 'prog.lisp')
+        self.assertEqual(list(loaded)[3].position(), (5, 1))
+
+
+class TestPackedEvaluation(unittest.TestCase):
+
+    def test_engines_evaluate_packed_nodes(self):
+        """どのエンジンでもパック済みASTをそのまま評価できる"""
+        for engine in ('tree', 'compile', 'vm'):
+            for optimize in (False, True):
+                with self.subTest(engine=engine, optimize=optimize):
+                    interpreter = Interpreter(engine, optimize)
+                    results = [interpreter.eval(expr)
+                               for expr in parse_packed(tokenize(SOURCE))]
+                    self.assertEqual(results[1:], ['x26', [], 610])
+
+    def test_tree_engine_does_not_unpack(self):
+        """ツリー評価器と最適化もリストに展開せずに評価する"""
+        for optimize in (False, True):
+            with self.subTest(optimize=optimize):
+                interpreter = Interpreter('tree', optimize)
+                with mock.patch.object(PackedAST, 'unpack',
+                                       side_effect=AssertionError):
+                    results = [interpreter.eval(expr)
+                               for expr in parse_packed(tokenize(SOURCE))]
+                self.assertEqual(results[1:], ['x26', [], 610])
+
+    def test_tree_error_location_in_function_body(self):
+        """ツリー評価器では関数本体の中のエラーの位置がつく"""
+        source = '(define f (lambda (x)\n  (+ x y)))\n(f 1)'
+        interpreter = Interpreter('tree')
+        with self.assertRaises(NameError) as cm:
+            for expr in parse_packed(tokenize(source), 'prog.lisp'):
+                interpreter.eval(expr)
+        self.assertEqual(cm.exception.__notes__, ['場所: prog.lisp:2:3'])
+
+    def test_error_location(self):
+        """パック済みASTの評価エラーにも位置がつく"""
+        ast = parse_packed(tokenize('(+ 1 2)\n(car 1)'), 'prog.lisp')
+        for engine in ('tree', 'compile', 'vm'):
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(engine)
+                source_map = SourceMap('prog.lisp')
+                with self.assertRaises(Exception) as cm:
+                    for expr in ast:
+                        interpreter.eval(expr, source_map)
+                self.assertIn('場所: prog.lisp:2:1', cm.exception.__notes__)
+
+    def test_cache_roundtrip(self):
+        """キャッシュには配列のまま保存し、mmap で読み込む"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / 'prog.lspc'
+            self.assertTrue(cache.store(path, 'abc', parse_packed(tokenize(SOURCE))))
+            loaded = cache.load(path, 'abc')
+            self.assertIsInstance(loaded, PackedAST)
+            interpreter = Interpreter('vm')
+            self.assertEqual([interpreter.eval(expr) for expr in loaded][-1], 610)
+            self.assertIsNone(cache.load(path, 'def'))
+            del loaded
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+from lispy import builtins, parallel
+from lispy.evaluator import create_global_env, eval_lisp
+from lispy.parser import parse
+from lispy.tokenizer import tokenize
+
+
+def run(code, env=None):
+    env = env or create_global_env()
+    result = None
+    for expr in parse(tokenize(code)):
+        result = eval_lisp(expr, env)
+    return result
+
+
+class TestShip(unittest.TestCase):
+
+    def test_ship_captures_free_variables(self):
+        """自由変数の値だけを捕捉し、組み込み関数は名前で送る"""
+        func = run('(let ((k 3) (unused 4)) (lambda (x) (+ x k)))')
+        spec = parallel.ship(func)
+        self.assertEqual(spec.captured, {'k': 3})
+
+    def test_ship_recursive_procedure(self):
+        """自分自身を参照する関数も送れる"""
+        env = create_global_env()
+        func = run('(define fact (lambda (n) (if (= n 0) 1 (* n (fact (- n 1))))))', env)
+        spec = parallel.ship(func)
+        self.assertIs(spec.captured['fact'], spec)
+        rebuilt = parallel._rebuild(spec, create_global_env(), {})
+        self.assertEqual(rebuilt(5), 120)
+
+    def test_ship_builtin(self):
+        """組み込み関数は名前で送る"""
+        spec = parallel.ship(builtins.BUILTINS['str'])
+        self.assertEqual(spec.name, 'str')
+
+    def test_ship_rejects_unknown_callables(self):
+        """送れない値はエラー"""
+        with self.assertRaises(parallel.NotShippable):
+            parallel.ship(lambda x: x)
+
+
+class TestParallel(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        parallel.disable()
+
+    def test_pmap(self):
+        """pmapはmapと同じ結果を返す"""
+        result = run('(let ((k 10)) (pmap (lambda (x) (* x k)) (range 0 100)))')
+        self.assertEqual(result, [x * 10 for x in range(100)])
+
+    def test_pfilter(self):
+        """pfilterはfilterと同じ結果を返す"""
+        result = run('(pfilter (lambda (x) (= (% x 3) 0)) (range 0 30))')
+        self.assertEqual(result, list(range(0, 30, 3)))
+
+    def test_pmap_falls_back_for_unshippable_functions(self):
+        """送れない関数は逐次実行する"""
+        env = create_global_env()
+        env.define('double', lambda x: x * 2)
+        self.assertEqual(run('(pmap double (list 1 2 3))', env), [2, 4, 6])
+
+    def test_enable_parallel_map(self):
+        """有効にすると組み込みのmapが並列実行になる"""
+        parallel.enable(max_workers=2, threshold=10)
+        try:
+            self.assertIsNotNone(builtins.PARALLEL_MAP)
+            result = run('(map (lambda (x) (+ x 1)) (range 0 50))')
+            self.assertEqual(result, list(range(1, 51)))
+        finally:
+            parallel.disable()
+        self.assertIsNone(builtins.PARALLEL_MAP)
+
+
+if __name__ == '__main__':
+    unittest.main()
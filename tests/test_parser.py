@@ -1,7 +1,7 @@
 import unittest
 
-from lispy.parser import ParseError, parse
-from lispy.tokenizer import Token, TokenKind, tokenize
+from lispy.parser import ParseError, SourceMap, iter_parse, parse
+from lispy.tokenizer import Token, TokenKind, iter_tokens, tokenize
 
 
 class TestParser(unittest.TestCase):
@@ -129,6 +129,59 @@ class TestParser(unittest.TestCase):
         expected = [["+", 1, ["+", 2, ["+", 3, 4]]]]
         self.assertEqual(result, expected)
 
+    def test_parse_very_deep_nesting(self):
+        """
+        テスト: 再帰上限を超える深さの入れ子のパース
+        """
+        depth = 5000
+        code = "(list " * depth + "1" + ")" * depth
+        result = parse(tokenize(code))
+        expr = result[0]
+        for _ in range(depth - 1):
+            expr = expr[1]
+        self.assertEqual(expr, ["list", 1])
+
+    def test_iter_parse_yields_forms_incrementally(self):
+        """
+        テスト: トップレベルの式は閉じ括弧の時点で返される
+        """
+        forms = iter_parse(iter_tokens("(+ 1 2) (* 3 4) ("))
+        self.assertEqual(next(forms), ["+", 1, 2])
+        self.assertEqual(next(forms), ["*", 3, 4])
+        # 閉じていない括弧は入力の終わりでエラー
+        with self.assertRaises(ParseError):
+            next(forms)
+
+
+class TestSourceMap(unittest.TestCase):
+
+    def test_records_list_positions(self):
+        """
+        テスト: 各リストの開き括弧の位置を記録する
+        """
+        source_map = SourceMap('prog.lisp')
+        [expr] = parse(tokenize('(+ 1\n   (* 2 3))'), source_map)
+        self.assertEqual(source_map.location(expr), 'prog.lisp:1:1')
+        self.assertEqual(source_map.position(expr[2]), (2, 4))
+
+    def test_equal_lists_are_distinguished(self):
+        """
+        テスト: 等しい内容のリストでも位置は別に記録される
+        """
+        source_map = SourceMap()
+        first, second = parse(tokenize('(f)\n(f)'), source_map)
+        self.assertEqual(source_map.position(first), (1, 1))
+        self.assertEqual(source_map.position(second), (2, 1))
+        self.assertIsNone(source_map.position(['f']))
+
+    def test_parse_error_location(self):
+        """
+        テスト: パースエラーに位置の注記が付く
+        """
+        with self.assertRaises(ParseError) as cm:
+            parse(tokenize('(+ 1 2)\n  (* 3'), SourceMap('prog.lisp'))
+        self.assertEqual(cm.exception.__notes__, ['場所: prog.lisp:2:3'])
+
 
 if __name__ == '__main__':
     unittest.main()
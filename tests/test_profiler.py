@@ -0,0 +1,76 @@
+import unittest
+
+from lispy import evaluator
+from lispy.interpreter import Interpreter
+from lispy.profiler import Profiler, format_expr
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = Profiler()
+        self.profiler.enable()
+
+    def tearDown(self):
+        self.profiler.disable()
+
+    def test_counts_named_function_calls(self):
+        """defineした関数の呼び出し回数を名前ごとに数える"""
+        Interpreter().run('''
+        (define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))
+        (fib 10)
+        ''')
+        self.assertEqual(self.profiler.functions['fib'].calls, 177)
+
+    def test_anonymous_lambda_label(self):
+        """無名関数はソースと位置で表示する"""
+        Interpreter().run('((lambda (x) (* x 2)) 21)')
+        self.assertIn('(lambda (x) (* x 2)) <string>:1:14', self.profiler.functions)
+
+    def test_records_each_form(self):
+        """トップレベルの式ごとに位置をつけて時間を記録する"""
+        Interpreter().run('(define x 1)\n(+ x 2)', filename='prog.lisp')
+        labels = [label for label, _ in self.profiler.forms]
+        self.assertEqual(labels, ['prog.lisp:1:1 (define x 1)',
+                                  'prog.lisp:2:1 (+ x 2)'])
+
+    def test_form_without_source_map(self):
+        """位置が分からない式は番号で表示する"""
+        Interpreter().eval(['+', 1, 2])
+        self.assertEqual(self.profiler.forms[0][0], '#1 (+ 1 2)')
+
+    def test_results_are_unchanged(self):
+        """プロファイル中も評価結果は変わらない"""
+        source = '(define sq (lambda (x) (* x x))) (sum (map sq (range 5)))'
+        self.assertEqual(Interpreter().run(source)[-1], 30)
+
+    def test_collapsed_stacks(self):
+        """collapsed stack 形式では呼び出し元をセミコロンでつなぐ"""
+        Interpreter().run('''
+        (define inner (lambda (n) (for i 1 2000 (* i n))))
+        (define outer (lambda () (inner 2)))
+        (outer)
+        ''')
+        stacks = {';'.join(stack) for stack in self.profiler.stacks}
+        self.assertIn('<string>:4:9 (outer);outer;inner', stacks)
+
+    def test_report(self):
+        """レポートに関数名と呼び出し回数が含まれる"""
+        Interpreter().run('(define f (lambda () 1)) (f) (f)')
+        report = self.profiler.report()
+        self.assertRegex(report, r'\s2 .* f\n?')
+
+    def test_disable(self):
+        """無効にすると評価器から外れる"""
+        self.profiler.disable()
+        self.assertIsNone(evaluator.PROFILER)
+
+    def test_format_expr_truncates(self):
+        """長いS式は省略して表示する"""
+        text = format_expr(['concat', ('STRING_LITERAL', 'a' * 100)], width=20)
+        self.assertEqual(len(text), 20)
+        self.assertTrue(text.startswith('(concat "aaa'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import json
+import socket
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lispy import server
+
+
+class TestServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls.path = str(Path(cls._tmp.name) / 'lispy.sock')
+        cls.server = server.Server(cls.path, workers=2, timeout=5)
+        cls.server.start()
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.thread.join()
+        cls.server.close()
+        cls._tmp.cleanup()
+
+    def send(self, *requests):
+        """リクエストを送り、id をキーにしたレスポンスを返す"""
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            with sock.makefile('rwb') as stream:
+                for request in requests:
+                    stream.write(json.dumps(request).encode('utf-8') + b'\n')
+                stream.flush()
+                sock.shutdown(socket.SHUT_WR)
+                responses = [json.loads(line) for line in stream]
+        return {response['id']: response for response in responses}
+
+    def test_evaluate_source(self):
+        """ソースを評価して最後の式の値と出力を返す"""
+        response = self.send({'id': 1, 'source': '(define x 20) (print "hi") (+ x 1)'})[1]
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['result'], 21)
+        self.assertEqual(response['output'], 'hi\n')
+
+    def test_program_id(self):
+        """プログラムIDで以前に送ったソースを再評価できる"""
+        first = self.send({'id': 'a', 'source': '(map (lambda (x) (* x x)) (list 1 2 3))'})['a']
+        self.assertEqual(first['result'], [1, 4, 9])
+        again = self.send({'id': 'b', 'program': first['program'], 'engine': 'vm'})['b']
+        self.assertEqual(again['result'], [1, 4, 9])
+        unknown = self.send({'id': 'c', 'program': 'nothing'})['c']
+        self.assertEqual(unknown['type'], 'UnknownProgram')
+
+    def test_requests_are_isolated(self):
+        """リクエストごとに新しいグローバル環境で評価する"""
+        responses = self.send({'id': 1, 'source': '(define y 1)'},
+                              {'id': 2, 'source': 'y'})
+        self.assertFalse(responses[2]['ok'])
+
+    def test_errors(self):
+        """評価エラーと不正なリクエストをレスポンスで返す"""
+        responses = self.send({'id': 1, 'source': '(car 1)'},
+                              {'id': 2, 'source': '(+ 1'},
+                              {'id': 3},
+                              {'id': 4, 'source': '1', 'engine': 'jit'})
+        self.assertIn('場所:', responses[1]['error'])
+        self.assertEqual(responses[2]['type'], 'ParseError')
+        self.assertEqual(responses[3]['type'], 'BadRequest')
+        self.assertEqual(responses[4]['type'], 'BadRequest')
+
+    def test_timeout_replaces_worker(self):
+        """時間切れのリクエストは打ち切り、他のリクエストは処理を続ける"""
+        responses = self.send(
+            {'id': 1, 'source': '(define loop (lambda () (loop))) (loop)',
+             'timeout': 0.2},
+            {'id': 2, 'source': '(+ 1 2)'})
+        self.assertEqual(responses[1]['type'], 'Timeout')
+        self.assertEqual(responses[2]['result'], 3)
+        self.assertEqual(self.send({'id': 3, 'source': '(* 6 7)'})[3]['result'], 42)
+
+    def test_invalid_timeout(self):
+        """有限の正の数でない timeout は評価せずに BadRequest を返す"""
+        for value in (b'Infinity', b'-Infinity', b'NaN', b'0', b'-1',
+                      b'true', b'"1"'):
+            line = b'{"id":1,"source":"(+ 1 2)","timeout":' + value + b'}'
+            response = self.server.handle_line(line)
+            self.assertEqual(response['type'], 'BadRequest', value)
+        response = self.server.handle_line(
+            b'{"id":1,"source":"(+ 1 2)","timeout":1e300}')
+        self.assertEqual(response['result'], 3)
+
+    def test_internal_error_is_reported(self):
+        """リクエストの処理中の予期しない例外もレスポンスで返す"""
+        with mock.patch.object(self.server.pool, 'run',
+                               side_effect=RuntimeError('boom')):
+            response = self.send({'id': 7, 'source': '(+ 1 2)'})[7]
+        self.assertEqual(response['type'], 'InternalError')
+        self.assertIn('boom', response['error'])
+
+    def test_limits(self):
+        """リクエストごとに資源の上限を指定できる"""
+        responses = self.send(
+            {'id': 1, 'source': '(define loop (lambda () (loop))) (loop)',
+             'limits': {'max_steps': 10000}},
+            {'id': 2, 'source': '(range 100)', 'limits': {'max_list_size': 10}},
+            {'id': 3, 'source': '(+ 1 2)', 'limits': {'max_steps': 10}},
+            {'id': 4, 'source': '(+ 1 2)', 'limits': {'max_stack': 10}},
+            {'id': 5, 'source': '(+ 1 2)', 'engine': 'vm',
+             'limits': {'max_steps': 10}})
+        self.assertEqual(responses[1]['type'], 'ResourceExhausted')
+        self.assertIn('steps', responses[1]['error'])
+        self.assertEqual(responses[2]['type'], 'ResourceExhausted')
+        self.assertEqual(responses[3]['result'], 3)
+        self.assertEqual(responses[4]['type'], 'BadRequest')
+        self.assertEqual(responses[5]['type'], 'BadRequest')
+
+    def test_limits_cover_lazy_results(self):
+        """遅延シーケンスの結果の計算にも上限が適用され、出力も返す"""
+        response = self.send(
+            {'id': 1, 'source': '(map (lambda (x) (if (print x) x x)) (range 0 3000))',
+             'limits': {'max_steps': 100}})[1]
+        self.assertEqual(response['type'], 'ResourceExhausted')
+        self.assertTrue(response['output'].startswith('0\n1\n2\n'))
+
+    def test_bad_json(self):
+        """JSON として読めない行にはエラーを返す"""
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            sock.sendall(b'not json\n')
+            sock.shutdown(socket.SHUT_WR)
+            response = json.loads(sock.makefile('rb').readline())
+        self.assertEqual(response['type'], 'BadRequest')
+
+
+class TestToJson(unittest.TestCase):
+
+    def test_to_json(self):
+        """関数などの JSON にできない値は文字列にする"""
+        self.assertEqual(server.to_json([1, 'a', None, [True]]), [1, 'a', None, [True]])
+        self.assertIsInstance(server.to_json(len), str)
+
+    def test_non_finite_floats(self):
+        """JSON で表せない inf や nan は文字列にする"""
+        value = server.to_json([float('inf'), float('-inf'), float('nan'), 1.5])
+        self.assertEqual(value, ['inf', '-inf', 'nan', 1.5])
+        json.dumps(value, allow_nan=False)
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = server.WorkerPool(1)
+        self.addCleanup(self.pool.close)
+
+    def job(self, source):
+        return {'program': source, 'source': source, 'filename': '<test>',
+                'engine': 'tree', 'optimize': False, 'limits': {}}
+
+    def test_workers_are_not_forked(self):
+        """スレッドを使うサーバーからは fork でワーカーを起動しない"""
+        self.assertIn(self.pool._context.get_start_method(),
+                      ('forkserver', 'spawn'))
+
+    def test_failed_replacement_is_retried(self):
+        """置き換えのワーカーを起動できなくても、次のリクエストで起動し直す"""
+        loop = self.job('(define loop (lambda () (loop))) (loop)')
+        with mock.patch.object(server, 'Worker', side_effect=OSError("失敗")):
+            self.assertEqual(self.pool.run(loop, 0.2)['type'], 'Timeout')
+            self.assertEqual(self.pool.run(self.job('1'), 1)['type'],
+                             'WorkerUnavailable')
+        self.assertEqual(self.pool.run(self.job('(+ 1 2)'), 5)['result'], 3)
+        self.assertEqual(len(self.pool._workers), 1)
+
+
+class TestServerMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.server = server.Server(workers=1, metrics=True)
+        self.addCleanup(self.server.close)
+
+    def test_metrics(self):
+        """ワーカーの計測結果を集計して返す"""
+        self.server.handle({'id': 1, 'source': '(+ 1 2)'})
+        self.server.handle({'id': 2, 'source': '(+ (+ 1 2) 3)'})
+        response = self.server.handle({'id': 3, 'metrics': 'dict'})
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['metrics']['builtin_calls'], {'+': 3})
+        text = self.server.handle({'id': 4, 'metrics': 'prometheus'})['metrics']
+        self.assertIn('lispy_builtin_calls_total{name="+"} 3', text.splitlines())
+        self.assertEqual(self.server.handle({'id': 5, 'metrics': 'xml'})['type'],
+                         'BadRequest')
+
+    def test_metrics_disabled(self):
+        """--metrics なしで起動したサーバーはメトリクスを返さない"""
+        plain = server.Server(workers=1)
+        self.addCleanup(plain.close)
+        self.assertEqual(plain.handle({'id': 1, 'metrics': 'dict'})['type'], 'BadRequest')
+        self.assertNotIn('metrics', plain.handle({'id': 2, 'source': '(+ 1 2)'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import pickle
+import unittest
+
+from lispy.parser import parse
+from lispy.symbols import StringLiteral, Symbol, is_string_literal
+from lispy.tokenizer import tokenize
+
+
+class TestSymbol(unittest.TestCase):
+
+    def test_symbols_are_interned(self):
+        """同じ名前のシンボルは同じオブジェクト"""
+        self.assertIs(Symbol('foo'), Symbol(''.join(['f', 'oo'])))
+
+    def test_symbol_equals_str(self):
+        """シンボルは同じ名前の文字列と等しく、同じハッシュ値を持つ"""
+        self.assertEqual(Symbol('foo'), 'foo')
+        self.assertEqual(hash(Symbol('foo')), hash('foo'))
+        self.assertEqual({'foo': 1}[Symbol('foo')], 1)
+
+    def test_symbol_has_no_dict(self):
+        """シンボルは __dict__ を持たない"""
+        self.assertFalse(hasattr(Symbol('foo'), '__dict__'))
+
+    def test_pickle_reinterns(self):
+        """pickle から読み込んだシンボルもインターンされる"""
+        symbol = pickle.loads(pickle.dumps(Symbol('bar')))
+        self.assertIs(symbol, Symbol('bar'))
+
+    def test_parser_returns_interned_symbols(self):
+        """パーサーは同じ名前に同じシンボルを使う"""
+        [expr] = parse(tokenize('(f x (g x))'))
+        self.assertIs(type(expr[1]), Symbol)
+        self.assertIs(expr[1], expr[2][1])
+
+
+class TestStringLiteral(unittest.TestCase):
+
+    def test_equals_tagged_tuple(self):
+        """従来のタプル表現と等しい"""
+        literal = StringLiteral('abc')
+        self.assertEqual(literal, ('STRING_LITERAL', 'abc'))
+        self.assertEqual(literal.value, 'abc')
+
+    def test_is_string_literal(self):
+        """文字列リテラルとタプル表現を判別する"""
+        self.assertTrue(is_string_literal(StringLiteral('a')))
+        self.assertTrue(is_string_literal(('STRING_LITERAL', 'a')))
+        self.assertFalse(is_string_literal('a'))
+
+    def test_pickle(self):
+        """pickle しても型と値が保たれる"""
+        literal = pickle.loads(pickle.dumps(StringLiteral('x')))
+        self.assertIs(type(literal), StringLiteral)
+        self.assertEqual(literal.value, 'x')
+
+    def test_parser_returns_string_literals(self):
+        """パーサーは文字列リテラルを StringLiteral で返す"""
+        [expr] = parse(tokenize('(concat "a" "b")'))
+        self.assertIs(type(expr[1]), StringLiteral)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 
-from lispy.tokenizer import Token, TokenKind, tokenize
+from lispy.tokenizer import (Token, TokenKind, iter_tokens, iter_tokens_chunked,
+                             tokenize)
 
 
 class TestTokenizer(unittest.TestCase):
@@ -159,6 +160,71 @@ class TestTokenizer(unittest.TestCase):
         tokens = tokenize(code)
         self.assertEqual(len(tokens), 0)
 
+    def test_tokenize_unexpected_character(self):
+        """
+        テスト: 未知の文字はエラー
+        """
+        with self.assertRaises(RuntimeError):
+            tokenize("(+ 1 #)")
+
+    def test_iter_tokens_is_lazy(self):
+        """
+        テスト: iter_tokens はトークンを逐次生成する
+        """
+        tokens = iter_tokens("(+ 1 2) #")
+        self.assertEqual(next(tokens), Token(TokenKind.LPAREN, "("))
+        self.assertEqual(next(tokens), Token(TokenKind.OPERATOR, "+"))
+        # 不正な文字に到達するまではエラーにならない
+        with self.assertRaises(RuntimeError):
+            list(tokens)
+
+    def test_token_has_no_instance_dict(self):
+        """
+        テスト: Token は __slots__ を使い、インスタンス辞書を持たない
+        """
+        token = Token(TokenKind.INTEGER, "1")
+        self.assertFalse(hasattr(token, "__dict__"))
+
+    def test_iter_tokens_chunked_matches_tokenize(self):
+        """
+        テスト: どの位置で分割しても一括トークン化と同じ結果になる
+        """
+        code = '(concat "hello world" (str 123)) (define abc 45)'
+        expected = tokenize(code)
+        for size in range(1, len(code) + 1):
+            chunks = [code[i:i + size] for i in range(0, len(code), size)]
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_tokens_chunked(chunks)), expected)
+
+    def test_token_positions(self):
+        """
+        テスト: トークンに1始まりの行と列が記録される
+        """
+        tokens = tokenize('(define x\n  "a\nb" (f  y))')
+        positions = [(t.value, t.line, t.column) for t in tokens]
+        self.assertEqual(positions[2], ('x', 1, 9))
+        self.assertEqual(positions[3], ('"a\nb"', 2, 3))
+        self.assertEqual(positions[4:7], [('(', 3, 4), ('f', 3, 5), ('y', 3, 8)])
+
+    def test_iter_tokens_chunked_positions(self):
+        """
+        テスト: 分割して読み込んでも行と列は一括トークン化と同じ
+        """
+        code = '(a\n "x\ny"\n  (b 12))\n(c)'
+        expected = [(t.line, t.column) for t in tokenize(code)]
+        for size in range(1, len(code) + 1):
+            chunks = [code[i:i + size] for i in range(0, len(code), size)]
+            with self.subTest(size=size):
+                actual = [(t.line, t.column) for t in iter_tokens_chunked(chunks)]
+                self.assertEqual(actual, expected)
+
+    def test_iter_tokens_chunked_unterminated_string(self):
+        """
+        テスト: 最後まで閉じない文字列はエラー
+        """
+        with self.assertRaises(RuntimeError):
+            list(iter_tokens_chunked(['(print "abc', 'def)']))
+
 
 if __name__ == '__main__':
     unittest.main()
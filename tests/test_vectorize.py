@@ -0,0 +1,113 @@
+import unittest
+
+from lispy import vectorize
+from lispy.evaluator import create_global_env, eval_lisp
+from lispy.parser import parse
+from lispy.tokenizer import tokenize
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def run(code, env=None):
+    env = env or create_global_env()
+    result = None
+    for expr in parse(tokenize(code)):
+        result = eval_lisp(expr, env)
+    return result
+
+
+@unittest.skipIf(numpy is None, "NumPy がインストールされていない")
+class TestVectorize(unittest.TestCase):
+
+    def test_array_arithmetic(self):
+        """配列同士の演算は要素ごとに行われる"""
+        result = run('(+ (array (list 1 2 3)) (array (list 10 20 30)))')
+        self.assertEqual(result.tolist(), [11, 22, 33])
+
+    def test_map_math_function(self):
+        """数学関数のmapはufuncとして実行される"""
+        result = run('(map sqrt (arange 0 5))')
+        numpy.testing.assert_allclose(result, numpy.sqrt(numpy.arange(5)))
+
+    def test_map_lifts_lambda(self):
+        """演算子だけからなるlambdaは配列演算に変換される"""
+        env = create_global_env()
+        result = run('(let ((k 3)) (map (lambda (x) (+ (* x k) 1)) (arange 0 4)))', env)
+        self.assertEqual(result.tolist(), [1, 4, 7, 10])
+
+    def test_map_lambda_with_math(self):
+        """lambdaの中の数学関数もufuncになる"""
+        result = run('(map (lambda (x) (* (sin x) (sin x))) (arange 0 3))')
+        numpy.testing.assert_allclose(result, numpy.sin(numpy.arange(3)) ** 2)
+
+    def test_map_falls_back_for_other_lambdas(self):
+        """変換できないlambdaは要素ごとに呼び出す"""
+        result = run('(map (lambda (x) (if (> x 1) 1 0)) (arange 0 4))')
+        self.assertEqual(result.tolist(), [0, 0, 1, 1])
+
+    def test_map_constant_lambda(self):
+        """本体が定数のlambdaも要素数分の配列を返す"""
+        result = run('(map (lambda (x) 7) (arange 0 3))')
+        self.assertEqual(result.tolist(), [7, 7, 7])
+
+    def test_rebound_operator_is_not_lifted(self):
+        """再束縛された演算子を使うlambdaは変換しない"""
+        result = run('''
+            (let ((+ (lambda (a b) (* a b))))
+              (map (lambda (x) (+ x 2)) (arange 1 4)))
+        ''')
+        self.assertEqual(result.tolist(), [2, 4, 6])
+
+    def test_filter_array(self):
+        """filterは真偽値の配列で要素を選択する"""
+        result = run('(filter (lambda (x) (= (% x 2) 0)) (arange 0 10))')
+        self.assertEqual(result.tolist(), [0, 2, 4, 6, 8])
+
+    def test_filter_with_opaque_predicate(self):
+        """変換できない述語でもfilterできる"""
+        result = run('(filter (lambda (x) (and (> x 2) (< x 5))) (arange 0 10))')
+        self.assertEqual(result.tolist(), [3, 4])
+
+    def test_chained_comparison(self):
+        """3引数以上の比較は配列に変換せず要素ごとに評価する"""
+        array = '(map sqrt (array (list 1 4 9 25)))'
+        result = run(f'(filter (lambda (x) (< 1 x 5)) {array})')
+        self.assertEqual(result.tolist(), [2.0, 3.0])
+        result = run(f'(map (lambda (x) (< 1 x 5)) {array})')
+        self.assertEqual(result.tolist(), [False, True, True, False])
+        self.assertEqual(run('(filter (lambda (x) (< 1 x 5)) (list 1 2 3 5))'),
+                         [2, 3])
+
+    def test_float_array_is_lifted(self):
+        """浮動小数点数の配列には変換した関数をまとめて適用する"""
+        env = create_global_env()
+        func = run('(lambda (x) (* x 2))', env)
+        array = numpy.array([0.5, 1.5])
+        self.assertEqual(vectorize.apply_lifted(func, array).tolist(),
+                         [1.0, 3.0])
+        self.assertIsNone(vectorize.apply_lifted(func, numpy.array([1, 2])))
+
+    def test_integer_overflow(self):
+        """整数の配列でも結果はリストに対する map と同じ（桁あふれしない）"""
+        result = run(
+            '(map (lambda (x) (* x x x x x)) (array (list 10000 100000)))')
+        self.assertEqual(result.tolist(), [10000 ** 5, 100000 ** 5])
+
+    def test_divide_by_zero(self):
+        """0 除算は inf にならずエラーになる"""
+        with self.assertRaises(ZeroDivisionError):
+            run('(map (lambda (x) (/ 1 x)) (array (list 1 0 2)))')
+        with self.assertRaises(ZeroDivisionError):
+            run('(map (lambda (x) (/ 1 x)) (map (lambda (x) (- x 1)) '
+                '(map sqrt (arange 0 3))))')
+
+    def test_lists_are_unchanged(self):
+        """通常のリストに対するmapは従来どおりリストを返す"""
+        self.assertEqual(run('(map sqrt (list 4 9))'), [2.0, 3.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
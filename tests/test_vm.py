@@ -0,0 +1,163 @@
+import unittest
+
+from lispy.bytecode import BINARY_OP, CALL, TAIL_CALL, compile_bytecode, disassemble
+from lispy.evaluator import create_global_env, eval_lisp
+from lispy.parser import parse
+from lispy.tokenizer import tokenize
+from lispy.vm import VMClosure, eval_bytecode
+
+
+def parse_one(code):
+    return parse(tokenize(code))[0]
+
+
+def run_all(code, env):
+    result = None
+    for expr in parse(tokenize(code)):
+        result = eval_bytecode(expr, env)
+    return result
+
+
+class TestBytecode(unittest.TestCase):
+
+    def test_instructions_are_flat_int_array(self):
+        """命令列は (オペコード, 引数) を並べた int 配列"""
+        code = compile_bytecode(parse_one('(+ 1 2)'))
+        self.assertEqual(code.code.typecode, 'i')
+        self.assertEqual(len(code.code) % 2, 0)
+
+    def test_constants_are_shared(self):
+        """同じ定数は定数プールで共有される"""
+        code = compile_bytecode(parse_one('(+ 1 1 1)'))
+        self.assertEqual(code.consts.count(1), 1)
+
+    def test_tail_call_in_lambda_body(self):
+        """lambda本体の末尾の呼び出しは TAIL_CALL になる"""
+        code = compile_bytecode(parse_one('(lambda (n) (f (g n)))'))
+        body = code.consts[0]
+        ops = list(body.code[::2])
+        self.assertIn(TAIL_CALL, ops)
+        self.assertIn(CALL, ops)
+
+    def test_builtin_operator_call(self):
+        """組み込み演算子の2引数呼び出しは BINARY_OP になる"""
+        code = compile_bytecode(parse_one('(+ 1 2)'))
+        self.assertIn(BINARY_OP, list(code.code[::2]))
+
+    def test_disassemble(self):
+        """逆アセンブル結果に命令名とネストしたコードが含まれる"""
+        text = disassemble(compile_bytecode(parse_one('(lambda (x) (* x 2))')))
+        self.assertIn('MAKE_CLOSURE', text)
+        self.assertIn('LOAD_LOCAL', text)
+        self.assertIn('Disassembly of <lambda>', text)
+
+    def test_syntax_error(self):
+        """構文エラーはコンパイル時に検出される"""
+        with self.assertRaises(ValueError):
+            compile_bytecode(['let', []])
+
+
+class TestVM(unittest.TestCase):
+
+    def test_eval_number(self):
+        """数値リテラルの評価"""
+        self.assertEqual(eval_bytecode(42), 42)
+
+    def test_eval_nested_expression(self):
+        """入れ子式の評価"""
+        self.assertEqual(eval_bytecode(parse_one('(+ 1 (* 2 3) (- 10 5))')), 12)
+
+    def test_eval_if(self):
+        """if式の評価"""
+        self.assertEqual(eval_bytecode(parse_one('(if (< 1 2) "yes" "no")')), 'yes')
+        self.assertEqual(eval_bytecode(parse_one('(if (> 1 2) "yes" "no")')), 'no')
+
+    def test_eval_let_and_closure(self):
+        """letで束縛した値をlambdaが捕捉する"""
+        code = parse_one('(let ((n 5)) (map (lambda (x) (+ x n)) (range 0 3)))')
+        self.assertEqual(eval_bytecode(code), [5, 6, 7])
+
+    def test_eval_for(self):
+        """for式は最後の本体の値を返す"""
+        code = parse_one('(for i 1 4 (* i i))')
+        self.assertEqual(eval_bytecode(code), 16)
+
+    def test_eval_empty_for(self):
+        """一度も回らないforはNoneを返す"""
+        self.assertIsNone(eval_bytecode(parse_one('(for i 5 1 i)')))
+
+    def test_lambda_is_callable_from_python(self):
+        """VMのクロージャはPythonから呼び出せる"""
+        func = eval_bytecode(parse_one('(lambda (x y) (* x y))'))
+        self.assertIsInstance(func, VMClosure)
+        self.assertEqual(func(6, 7), 42)
+
+    def test_arity_error(self):
+        """引数の数が合わない場合のエラー"""
+        with self.assertRaises(ValueError):
+            eval_bytecode(parse_one('((lambda (x) x) 1 2)'))
+
+    def test_non_callable_error(self):
+        """呼び出し不可能なオブジェクトのエラー"""
+        with self.assertRaises(TypeError):
+            eval_bytecode(parse_one('(1 2)'))
+
+    def test_define_and_recursion(self):
+        """defineした関数の再帰呼び出し"""
+        env = create_global_env()
+        result = run_all('''
+            (define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))
+            (fib 15)
+        ''', env)
+        self.assertEqual(result, 610)
+
+    def test_deep_tail_recursion(self):
+        """末尾呼び出しはコールスタックを消費しない"""
+        env = create_global_env()
+        result = run_all('''
+            (define count (lambda (n acc) (if (= n 0) acc (count (- n 1) (+ acc 1)))))
+            (count 20000 0)
+        ''', env)
+        self.assertEqual(result, 20000)
+
+    def test_local_define(self):
+        """ローカルスコープのdefine"""
+        code = parse_one('((lambda (x) (let ((z 0)) (define y (* x 2)) (+ x y z))) 3)')
+        self.assertEqual(eval_bytecode(code), 9)
+
+    def test_unset_local_define(self):
+        """実行されなかったローカルdefineはツリー評価器と同じく外側を参照する"""
+        source = '''
+            (define h (lambda (c) (let ((z 1)) (if c (define w 2) 0) (define q 3) w)))
+            (define k (lambda (w) (let ((z 1)) (if w (define w 2) 0) w)))
+        '''
+        env = create_global_env()
+        run_all(source, env)
+        with self.assertRaisesRegex(NameError, 'Undefined variable: w'):
+            run_all('(h 0)', env)
+        self.assertEqual(run_all('(list (h 1) (k 0) (k 1))', env), [2, 0, 2])
+        run_all('(define w 5)', env)
+        self.assertEqual(run_all('(h 0)', env), 5)
+
+    def test_redefined_operator(self):
+        """再定義した演算子は BINARY_OP でも呼び出される"""
+        env = create_global_env()
+        self.assertEqual(run_all('(define * (lambda (a b) (+ a b))) (* 3 4)', env), 7)
+
+    def test_matches_tree_evaluator(self):
+        """ツリー評価器と同じ結果を返す"""
+        sources = [
+            '(for i 1 15 (if (= (% i 15) 0) "FizzBuzz" (str i)))',
+            '(let ((sq (lambda (x) (* x x)))) (map sq (range 1 6)))',
+            '(filter (lambda (x) (= (% x 2) 0)) (range 0 10))',
+            '(let ((a 1)) (let ((b 2)) ((lambda (c) (list a b c)) 3)))',
+            '()',
+        ]
+        for source in sources:
+            with self.subTest(source=source):
+                expr = parse_one(source)
+                self.assertEqual(eval_bytecode(expr), eval_lisp(expr))
+
+
+if __name__ == '__main__':
+    unittest.main()